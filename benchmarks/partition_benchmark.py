@@ -0,0 +1,80 @@
+"""Latency of document-filtered Chroma queries, one collection versus one collection per document.
+
+Loads growing synthetic corpora (one cluster of chunks per document) into a
+`VectorStoreService` with each partitioning, then times queries restricted to
+`--selected` documents. With one collection the `$in` filter runs over the
+whole corpus; with partitions only the selected collections are searched, so
+their latency should stay flat as the corpus grows. Every query runs twice:
+"cold" is the first pass, which also pays for Chroma loading the index of a
+partition it has not searched yet, "warm" the second one.
+
+    PYTHONPATH=. python -m benchmarks.partition_benchmark --docs 10 40 160 --chunks 250
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.vector_index_benchmark import make_corpus, percentile
+from src.app import config
+from src.app.service import vector_store_service as vector_store_module
+from src.app.service.document_catalog_service import DocumentCatalogService
+from src.app.service.vector_store_service import VectorStoreService
+
+
+def open_store(workdir: Path, partitioning: str) -> VectorStoreService:
+    config.CHROMA_DB_PATH = workdir / partitioning / "chroma"
+    config.VECTOR_STORE_PARTITIONING = partitioning
+    store = VectorStoreService()
+    store.initialize()
+    return store
+
+
+def run(args):
+    config.VECTOR_INDEX_BACKEND = "chroma"
+    config.LEXICAL_INDEX_ENABLED = False
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'docs':>6}{'chunks':>8}{'layout':>10}{'load s':>8}{'cold p50':>10}{'warm p50':>10}{'warm p95':>10}")
+    for docs in args.docs:
+        workdir = Path(tempfile.mkdtemp(prefix="partition-bench-"))
+        catalog = DocumentCatalogService()
+        catalog.initialize(workdir / "catalog.sqlite3")
+        vector_store_module.document_catalog_service = catalog
+        ids, vectors, doc_ids = make_corpus(docs, args.chunks, args.dim, rng)
+        texts = [str(i) for i in range(len(ids))]
+        metadatas = [{"doc_id": doc_id} for doc_id in doc_ids]
+        queries = [vectors[rng.integers(len(vectors))] + 0.3 * rng.normal(size=args.dim).astype(np.float32)
+                   for _ in range(args.queries)]
+        selections = [list(rng.choice(docs, size=min(args.selected, docs), replace=False)) for _ in queries]
+
+        for partitioning in ("none", "document"):
+            start = time.perf_counter()
+            store = open_store(workdir, partitioning)
+            for offset in range(0, len(ids), 1000):
+                store.add_documents(texts[offset:offset + 1000], vectors[offset:offset + 1000].tolist(),
+                                    metadatas[offset:offset + 1000], ids[offset:offset + 1000])
+            load = time.perf_counter() - start
+
+            cold, warm = [], []
+            for latencies in (cold, warm):
+                for query, selection in zip(queries, selections):
+                    start = time.perf_counter()
+                    store.search(query.tolist(), args.k, [f"doc-{d}" for d in selection])
+                    latencies.append(time.perf_counter() - start)
+            print(f"{docs:>6}{len(ids):>8}{partitioning:>10}{load:>8.1f}{percentile(cold, 50):>10.2f}"
+                  f"{percentile(warm, 50):>10.2f}{percentile(warm, 95):>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, nargs="+", default=[10, 40, 160])
+    parser.add_argument("--chunks", type=int, default=250)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--selected", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,86 @@
+"""Recall@k versus memory of the quantized NumPy index, through `VectorStoreService.query`.
+
+Loads the same synthetic corpus (one cluster of chunks per document) into a
+float32 and an int8 index, then runs unfiltered queries with several
+re-ranking factors. Recall is measured against an exact brute-force search.
+
+Quantization trades disk for RAM. "RAM MB" is what a search keeps hot in
+memory: the rows it scans (the quantized copy when there is one), their norms
+and scales; the float32 rows of a quantized index are only read for the
+re-ranked candidates. "disk MB" counts every matrix file of the index, which
+grows since the float32 rows are kept next to the quantized copy. Only the
+NumPy backend is measured: Chroma stores its vectors unchanged.
+
+    PYTHONPATH=. python -m benchmarks.quantization_benchmark --docs 40 --chunks 500
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.vector_index_benchmark import exact_top_k, make_corpus, percentile
+from src.app import config
+from src.app.service.numpy_vector_index import NumpyVectorIndex
+from src.app.service.vector_store_service import VectorStoreService
+
+
+def scanned_bytes(index: NumpyVectorIndex) -> int:
+    rows = index.size
+    scanned = index.codes if index.codes is not None else index.vectors
+    total = rows * index.dim * scanned.dtype.itemsize + rows * index.norms.dtype.itemsize
+    if index.scales is not None:
+        total += rows * index.scales.dtype.itemsize
+    return total
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    ids, vectors, doc_ids = make_corpus(args.docs, args.chunks, args.dim, rng)
+    texts = [str(i) for i in range(len(ids))]
+    workdir = Path(tempfile.mkdtemp(prefix="quantization-bench-"))
+    queries = [vectors[rng.integers(len(vectors))] + 0.3 * rng.normal(size=args.dim).astype(np.float32)
+               for _ in range(args.queries)]
+    truths = [exact_top_k(vectors, None, query, args.k, []) for query in queries]
+
+    print(f"Corpus: {len(ids)} chunks, {args.docs} documents, dim {args.dim}, k={args.k}\n")
+    print(f"{'index':<9}{'rerank':>7}{'recall':>8}{'RAM MB':>8}{'RAM':>6}{'disk MB':>9}{'disk':>6}{'p50 ms':>8}")
+    baseline = baseline_disk = None
+    for quantization in ("none", "int8"):
+        index = NumpyVectorIndex(workdir / quantization, quantization=quantization)
+        index.open()
+        for offset in range(0, len(ids), 1000):
+            index.add(ids[offset:offset + 1000], vectors[offset:offset + 1000],
+                      texts[offset:offset + 1000], doc_ids[offset:offset + 1000])
+        service = VectorStoreService()
+        service.index = index
+        scanned = scanned_bytes(index)
+        baseline = baseline or scanned
+        disk = sum(path.stat().st_size for path in (workdir / quantization).glob("vectors-*"))
+        baseline_disk = baseline_disk or disk
+
+        for factor in ([1] if quantization == "none" else args.rerank_factors):
+            config.VECTOR_INDEX_RERANK_FACTOR = factor
+            latencies, recalls = [], []
+            for query, truth in zip(queries, truths):
+                start = time.perf_counter()
+                found = service.query(query.tolist(), n_results=args.k)
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(truth & {int(text) for text in found}) / len(truth))
+            print(f"{quantization:<9}{factor:>7}{np.mean(recalls):>8.3f}{scanned / 1e6:>8.1f}"
+                  f"{scanned / baseline - 1:>+6.0%}{disk / 1e6:>9.1f}{disk / baseline_disk - 1:>+6.0%}"
+                  f"{percentile(latencies, 50):>8.2f}")
+        index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,85 @@
+"""Import time and time-to-ready of the application.
+
+Each run starts a fresh interpreter, imports `src.app.app` and then drives the
+lifespan with a test client against empty stores in a temporary directory,
+reporting when liveness (`/health`) and readiness (`/ready`) first answer 200.
+With `--max-import-seconds` the script exits non-zero when the median import
+time exceeds the budget, so it can guard against import-time regressions.
+
+    PYTHONPATH=. python -m benchmarks.startup_benchmark --runs 5 --max-import-seconds 1.5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+RUN_SCRIPT = r"""
+import json, sys, tempfile, time
+from pathlib import Path
+
+start = time.perf_counter()
+from src.app import config
+tmp = Path(tempfile.mkdtemp(prefix="startup-bench-"))
+config.CHROMA_DB_PATH = tmp / "chroma"
+config.VECTOR_INDEX_PATH = tmp / "index"
+config.VECTOR_INDEX_PATH.mkdir()
+config.LEXICAL_INDEX_PATH = tmp / "lexical.sqlite3"
+config.CATALOG_DB_PATH = tmp / "documents.sqlite3"
+config.EMBEDDING_CACHE_PATH = tmp / "embeddings.sqlite3"
+config.JOBS_DB_PATH = tmp / "jobs.sqlite3"
+config.STARTUP_WARM_UP = sys.argv[1] == "1"
+from src.app.app import app
+imported = time.perf_counter()
+heavy = [name for name in ("chromadb", "langchain", "fitz", "numpy", "PIL") if name in sys.modules]
+
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    live = None
+    while True:
+        now = time.perf_counter()
+        if live is None and client.get("/health").status_code == 200:
+            live = now
+        response = client.get("/ready")
+        if response.status_code == 200 or response.json().get("status") == "failed":
+            break
+        time.sleep(0.01)
+    ready = time.perf_counter()
+print(json.dumps({"import": imported - start, "live": live - start, "ready": ready - start,
+                  "status": response.json()["status"], "heavy_modules": heavy}))
+"""
+
+
+def run_once(warm_up: bool) -> dict:
+    env = {**os.environ, "ANONYMIZED_TELEMETRY": "False"}
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    output = subprocess.run(
+        [sys.executable, "-c", RUN_SCRIPT, "1" if warm_up else "0"],
+        cwd=Path(__file__).resolve().parents[1], env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(args):
+    results = [run_once(args.warm_up) for _ in range(args.runs)]
+    print(f"Runs: {args.runs}, warm-up {'on' if args.warm_up else 'off'}, status {results[-1]['status']}")
+    print(f"Heavy modules loaded at import: {results[-1]['heavy_modules'] or 'none'}\n")
+    print(f"{'phase':<10}{'median s':>10}{'max s':>10}")
+    for phase in ("import", "live", "ready"):
+        samples = [result[phase] for result in results]
+        print(f"{phase:<10}{statistics.median(samples):>10.3f}{max(samples):>10.3f}")
+
+    median_import = statistics.median(result["import"] for result in results)
+    if args.max_import_seconds and median_import > args.max_import_seconds:
+        print(f"\nImport time {median_import:.3f}s exceeds the {args.max_import_seconds:.3f}s budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false")
+    parser.add_argument("--max-import-seconds", type=float, default=0.0)
+    run(parser.parse_args())
@@ -0,0 +1,108 @@
+"""Recall/latency comparison of the Chroma and NumPy vector index backends.
+
+Builds a synthetic corpus (one cluster of chunks per document), loads it into
+both backends and runs the same unfiltered and document-filtered queries
+against each. Recall is measured against an exact brute-force search.
+
+    PYTHONPATH=. python -m benchmarks.vector_index_benchmark --docs 40 --chunks 250
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import chromadb
+import numpy as np
+
+from src.app.service.numpy_vector_index import NumpyVectorIndex
+
+
+def make_corpus(docs: int, chunks: int, dim: int, rng: np.random.Generator):
+    centers = rng.normal(size=(docs, dim)).astype(np.float32)
+    vectors = np.repeat(centers, chunks, axis=0) + 0.6 * rng.normal(size=(docs * chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    doc_ids = [f"doc-{d}" for d in range(docs) for _ in range(chunks)]
+    ids = [f"doc-{d}-{c}" for d in range(docs) for c in range(chunks)]
+    return ids, vectors, doc_ids
+
+
+def exact_top_k(vectors, doc_ids, query, k, selected):
+    mask = np.ones(len(vectors), dtype=bool) if not selected else np.isin(doc_ids, selected)
+    rows = np.flatnonzero(mask)
+    distances = ((vectors[rows] - query) ** 2).sum(axis=1)
+    return {int(rows[i]) for i in np.argsort(distances)[:k]}
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    ids, vectors, doc_ids = make_corpus(args.docs, args.chunks, args.dim, rng)
+    texts = [str(i) for i in range(len(ids))]
+    doc_ids_array = np.asarray(doc_ids)
+    workdir = Path(tempfile.mkdtemp(prefix="index-bench-"))
+
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=str(workdir / "chroma"))
+    collection = client.get_or_create_collection(name="benchmark")
+    for offset in range(0, len(ids), 1000):
+        collection.add(
+            ids=ids[offset:offset + 1000],
+            embeddings=vectors[offset:offset + 1000].tolist(),
+            documents=texts[offset:offset + 1000],
+            metadatas=[{"doc_id": doc_id} for doc_id in doc_ids[offset:offset + 1000]],
+        )
+    chroma_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = NumpyVectorIndex(workdir / "index")
+    index.open()
+    for offset in range(0, len(ids), 1000):
+        index.add(ids[offset:offset + 1000], vectors[offset:offset + 1000],
+                  texts[offset:offset + 1000], doc_ids[offset:offset + 1000])
+    numpy_load = time.perf_counter() - start
+
+    def chroma_search(query, selected):
+        params = {"query_embeddings": [query.tolist()], "n_results": args.k}
+        if selected:
+            params["where"] = {"doc_id": {"$in": selected}}
+        return [int(text) for text in collection.query(**params)["documents"][0]]
+
+    def numpy_search(query, selected):
+        return [int(text) for _, text, _ in index.search(query, args.k, selected)]
+
+    scenarios = {"unfiltered": 0, "1 document": 1, "3 documents": 3}
+    print(f"Corpus: {len(ids)} chunks, {args.docs} documents, dim {args.dim}, k={args.k}")
+    print(f"Load time: chroma {chroma_load:.2f}s, numpy {numpy_load:.2f}s\n")
+    print(f"{'scenario':<14}{'backend':<9}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for name, doc_count in scenarios.items():
+        queries = []
+        for _ in range(args.queries):
+            selected = [f"doc-{d}" for d in rng.choice(args.docs, size=doc_count, replace=False)] if doc_count else []
+            anchor = vectors[rng.integers(len(vectors))]
+            queries.append((anchor + 0.3 * rng.normal(size=args.dim).astype(np.float32), selected))
+
+        for backend, search in (("chroma", chroma_search), ("numpy", numpy_search)):
+            latencies, recalls = [], []
+            for query, selected in queries:
+                start = time.perf_counter()
+                found = search(query, selected)
+                latencies.append(time.perf_counter() - start)
+                truth = exact_top_k(vectors, doc_ids_array, query, args.k, selected)
+                recalls.append(len(truth & set(found)) / len(truth))
+            print(f"{name:<14}{backend:<9}{np.mean(recalls):>8.3f}"
+                  f"{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}")
+    index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=40)
+    parser.add_argument("--chunks", type=int, default=250)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
@@ -0,0 +1,239 @@
+"""Query throughput of the application across uvicorn worker counts.
+
+Seeds a synthetic knowledge base in a temporary `DB_DIR`, then for each worker
+count starts `uvicorn --workers N` (one writer and N - 1 read-only workers)
+and drives `/api/solve-qcm` with concurrent clients for a fixed duration. The
+Gemini models are replaced by local stand-ins answering after
+`--model-latency-ms`, so the figures measure the server's own work: image
+preprocessing, retrieval and context assembly. The answer cache is disabled.
+With `--min-speedup` the script exits non-zero when the throughput at the
+largest worker count is not at least that multiple of the single-worker one;
+the speedup is bounded by the number of CPU cores of the machine.
+
+    PYTHONPATH=. python -m benchmarks.worker_scaling_benchmark --workers 1 2 4 --duration 10
+"""
+import argparse
+import hashlib
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+DIM = 64
+QUESTION = "Which transport protocol guarantees in-order delivery of a byte stream?"
+VISION_RESPONSE = '{"question": "%s", "options": ["TCP", "UDP", "ICMP", "ARP"]}' % QUESTION
+
+
+def fake_embedding(text: str) -> list[float]:
+    """Deterministic unit vector derived from the text, standing in for the embedding model."""
+    import numpy as np
+
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=DIM)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def create_app():
+    """Application factory run by every uvicorn worker: the real app with local model stand-ins."""
+    import asyncio
+
+    from langchain_core.embeddings import Embeddings
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+    from src.app import config
+
+    config.ANSWER_CACHE_ENABLED = False
+    config.STARTUP_WARM_UP = False
+
+    from src.app.api.dependencies import get_qcm_vision_service
+    from src.app.app import app
+    from src.app.service.qcm_vision_service import QCMVisionAnalysisService
+
+    latency = float(os.getenv("BENCHMARK_MODEL_LATENCY_MS", "0")) / 1000
+
+    class SlowFakeChatModel(FakeListChatModel):
+        async def ainvoke(self, *args, **kwargs):
+            await asyncio.sleep(latency)
+            return await super().ainvoke(*args, **kwargs)
+
+    class FakeEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return [fake_embedding(text) for text in texts]
+
+        def embed_query(self, text):
+            return fake_embedding(text)
+
+    services = []
+
+    async def fake_service():
+        # Built on the event loop, like the real provider
+        if not services:
+            service = QCMVisionAnalysisService()
+            service.vision_llm = SlowFakeChatModel(responses=[VISION_RESPONSE])
+            service.llm = SlowFakeChatModel(responses=["1. TCP"])
+            service.embeddings_model.embeddings = FakeEmbeddings()
+            services.append(service)
+        return services[0]
+
+    app.dependency_overrides[get_qcm_vision_service] = fake_service
+    return app
+
+
+def seed(docs: int, chunks: int):
+    """Fills the stores of the current DB_DIR with synthetic documents."""
+    from src.app.service.document_catalog_service import document_catalog_service
+    from src.app.service.lexical_index_service import lexical_index_service
+    from src.app.service.vector_store_service import vector_store_service
+
+    document_catalog_service.initialize()
+    lexical_index_service.initialize()
+    vector_store_service.initialize()
+    words = ["protocol", "stream", "packet", "delivery", "ordering", "socket", "congestion", "window", "checksum"]
+    for d in range(docs):
+        doc_id = f"doc-{d}"
+        texts = [
+            f"Section {c} of document {d}: " + " ".join(words[(c + i) % len(words)] for i in range(40))
+            for c in range(chunks)
+        ]
+        ids = [f"{doc_id}-{c}" for c in range(chunks)]
+        document_catalog_service.begin(doc_id, f"{doc_id}.pdf", file_hash=doc_id)
+        vector_store_service.add_documents(
+            texts, [fake_embedding(text) for text in texts],
+            [{"doc_id": doc_id, "source": f"{doc_id}.pdf"} for _ in ids], ids,
+        )
+        document_catalog_service.complete(doc_id, chunks, None, text_hash=doc_id)
+
+
+def make_image() -> bytes:
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (1200, 500), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((30, 30), QUESTION, fill="black")
+    for i, option in enumerate(["TCP", "UDP", "ICMP", "ARP"]):
+        draw.text((50, 100 + 60 * i), f"{chr(65 + i)}. {option}", fill="black")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(server: subprocess.Popen, base_url: str, workers: int, timeout: float = 120.0):
+    """Waits until every worker answers /ready (new connections are spread over the workers by the kernel)."""
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    consecutive = 0
+    with httpx.Client(timeout=10, headers={"Connection": "close"}) as client:
+        while consecutive < 4 * workers:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("The server did not become ready, rerun with --verbose to see its logs.")
+            try:
+                consecutive = consecutive + 1 if client.get(f"{base_url}/ready").status_code == 200 else 0
+            except httpx.HTTPError:
+                consecutive = 0
+            time.sleep(0.05)
+
+
+def measure(workers: int, args, image: bytes) -> dict:
+    import httpx
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "ANONYMIZED_TELEMETRY": "False",
+        "WEB_CONCURRENCY": str(workers),
+        "BENCHMARK_MODEL_LATENCY_MS": str(args.model_latency_ms),
+    }
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.worker_scaling_benchmark:create_app", "--factory",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=Path(__file__).resolve().parents[1], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL if not args.verbose else None,
+    )
+    try:
+        wait_until_ready(server, base_url, workers)
+
+        def client_loop(deadline: float) -> tuple[list[float], int]:
+            latencies, errors = [], 0
+            with httpx.Client(timeout=60) as client:
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    response = client.post(f"{base_url}/api/solve-qcm", files={"file": ("q.png", image, "image/png")})
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors += 1
+            return latencies, errors
+
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            # Warm-up: first requests of every worker load the pipeline modules
+            list(pool.map(client_loop, [time.monotonic() + args.warm_up] * args.concurrency))
+            started = time.monotonic()
+            results = list(pool.map(client_loop, [started + args.duration] * args.concurrency))
+            elapsed = time.monotonic() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    latencies = sorted(latency for result, _ in results for latency in result)
+    return {
+        "workers": workers,
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p95": latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else 0.0,
+        "errors": sum(errors for _, errors in results),
+    }
+
+
+def run(args):
+    db_dir = Path(tempfile.mkdtemp(prefix="worker-bench-"))
+    # Read by src.app.config at import time, here and in the server processes
+    os.environ["DB_DIR"] = str(db_dir)
+    os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+    os.environ.setdefault("ANONYMIZED_TELEMETRY", "False")
+    seed(args.docs, args.chunks)
+    image = make_image()
+    print(f"Corpus: {args.docs} documents x {args.chunks} chunks, {args.concurrency} clients, "
+          f"{args.duration:.0f}s per run, model latency {args.model_latency_ms} ms, {os.cpu_count()} CPU cores\n")
+
+    print(f"{'workers':>8}{'req/s':>10}{'speedup':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+    results = []
+    for workers in args.workers:
+        result = measure(workers, args, image)
+        results.append(result)
+        speedup = result["throughput"] / results[0]["throughput"] if results[0]["throughput"] else 0.0
+        print(f"{workers:>8}{result['throughput']:>10.1f}{speedup:>9.2f}"
+              f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['errors']:>8}")
+
+    speedup = results[-1]["throughput"] / results[0]["throughput"] if results[0]["throughput"] else 0.0
+    if args.min_speedup and speedup < args.min_speedup:
+        print(f"\nSpeedup {speedup:.2f} with {results[-1]['workers']} workers is below {args.min_speedup:.2f}.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warm-up", type=float, default=2.0)
+    parser.add_argument("--model-latency-ms", type=float, default=0.0)
+    parser.add_argument("--min-speedup", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true")
+    run(parser.parse_args())
@@ -0,0 +1,33 @@
+import asyncio
+import importlib
+
+from fastapi import HTTPException, Request, status
+
+_qcm_vision_service = None
+_qcm_vision_service_lock = asyncio.Lock()
+
+
+async def get_qcm_vision_service():
+    """Returns the shared QCM analysis service, building it (and importing LangChain) on first use.
+
+    The import runs in a worker thread so that requests arriving meanwhile are
+    still served. The Gemini clients bind to the running event loop when they
+    are created, so the service itself is built on the loop; concurrent first
+    requests wait on an asyncio lock instead of blocking it.
+    """
+    global _qcm_vision_service
+    if _qcm_vision_service is not None:
+        return _qcm_vision_service
+    async with _qcm_vision_service_lock:
+        if _qcm_vision_service is None:
+            module = await asyncio.to_thread(importlib.import_module, "src.app.service.qcm_vision_service")
+            _qcm_vision_service = module.QCMVisionAnalysisService()
+        return _qcm_vision_service
+
+
+def require_ready(request: Request):
+    """Rejects API calls until the stores opened in the background at startup are available."""
+    if not getattr(request.app.state, "ready", False):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="The service is starting, retry shortly.",
+                            headers={"Retry-After": "1"})
@@ -0,0 +1,51 @@
+import re
+import time
+import uuid
+
+from src.app.logger.logger_configuration import trace_id_var
+from src.app.metrics import REQUEST_SECONDS, REQUESTS_IN_FLIGHT
+
+TRACE_HEADER = "x-request-id"
+# Client supplied ids end up in log lines, so only short plain tokens are accepted
+VALID_TRACE_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class TraceAndMetricsMiddleware:
+    """Assigns each HTTP request a trace id and records its latency and concurrency.
+
+    Written as a plain ASGI middleware so that streamed responses are measured
+    until their last chunk and the trace id stays set while the body is produced.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        supplied = headers.get(TRACE_HEADER.encode(), b"").decode("latin-1")
+        trace_id = supplied if VALID_TRACE_ID.match(supplied) else uuid.uuid4().hex[:16]
+        token = trace_id_var.set(trace_id)
+        status_code = 500
+
+        async def send_with_trace_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(TRACE_HEADER.encode(), trace_id.encode())]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            # The route template keeps the label set bounded (no document ids in labels)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(method=scope["method"], route=route, status=str(status_code)).observe(
+                time.perf_counter() - start)
+            trace_id_var.reset(token)
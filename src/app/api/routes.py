@@ -1,82 +1,357 @@
 import asyncio
 import json
 import os
-from typing import List
+import uuid
+from typing import List, Optional
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, status, Form
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status, Form, Query, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 
+from src.app import config
+from src.app.api.dependencies import get_qcm_vision_service
 from src.app.logger.logger_configuration import logger
-from src.app.service.document_service import process_document_and_embed
-from src.app.service.qcm_vision_service import qcm_vision_analysis_service
+from src.app.service.answer_cache_service import answer_cache_service
+from src.app.service.document_catalog_service import STATUS_READY, document_catalog_service
+from src.app.service.document_service import compute_file_hash
+from src.app.service.embedding_cache_service import embedding_cache_service
+from src.app.service.ingestion_job_service import COMPLETED, FAILED, ingestion_job_service
+from src.app.service.model_call_service import ModelCallError, model_call_service
 from src.app.service.vector_store_service import vector_store_service
-from src.app.utils.file_utils import is_allowed_file, save_temp_file
+from src.app.service.worker_coordination_service import worker_coordination_service
+from src.app.utils.file_utils import is_allowed_file, save_upload_file
 
 api_router = APIRouter()
 
 
-@api_router.post("/process-document", summary="Process and embed a PDF document")
-async def process_document(file: UploadFile = File(...)):
+def model_error_response(error: ModelCallError) -> HTTPException:
+    """Maps a failed model call to 502/503/504, telling clients when to retry if the upstream said so."""
+    headers = {"Retry-After": str(max(1, round(error.retry_after)))} if error.retry_after else None
+    return HTTPException(status_code=error.status_code, detail=str(error), headers=headers)
+
+
+@api_router.post("/process-document", summary="Queue a PDF document for ingestion",
+                 status_code=status.HTTP_202_ACCEPTED)
+async def process_document(response: Response, file: UploadFile = File(...), force: bool = Form(False),
+                           doc_id: Optional[str] = Form(None)):
     """
-    Endpoint to upload a PDF. The text is extracted, split into chunks,
-    and added to the ChromaDB vector database.
+    Endpoint to upload a PDF. The file is stored and queued for background
+    ingestion; poll `/jobs/{job_id}` for progress. A document that is already
+    indexed is returned immediately (200) unless `force` is set. With `doc_id`,
+    the PDF replaces that document and only its changed chunks are re-indexed.
     """
     if not is_allowed_file(file.filename, "pdf"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Context file type not allowed.")
+    if doc_id and await asyncio.to_thread(document_catalog_service.get, doc_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found.")
 
+    file_path = None
     try:
-        temp_path = save_temp_file(file)
-        chunk_count = await process_document_and_embed(temp_path, file.filename)
-        return {"message": f"Document '{file.filename}' processed successfully. {chunk_count} segments added."}
+        upload_id = str(uuid.uuid4())
+        file_path = save_upload_file(file, config.JOBS_UPLOAD_DIR / f"{upload_id}.pdf")
+
+        if not force:
+            file_hash = await asyncio.to_thread(compute_file_hash, file_path)
+            existing = await asyncio.to_thread(vector_store_service.find_document, file_hash=file_hash)
+            # An update is only a no-op when the document already has this exact content
+            if existing and (not doc_id or existing["id"] == doc_id):
+                os.remove(file_path)
+                response.status_code = status.HTTP_200_OK
+                return {
+                    "message": f"Document '{file.filename}' is already indexed ({existing['chunk_count']} segments).",
+                    "doc_id": existing["id"],
+                    "chunk_count": existing["chunk_count"],
+                    "duplicate": True,
+                }
+
+        job = ingestion_job_service.submit(file_path, file.filename, force=force, doc_id=doc_id)
+        return {"message": f"Document '{file.filename}' queued for processing.", "job_id": job["id"], "job": job}
     except Exception as e:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@api_router.get("/jobs", summary="List ingestion jobs")
+async def list_jobs(status_filter: Optional[str] = Query(None, alias="status"),
+                    limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    """Endpoint to list ingestion jobs, most recent first."""
+    return ingestion_job_service.list_jobs(status=status_filter, limit=limit, offset=offset)
+
+
+@api_router.get("/jobs/{job_id}", summary="Get the status and progress of an ingestion job")
+async def get_job(job_id: str):
+    """Endpoint to report pages and chunks processed, throughput and errors of a job."""
+    job = ingestion_job_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return job
+
+
+@api_router.post("/jobs/{job_id}/retry", summary="Retry a failed document update",
+                 status_code=status.HTTP_202_ACCEPTED)
+async def retry_job(job_id: str):
+    """Endpoint to queue a failed job again; only failed updates keep the upload needed to retry them."""
+    if ingestion_job_service.get_job(job_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    job = await asyncio.to_thread(ingestion_job_service.retry, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Only failed updates can be retried.")
+    return job
+
+
 @api_router.post("/solve-qcm", summary="Analyze a QCM screenshot and find the answer")
-async def solve_qcm(context_ids: str = Form("[]"), file: UploadFile = File(...)):
+async def solve_qcm(context_ids: str = Form("[]"), file: UploadFile = File(...),
+                    qcm_vision_analysis_service=Depends(get_qcm_vision_service)):
     if not is_allowed_file(file.filename, "image"):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image file type not allowed.")
 
-    temp_path = None
     try:
         doc_ids: List[str] = json.loads(context_ids)
 
-        temp_path = save_temp_file(file)
+        image_bytes = await file.read()
 
-        result = await asyncio.to_thread(
-            qcm_vision_analysis_service.analyze_qcm_complete,
-            image_path=temp_path,
-            context_doc_ids=doc_ids
+        result = await answer_cache_service.get_or_compute(
+            image_bytes,
+            doc_ids,
+            lambda: qcm_vision_analysis_service.analyze_qcm_complete(image_bytes, doc_ids),
+            is_cacheable=qcm_vision_analysis_service.is_cacheable_result
         )
         return result
 
     except HTTPException as http_exc:
         raise http_exc
+    except ModelCallError as e:
+        logger.error(f"Model call failed: {e}")
+        raise model_error_response(e)
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                            detail=f"An internal error occurred: {e}")
+
+
+@api_router.post("/solve-qcm/stream", summary="Analyze a QCM screenshot, streaming each stage as NDJSON")
+async def solve_qcm_stream(context_ids: str = Form("[]"), file: UploadFile = File(...),
+                           qcm_vision_analysis_service=Depends(get_qcm_vision_service)):
+    """
+    Streaming variant of `/solve-qcm`. Emits one JSON object per line: `question`
+    as soon as vision finishes, then `context`, then `token` events while the
+    answer is generated and a final `done` event with the complete result. A
+    failure ends the stream with an `error` event instead of `done`, after any
+    `token` events already sent.
+    """
+    if not is_allowed_file(file.filename, "image"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Image file type not allowed.")
+
+    try:
+        doc_ids: List[str] = json.loads(context_ids)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid context_ids.")
+    image_bytes = await file.read()
+    cache_key = await answer_cache_service.make_key(image_bytes, doc_ids)
+
+    async def events():
+        cached = answer_cache_service.lookup(cache_key)
+        if cached is not None:
+            yield {"event": "question", "data": {"extracted_question": cached["extracted_question"],
+                                                 "options": cached["options"]}}
+            yield {"event": "context", "data": {"retrieved_context": cached["retrieved_context"]}}
+            yield {"event": "done", "data": cached}
+            return
+
+        try:
+            async for event in qcm_vision_analysis_service.stream_qcm_analysis(image_bytes, doc_ids):
+                if event["event"] == "done":
+                    answer_cache_service.store(cache_key, event["data"],
+                                               qcm_vision_analysis_service.is_cacheable_result)
+                yield event
+        except ModelCallError as e:
+            logger.error(f"Model call failed while streaming: {e}")
+            yield {"event": "error", "data": {"detail": str(e), "status": e.status_code,
+                                              "retry_after": e.retry_after}}
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while streaming: {e}")
+            yield {"event": "error", "data": {"detail": f"An internal error occurred: {e}", "status": 500}}
+
+    async def ndjson():
+        async for event in events():
+            yield json.dumps(event) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@api_router.post("/solve-qcm/batch", summary="Analyze several QCM screenshots, each with one or more questions")
+async def solve_qcm_batch(context_ids: str = Form("[]"), files: List[UploadFile] = File(...),
+                          qcm_vision_analysis_service=Depends(get_qcm_vision_service)):
+    """
+    Solves every question found in the uploaded screenshots. Results are ordered
+    by image then by question and carry `image_index`/`question_index`; images
+    where no question could be read are reported in `errors`.
+    """
+    if len(files) > config.BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {config.BATCH_MAX_IMAGES} images can be sent at once.")
+    for file in files:
+        if not is_allowed_file(file.filename, "image"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Image file type not allowed: {file.filename}")
+
+    try:
+        doc_ids: List[str] = json.loads(context_ids)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid context_ids.")
+
+    try:
+        images = [await file.read() for file in files]
+        return await qcm_vision_analysis_service.analyze_qcm_batch(images, doc_ids)
+    except ModelCallError as e:
+        logger.error(f"Model call failed: {e}")
+        raise model_error_response(e)
     except Exception as e:
         logger.error(f"An unexpected error occurred: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                             detail=f"An internal error occurred: {e}")
-    finally:
-        if temp_path and os.path.exists(temp_path):
-            os.remove(temp_path)
 
 
 @api_router.get("/documents", summary="List all processed documents")
-async def get_documents():
-    """Endpoint to get the list of all unique documents in the knowledge base."""
+async def get_documents(response: Response, limit: Optional[int] = Query(None, ge=1, le=1000),
+                        offset: int = Query(0, ge=0)):
+    """Endpoint to get the list of documents in the knowledge base, optionally paginated."""
     try:
-        documents = vector_store_service.get_all_documents()
+        documents = vector_store_service.get_all_documents(limit=limit, offset=offset)
+        response.headers["X-Total-Count"] = str(document_catalog_service.count())
         return documents
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
 
+@api_router.get("/documents/stats", summary="Knowledge base totals")
+async def get_document_stats():
+    """Endpoint to report the number of documents, chunks, pages and bytes indexed."""
+    return document_catalog_service.stats()
+
+
 @api_router.delete("/documents/{doc_id}", summary="Delete a document and its embeddings")
-async def delete_document(doc_id: str):
+async def delete_document(doc_id: str, response: Response):
     """Endpoint to delete a document and all its associated chunks from the vector store."""
     try:
-        success = vector_store_service.delete_document(doc_id)
+        if vector_store_service.read_only:
+            # Only the writer process deletes: hand the deletion over and wait for it
+            job = ingestion_job_service.submit_delete(doc_id)
+            job = await ingestion_job_service.wait(job["id"], config.DELETE_TIMEOUT_SECONDS)
+            if job["status"] == FAILED:
+                raise RuntimeError(job["error"])
+            if job["status"] != COMPLETED:
+                response.status_code = status.HTTP_202_ACCEPTED
+                return {"message": f"Deletion of document {doc_id} queued.", "job_id": job["id"]}
+            success = job["result"]["deleted"]
+            # Stop answering from the deleted chunks before replying
+            await worker_coordination_service.catch_up(vector_store_service.apply_remote_changes)
+        else:
+            success = vector_store_service.delete_document(doc_id)
         if not success:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found.")
         return {"message": f"Document {doc_id} deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+@api_router.get("/snapshot", summary="Export the knowledge base, or some documents, as a snapshot file")
+async def export_snapshot(doc_ids: Optional[List[str]] = Query(None, alias="doc_id")):
+    """
+    Endpoint to download the chunks, embeddings and catalog rows of ready
+    documents (all of them unless `doc_id` is given, repeatable), to bootstrap
+    another instance through `POST /snapshot` without re-embedding anything.
+    """
+    # Snapshots need NumPy, which the app only loads when it is used
+    from src.app.service.snapshot_service import SnapshotError, snapshot_service
+
+    for doc_id in doc_ids or []:
+        document = await asyncio.to_thread(document_catalog_service.get, doc_id)
+        if document is None or document["status"] != STATUS_READY:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Document {doc_id} not found.")
+
+    path = config.JOBS_UPLOAD_DIR / f"snapshot-{uuid.uuid4()}.zip"
+    try:
+        if vector_store_service.read_only:
+            # Only the writer process reads the Chroma collection: hand the export over and wait for it
+            job = ingestion_job_service.submit_snapshot_export(str(path), doc_ids or [])
+            job = await ingestion_job_service.wait(job["id"], config.SNAPSHOT_EXPORT_TIMEOUT_SECONDS)
+            if job["status"] == FAILED:
+                raise RuntimeError(job["error"])
+            if job["status"] != COMPLETED:
+                raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                                    detail=f"Snapshot export job {job['id']} did not finish in time.")
+        else:
+            await asyncio.to_thread(snapshot_service.export, str(path), doc_ids)
+    except HTTPException:
+        raise
+    except SnapshotError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        if path.exists():
+            os.remove(path)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    return FileResponse(path, media_type="application/zip", filename="knowledge-base.snapshot",
+                        background=BackgroundTask(os.remove, path))
+
+
+@api_router.post("/snapshot", summary="Queue the import of a knowledge base snapshot",
+                 status_code=status.HTTP_202_ACCEPTED)
+async def import_snapshot(file: UploadFile = File(...), replace: bool = Form(False)):
+    """
+    Endpoint to upload a snapshot produced by `GET /snapshot`. Its checksums and
+    embedding model are checked right away (400 when corrupted, 409 when made
+    with another embedding model); the chunks are then bulk-loaded by a
+    background job, to poll on `/jobs/{job_id}`. Documents already present are
+    skipped unless `replace` is set.
+    """
+    from src.app.service.snapshot_service import SnapshotError, snapshot_service
+
+    file_path = None
+    try:
+        file_path = save_upload_file(file, config.JOBS_UPLOAD_DIR / f"snapshot-{uuid.uuid4()}.zip")
+        manifest = await asyncio.to_thread(snapshot_service.read_manifest, file_path)
+        job = ingestion_job_service.submit_snapshot_import(file_path, file.filename, replace=replace)
+    except Exception as e:
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        if isinstance(e, SnapshotError):
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    return {
+        "message": f"Snapshot with {len(manifest['documents'])} documents ({manifest['chunk_count']} chunks) "
+                   f"queued for import.",
+        "job_id": job["id"],
+        "job": job,
+    }
+
+
+@api_router.get("/retrieval/stats", summary="Retrieval path counters")
+async def get_retrieval_stats(qcm_vision_analysis_service=Depends(get_qcm_vision_service)):
+    """Endpoint to report how often context came from the lexical fast path, hybrid or vector search."""
+    return qcm_vision_analysis_service.retrieval_stats()
+
+
+@api_router.get("/models/stats", summary="Circuit breaker state of the model calls")
+async def get_model_stats():
+    """Endpoint to report, per model operation, whether calls are currently let through."""
+    return model_call_service.stats()
+
+
+@api_router.get("/scheduler/stats", summary="Rate limits and queues of the model calls")
+async def get_scheduler_stats():
+    """Endpoint to report, per model, the queued and shed calls and how long calls waited, by priority."""
+    return model_call_service.scheduler.stats()
+
+
+@api_router.get("/embedding-cache/stats", summary="Embedding cache hit/miss counters")
+async def get_embedding_cache_stats():
+    """Endpoint to report how often embeddings were served from the local cache."""
+    return embedding_cache_service.stats()
+
+
+@api_router.get("/answer-cache/stats", summary="Answer cache hit/miss/coalescing counters")
+async def get_answer_cache_stats():
+    """Endpoint to report how often solved screenshots were served from the answer cache."""
+    return answer_cache_service.stats()
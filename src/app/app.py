@@ -1,23 +1,83 @@
 # src/app/app.py
+import asyncio
+import importlib
+import time
+
 import uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, status
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pathlib import Path
 from contextlib import asynccontextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 
+from src.app import config
+from src.app.api.dependencies import get_qcm_vision_service, require_ready
+from src.app.api.middleware import TraceAndMetricsMiddleware
 from src.app.api.routes import api_router
+from src.app.logger.logger_configuration import logger
+from src.app.metrics import INGESTION_QUEUE_DEPTH
+from src.app.service.document_catalog_service import document_catalog_service
+from src.app.service.embedding_cache_service import embedding_cache_service
+from src.app.service.ingestion_job_service import ingestion_job_service
+from src.app.service.lexical_index_service import lexical_index_service
+from src.app.service.pdf_extraction_service import pdf_extraction_service
 from src.app.service.vector_store_service import vector_store_service
+from src.app.service.worker_coordination_service import worker_coordination_service
 
 BASE_DIR = Path(__file__).resolve().parent
 static_dir = BASE_DIR / "static"
 
+
+WARM_UP_MODULES = ("src.app.service.qcm_vision_service", "langchain.text_splitter", "fitz")
+
+
+async def _warm_up():
+    """Pays the one-off costs of the first request: imports, prompts, model clients and tokenizer."""
+    for module in WARM_UP_MODULES:
+        await asyncio.to_thread(importlib.import_module, module)
+    service = await get_qcm_vision_service()
+    await asyncio.to_thread(service.warm_up)
+
+
+async def _start(app: FastAPI):
+    """Opens the vector store and starts the job workers without blocking liveness checks."""
+    started_at = time.perf_counter()
+    try:
+        await asyncio.to_thread(vector_store_service.initialize)
+        if worker_coordination_service.is_writer:
+            await ingestion_job_service.start()
+        else:
+            await worker_coordination_service.start(vector_store_service.apply_remote_changes)
+        if config.STARTUP_WARM_UP:
+            await _warm_up()
+    except Exception as e:
+        logger.error(f"[STARTUP] Initialization failed: {e}")
+        app.state.startup_error = str(e)
+        return
+    app.state.ready = True
+    logger.info(f"[STARTUP] Ready in {time.perf_counter() - started_at:.2f}s.")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Initialisation au démarrage
-    vector_store_service.initialize()
+    # Initialisation au démarrage : les bases SQLite sont ouvertes immédiatement,
+    # Chroma et le préchauffage se font en arrière-plan (voir /ready)
+    app.state.ready = False
+    app.state.startup_error = None
+    worker_coordination_service.initialize()
+    document_catalog_service.initialize()
+    lexical_index_service.initialize()
+    embedding_cache_service.initialize()
+    ingestion_job_service.initialize()
+    startup = asyncio.create_task(_start(app))
     yield
     # Code de nettoyage si nécessaire
+    startup.cancel()
+    await asyncio.gather(startup, return_exceptions=True)
+    await ingestion_job_service.stop()
+    await worker_coordination_service.stop()
+    pdf_extraction_service.shutdown()
 
 app = FastAPI(
     title="QCM Resolver",
@@ -25,11 +85,39 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(TraceAndMetricsMiddleware)
+INGESTION_QUEUE_DEPTH.set_function(ingestion_job_service.queue_depth)
+
 # Mount the 'static' folder
 app.mount("/static", StaticFiles(directory=static_dir), name="static")
 
 # Include API routes
-app.include_router(api_router, prefix="/api")
+app.include_router(api_router, prefix="/api", dependencies=[Depends(require_ready)])
+
+
+@app.get("/health", summary="Liveness probe")
+async def health():
+    """Answers as soon as the process serves HTTP, even while the stores are still opening."""
+    return {"status": "alive"}
+
+
+@app.get("/ready", summary="Readiness probe")
+async def ready():
+    """Answers 200 once the vector store is open and the warm-up is done, 503 before."""
+    if app.state.ready:
+        return {"status": "ready", "role": worker_coordination_service.role}
+    if app.state.startup_error:
+        body = {"status": "failed", "detail": app.state.startup_error}
+    else:
+        body = {"status": "starting"}
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=body)
+
+
+@app.get("/metrics", summary="Prometheus metrics", include_in_schema=False)
+async def metrics():
+    """Exposes stage latency histograms, error/cache/retry counters and in-flight gauges."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 
 @app.get("/", response_class=FileResponse, summary="Serves the main page")
 async def read_root():
@@ -29,18 +29,106 @@ LLM_CHAT_MODEL = LLM_CONFIG.get("chat_model", "gemini-1.5-flash")
 # --- Vector database configuration ---
 VECTOR_STORE_CONFIG = _config.get("vector_store", {})
 VECTOR_STORE_COLLECTION = VECTOR_STORE_CONFIG.get("collection_name", "qcm_documents")
+# "none" keeps every chunk in one collection, "document" gives each document its own collection
+# (named "<collection_name>-<doc_id>"): filtered queries only search the selected documents
+VECTOR_STORE_PARTITIONING = VECTOR_STORE_CONFIG.get("partitioning", "none")
+# Threads querying the selected partitions in parallel
+VECTOR_STORE_QUERY_WORKERS = VECTOR_STORE_CONFIG.get("query_workers", 4)
+# "chroma" queries the collection directly, "numpy" serves queries from an in-process index
+VECTOR_INDEX_BACKEND = VECTOR_STORE_CONFIG.get("index_backend", "chroma")
+VECTOR_INDEX_COMPACTION_RATIO = VECTOR_STORE_CONFIG.get("compaction_ratio", 0.25)
+# "none" or "int8": NumPy index searches scan a compact copy of the vectors, then re-rank
+# `n_results * rerank_factor` candidates with the full-precision ones
+VECTOR_INDEX_QUANTIZATION = VECTOR_STORE_CONFIG.get("quantization", "none")
+VECTOR_INDEX_RERANK_FACTOR = VECTOR_STORE_CONFIG.get("rerank_factor", 4)
+# URL of a Chroma server (e.g. `chroma run --path src/app/db/chroma` locally); empty opens the files in-process
+VECTOR_STORE_SERVER_URL = os.getenv("CHROMA_SERVER_URL") or VECTOR_STORE_CONFIG.get("server_url") or ""
+
+# --- Ingestion configuration ---
+INGESTION_CONFIG = _config.get("ingestion", {})
+INGESTION_BATCH_SIZE = INGESTION_CONFIG.get("batch_size", 64)
+INGESTION_MAX_CONCURRENT_BATCHES = INGESTION_CONFIG.get("max_concurrent_batches", 4)
+
+# --- PDF extraction configuration ---
+EXTRACTION_CONFIG = _config.get("extraction", {})
+EXTRACTION_WORKERS = EXTRACTION_CONFIG.get("workers", 0) or os.cpu_count() or 1
+EXTRACTION_PAGES_PER_SHARD = EXTRACTION_CONFIG.get("pages_per_shard", 16)
+EXTRACTION_SLOW_PAGE_SECONDS = EXTRACTION_CONFIG.get("slow_page_seconds", 1.0)
+
+# --- Ingestion job queue configuration ---
+JOBS_CONFIG = _config.get("jobs", {})
+JOBS_WORKERS = JOBS_CONFIG.get("workers", 2)
+
+# --- Deployment configuration ---
+DEPLOYMENT_CONFIG = _config.get("deployment", {})
+# Several worker processes share the stores: one writer, the others read-only. Implied by WEB_CONCURRENCY > 1,
+# which is also uvicorn's default for --workers
+MULTI_WORKER = DEPLOYMENT_CONFIG.get("multi_worker", False) or int(os.getenv("WEB_CONCURRENCY", "1")) > 1
+CHANGE_POLL_SECONDS = DEPLOYMENT_CONFIG.get("change_poll_seconds", 0.5)
+DELETE_TIMEOUT_SECONDS = DEPLOYMENT_CONFIG.get("delete_timeout_seconds", 30)
+SNAPSHOT_EXPORT_TIMEOUT_SECONDS = DEPLOYMENT_CONFIG.get("snapshot_export_timeout_seconds", 300)
+
+# --- Model call resilience (deadlines, retries, hedging, circuit breaker) ---
+RESILIENCE_CONFIG = _config.get("resilience", {})
+REQUEST_BUDGET_SECONDS = RESILIENCE_CONFIG.get("request_budget_seconds", 45)
+STAGE_BUDGET_SHARES = RESILIENCE_CONFIG.get("stage_shares", {"vision": 0.4, "embedding": 0.1, "answer": 0.5})
+STAGE_TIMEOUTS = RESILIENCE_CONFIG.get("stage_timeouts", {})
+DEFAULT_STAGE_TIMEOUT_SECONDS = RESILIENCE_CONFIG.get("default_stage_timeout_seconds", 30)
+MODEL_MAX_RETRIES = RESILIENCE_CONFIG.get("max_retries", 2)
+RETRY_BACKOFF_BASE_SECONDS = RESILIENCE_CONFIG.get("backoff_base_seconds", 0.5)
+RETRY_BACKOFF_MAX_SECONDS = RESILIENCE_CONFIG.get("backoff_max_seconds", 8)
+HEDGING_ENABLED = RESILIENCE_CONFIG.get("hedging", False)
+HEDGING_QUANTILE = RESILIENCE_CONFIG.get("hedging_quantile", 0.95)
+HEDGING_MIN_SAMPLES = RESILIENCE_CONFIG.get("hedging_min_samples", 20)
+CIRCUIT_FAILURE_THRESHOLD = RESILIENCE_CONFIG.get("circuit_failure_threshold", 5)
+CIRCUIT_RESET_SECONDS = RESILIENCE_CONFIG.get("circuit_reset_seconds", 30)
+
+# --- Startup configuration ---
+STARTUP_CONFIG = _config.get("startup", {})
+STARTUP_WARM_UP = STARTUP_CONFIG.get("warm_up", True)
+
+# --- Answer cache configuration ---
+ANSWER_CACHE_CONFIG = _config.get("answer_cache", {})
+ANSWER_CACHE_ENABLED = ANSWER_CACHE_CONFIG.get("enabled", True)
+ANSWER_CACHE_TTL_SECONDS = ANSWER_CACHE_CONFIG.get("ttl_seconds", 3600)
+ANSWER_CACHE_MAX_ENTRIES = ANSWER_CACHE_CONFIG.get("max_entries", 1000)
+ANSWER_CACHE_PHASH_SIZE = ANSWER_CACHE_CONFIG.get("perceptual_hash_size", 16)
+ANSWER_CACHE_PHASH_MAX_DISTANCE = ANSWER_CACHE_CONFIG.get("perceptual_max_distance", 12)
+ANSWER_CACHE_MAX_TILE_DIFFERENCE = ANSWER_CACHE_CONFIG.get("perceptual_max_tile_difference", 6.0)
+
+# --- Embedding cache configuration ---
+EMBEDDING_CACHE_CONFIG = _config.get("embedding_cache", {})
+EMBEDDING_CACHE_ENABLED = EMBEDDING_CACHE_CONFIG.get("enabled", True)
+EMBEDDING_CACHE_MAX_ENTRIES = EMBEDDING_CACHE_CONFIG.get("max_entries", 200000)
 
 # --- API keys (from .env file) ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # --- Application paths ---
 BASE_DIR = Path(__file__).resolve().parent
-DB_DIR = BASE_DIR / "db"
+DB_DIR = Path(os.getenv("DB_DIR") or BASE_DIR / "db")
 CHROMA_DB_PATH = DB_DIR / "chroma"
+VECTOR_INDEX_PATH = DB_DIR / "index"
+LEXICAL_INDEX_PATH = VECTOR_INDEX_PATH / "lexical.sqlite3"
+CATALOG_DIR = DB_DIR / "catalog"
+CATALOG_DB_PATH = CATALOG_DIR / "documents.sqlite3"
+# Shared by every worker process of a multi-worker deployment
+WRITER_LOCK_PATH = CATALOG_DIR / "writer.lock"
+CHANGES_DB_PATH = CATALOG_DIR / "changes.sqlite3"
+CACHE_DIR = DB_DIR / "cache"
+EMBEDDING_CACHE_PATH = CACHE_DIR / "embeddings.sqlite3"
+JOBS_DIR = DB_DIR / "jobs"
+JOBS_DB_PATH = JOBS_DIR / "jobs.sqlite3"
+JOBS_UPLOAD_DIR = JOBS_DIR / "uploads"
 
 # Ensure required directories exist
 DB_DIR.mkdir(exist_ok=True)
 CHROMA_DB_PATH.mkdir(exist_ok=True)
+CATALOG_DIR.mkdir(exist_ok=True)
+VECTOR_INDEX_PATH.mkdir(exist_ok=True)
+CACHE_DIR.mkdir(exist_ok=True)
+JOBS_DIR.mkdir(exist_ok=True)
+JOBS_UPLOAD_DIR.mkdir(exist_ok=True)
 
 # --- QCM Vision and RAG configuration ---
 QCM_CONFIG = _config.get("qcm_analysis", {})
@@ -50,22 +138,67 @@ VISION_MODEL = QCM_CONFIG.get("vision_model", "gemini-1.5-flash")
 MIN_QUESTION_LENGTH = QCM_CONFIG.get("min_question_length", 10)
 MAX_OPTIONS_TO_EXTRACT = QCM_CONFIG.get("max_options_to_extract", 4)
 
+# Image preprocessing before the vision call
+IMAGE_CONFIG = _config.get("image_preprocessing", {})
+IMAGE_AUTOCROP = IMAGE_CONFIG.get("autocrop", True)
+IMAGE_MAX_DIMENSION = IMAGE_CONFIG.get("max_dimension", 2048)
+IMAGE_MAX_PASSTHROUGH_BYTES = IMAGE_CONFIG.get("max_passthrough_bytes", 1500000)
+IMAGE_LOSSY_QUALITY = IMAGE_CONFIG.get("lossy_quality", 85)
+IMAGE_OUTPUT_FORMATS = IMAGE_CONFIG.get("output_formats", ["PNG", "WEBP", "JPEG"])
+
 # RAG settings
 RAG_CHUNKS_COUNT = QCM_CONFIG.get("rag_chunks_count", 5)
 RAG_SIMILARITY_THRESHOLD = QCM_CONFIG.get("rag_similarity_threshold", 0.0)
 
 # Answer generation
 ANSWER_TEMPERATURE = QCM_CONFIG.get("answer_temperature", 0.0)
-MAX_CONTEXT_CHARS = QCM_CONFIG.get("max_context_chars", 3000)
+MAX_CONTEXT_TOKENS = QCM_CONFIG.get("max_context_tokens", 1200)
+CONTEXT_TOKEN_ENCODING = QCM_CONFIG.get("context_token_encoding", "cl100k_base")
+RAG_MMR_LAMBDA = QCM_CONFIG.get("mmr_lambda", 0.7)
+
+# Lexical (BM25) retrieval, fused with vector results by reciprocal rank
+RETRIEVAL_CONFIG = _config.get("retrieval", {})
+LEXICAL_INDEX_ENABLED = RETRIEVAL_CONFIG.get("lexical_index", True)
+HYBRID_RETRIEVAL = RETRIEVAL_CONFIG.get("hybrid", True)
+RETRIEVAL_CANDIDATES = RETRIEVAL_CONFIG.get("candidates", 20)
+RRF_K = RETRIEVAL_CONFIG.get("rrf_k", 60)
+LEXICAL_FAST_PATH = RETRIEVAL_CONFIG.get("lexical_fast_path", True)
+LEXICAL_FAST_PATH_MIN_COVERAGE = RETRIEVAL_CONFIG.get("fast_path_min_coverage", 0.9)
+LEXICAL_FAST_PATH_MIN_TERMS = RETRIEVAL_CONFIG.get("fast_path_min_terms", 3)
+# Start retrieval as soon as the streamed vision output contains the whole question
+SPECULATIVE_RETRIEVAL = RETRIEVAL_CONFIG.get("speculative", True)
+
+# Batch solving
+BATCH_MAX_IMAGES = QCM_CONFIG.get("batch_max_images", 10)
+BATCH_MAX_QUESTIONS = QCM_CONFIG.get("batch_max_questions", 40)
+BATCH_MAX_CONCURRENCY = QCM_CONFIG.get("batch_max_concurrency", 4)
+
+# --- Model call scheduling (rate limits, priority classes, load shedding) ---
+SCHEDULER_CONFIG = _config.get("scheduler", {})
+# Requests per minute and burst of each model, e.g. {"gemini-2.5-flash": {"requests_per_minute": 1000, "burst": 20}};
+# models not listed use the defaults, and 0 requests per minute means no limit
+SCHEDULER_MODEL_LIMITS = SCHEDULER_CONFIG.get("models") or {}
+SCHEDULER_DEFAULT_RPM = SCHEDULER_CONFIG.get("default_requests_per_minute", 0)
+SCHEDULER_DEFAULT_BURST = SCHEDULER_CONFIG.get("default_burst", 10)
+SCHEDULER_MAX_QUEUED = SCHEDULER_CONFIG.get("max_queued", {"interactive": 32, "background": 256})
+SCHEDULER_INTERACTIVE_RESERVE = SCHEDULER_CONFIG.get("interactive_reserve", 2)
+# Model behind each operation, whose rate limit the operation draws from
+OPERATION_MODELS = {
+    "vision": VISION_MODEL,
+    "answer": LLM_CHAT_MODEL,
+    "embedding": LLM_EMBEDDING_MODEL,
+    "ingestion_embedding": LLM_EMBEDDING_MODEL,
+}
 
 # Logging
 LOGGING_CONFIG = _config.get("logging", {})
-LOG_GEMINI_RESPONSES = LOGGING_CONFIG.get("log_gemini_responses", True)
-LOG_RAG_CHUNKS = LOGGING_CONFIG.get("log_rag_chunks", True)
+LOG_GEMINI_RESPONSES = LOGGING_CONFIG.get("log_gemini_responses", False)
+LOG_RAG_CHUNKS = LOGGING_CONFIG.get("log_rag_chunks", False)
 LOG_TIMINGS = LOGGING_CONFIG.get("log_timings", True)
 
 # Prompts
 PROMPTS_CONFIG = _config.get("prompts", {})
 PROMPT_DIR = BASE_DIR / PROMPTS_CONFIG.get("directory", "prompts")
 VISION_PROMPT_FILE = PROMPTS_CONFIG.get("vision_extraction_file", "vision_extraction_prompt.txt")
+BATCH_VISION_PROMPT_FILE = PROMPTS_CONFIG.get("batch_vision_extraction_file", "batch_vision_extraction_prompt.txt")
 ANSWER_PROMPT_FILE = PROMPTS_CONFIG.get("answer_generation_file", "answer_generation_prompt.txt")
\ No newline at end of file
@@ -1,4 +1,17 @@
 import logging
+from contextvars import ContextVar
+
+# Id of the request (or ingestion job) being served, carried into tasks and worker threads by asyncio
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace id to every record so that one request's lines can be grepped together."""
+
+    def filter(self, record):
+        record.trace_id = trace_id_var.get()
+        return True
+
 
 def configure_logging():
     """Configure logging for the application."""
@@ -23,7 +36,8 @@ def configure_logging():
             return f"{log_color}{message}{self.RESET_COLOR}"
 
     handler = logging.StreamHandler()
-    handler.setFormatter(CustomFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handler.setFormatter(CustomFormatter('%(asctime)s - %(name)s - %(levelname)s - [%(trace_id)s] %(message)s'))
+    handler.addFilter(TraceIdFilter())
     root_logger = logging.getLogger()
     root_logger.handlers = []
     root_logger.addHandler(handler)
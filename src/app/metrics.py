@@ -0,0 +1,62 @@
+# src/app/metrics.py
+"""Prometheus metrics exposed on `/metrics`."""
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+# Gemini calls take from a few hundred milliseconds to tens of seconds, local lookups a few milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "flashanswer_http_request_seconds", "HTTP request latency until the response is complete.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("flashanswer_http_requests_in_flight", "HTTP requests currently being served.")
+
+STAGE_SECONDS = Histogram(
+    "flashanswer_stage_seconds", "Latency of one pipeline stage (vision, embedding, vector_query, answer...).",
+    ["stage"], buckets=LATENCY_BUCKETS,
+)
+ERRORS = Counter("flashanswer_errors_total", "Failures by pipeline stage.", ["stage"])
+RETRIES = Counter("flashanswer_retries_total", "Retried operations.", ["operation"])
+HEDGES = Counter("flashanswer_hedged_requests_total", "Duplicate model requests sent for slow calls.", ["operation"])
+CIRCUIT_OPEN = Gauge("flashanswer_circuit_open", "1 while the circuit breaker of a model operation is open.",
+                     ["operation"])
+SCHEDULER_QUEUE_DEPTH = Gauge("flashanswer_scheduler_queue_depth", "Model calls waiting for a rate limit token.",
+                              ["model", "priority"])
+SCHEDULER_WAIT_SECONDS = Histogram(
+    "flashanswer_scheduler_wait_seconds", "Time model calls waited for a rate limit token.", ["priority"],
+    buckets=LATENCY_BUCKETS,
+)
+SCHEDULER_REJECTED = Counter("flashanswer_scheduler_rejected_total", "Model calls refused because their queue was full "
+                             "or their deadline would pass while queued.", ["priority"])
+CACHE_REQUESTS = Counter("flashanswer_cache_requests_total", "Cache lookups by cache and outcome.", ["cache", "result"])
+RETRIEVAL_PATHS = Counter("flashanswer_retrieval_path_total", "Context retrievals by path.", ["path"])
+SPECULATIVE_RETRIEVALS = Counter(
+    "flashanswer_speculative_retrieval_total",
+    "Retrievals started before the vision extraction finished, by outcome (used or cancelled).", ["result"],
+)
+CHUNKS = Counter("flashanswer_chunks_total", "Chunks written to or removed from the vector store.", ["operation"])
+
+INGESTION_PAGE_SECONDS = Histogram(
+    "flashanswer_ingestion_page_seconds", "Text extraction time of one PDF page.", buckets=LATENCY_BUCKETS,
+)
+INGESTION_BATCH_SECONDS = Histogram(
+    "flashanswer_ingestion_batch_seconds", "Embedding and storage time of one batch of chunks.",
+    buckets=LATENCY_BUCKETS,
+)
+INGESTION_QUEUE_DEPTH = Gauge("flashanswer_ingestion_queue_depth", "Ingestion jobs waiting for a worker.")
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """Records the duration of the enclosed block, and counts it as an error if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.labels(stage=stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
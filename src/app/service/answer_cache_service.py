@@ -0,0 +1,322 @@
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.metrics import CACHE_REQUESTS
+from src.app.service.vector_store_service import vector_store_service
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+THUMBNAIL_WIDTH = 256
+TILE_SIZE = 8
+
+
+def perceptual_fingerprint(image_bytes: bytes, hash_size: int = 16) -> tuple[int, "np.ndarray"]:
+    """Returns a difference hash and a normalized grayscale thumbnail of the image.
+
+    The hash is robust to re-encoding and rescaling but too coarse to tell two
+    questions with the same layout apart, so near matches are confirmed on the
+    thumbnail, where a changed word shows up as a strongly differing tile.
+    """
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(BytesIO(image_bytes)) as image:
+        gray = image.convert("L")
+        pixels = np.asarray(gray.resize((hash_size + 1, hash_size), Image.LANCZOS), dtype=np.int16)
+        height = max(TILE_SIZE, round(gray.height * THUMBNAIL_WIDTH / gray.width / TILE_SIZE) * TILE_SIZE)
+        thumbnail = np.asarray(gray.resize((THUMBNAIL_WIDTH, height), Image.BOX), dtype=np.uint8)
+
+    bits = 0
+    for bit in (pixels[:, :-1] > pixels[:, 1:]).flatten():
+        bits = (bits << 1) | int(bit)
+    return bits, thumbnail
+
+
+def phash_bands(phash: int, bits: int, max_distance: int) -> tuple:
+    """Splits a perceptual hash into max_distance + 1 bands of consecutive bits.
+
+    Two hashes within `max_distance` bits of each other differ in at most
+    max_distance bands, so they share at least one band exactly: indexing keys
+    by band narrows near-match lookups to the few keys sharing one.
+    """
+    width = -(-bits // (max_distance + 1))
+    mask = (1 << width) - 1
+    return tuple((i, (phash >> shift) & mask) for i, shift in enumerate(range(0, bits, width)))
+
+
+def max_tile_difference(a: "np.ndarray", b: "np.ndarray") -> float:
+    """Largest mean absolute pixel difference over TILE_SIZE x TILE_SIZE tiles."""
+    import numpy as np
+
+    diff = np.abs(a.astype(np.float32) - b.astype(np.float32))
+    rows, cols = diff.shape[0] // TILE_SIZE, diff.shape[1] // TILE_SIZE
+    tiles = diff[:rows * TILE_SIZE, :cols * TILE_SIZE].reshape(rows, TILE_SIZE, cols, TILE_SIZE)
+    return float(tiles.mean(axis=(1, 3)).max())
+
+
+@dataclass(eq=False)
+class AnswerCacheKey:
+    exact_hash: str
+    phash: Optional[int]
+    thumbnail: Optional["np.ndarray"]
+    doc_ids: tuple
+    # (doc_id, version) pairs of the referenced documents at request time
+    kb_versions: tuple
+    # Perceptual hash bands, see `phash_bands`
+    bands: tuple = ()
+
+    @property
+    def scope(self) -> tuple:
+        return self.doc_ids, self.kb_versions
+
+    @property
+    def exact(self) -> tuple:
+        return self.exact_hash, self.scope
+
+
+@dataclass
+class _Entry:
+    key: AnswerCacheKey
+    result: dict
+    expires_at: float
+
+
+@dataclass
+class _InFlight:
+    key: AnswerCacheKey
+    future: asyncio.Future
+
+
+class _NearIndex:
+    """Exact keys of cached or in-flight answers, by scope and perceptual hash band."""
+
+    def __init__(self):
+        self.buckets: dict[tuple, set] = defaultdict(set)
+
+    def add(self, key: AnswerCacheKey):
+        for band in key.bands:
+            self.buckets[key.scope, band].add(key.exact)
+
+    def discard(self, key: AnswerCacheKey):
+        for band in key.bands:
+            bucket = self.buckets.get((key.scope, band))
+            if bucket is not None:
+                bucket.discard(key.exact)
+                if not bucket:
+                    del self.buckets[key.scope, band]
+
+    def candidates(self, key: AnswerCacheKey) -> set:
+        """Exact keys sharing at least one band with `key`, in the same scope."""
+        found = set()
+        for band in key.bands:
+            found |= self.buckets.get((key.scope, band), set())
+        found.discard(key.exact)
+        return found
+
+
+class AnswerCacheService:
+    """TTL/LRU cache of complete QCM answers with coalescing of concurrent identical requests.
+
+    A request matches a cached answer when its image is byte-identical or
+    perceptually close, and it targets the same documents at the same
+    knowledge-base versions. Changing a referenced document invalidates its entries.
+    """
+
+    def __init__(self):
+        self.entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self.in_flight: dict[tuple, _InFlight] = {}
+        self.near_entries = _NearIndex()
+        self.near_in_flight = _NearIndex()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        vector_store_service.subscribe(self.invalidate_document)
+
+    async def make_key(self, image_bytes: bytes, context_doc_ids: list[str]) -> AnswerCacheKey:
+        # Decoding and resizing the screenshot takes milliseconds of CPU, kept off the event loop
+        try:
+            phash, thumbnail = await asyncio.to_thread(perceptual_fingerprint, image_bytes, config.ANSWER_CACHE_PHASH_SIZE)
+        except Exception as e:
+            logger.info(f"[ANSWER-CACHE] Perceptual hash unavailable: {e}")
+            phash, thumbnail = None, None
+        bands = ()
+        if phash is not None:
+            bands = phash_bands(phash, config.ANSWER_CACHE_PHASH_SIZE ** 2, config.ANSWER_CACHE_PHASH_MAX_DISTANCE)
+        doc_ids = tuple(sorted(set(context_doc_ids)))
+        return AnswerCacheKey(
+            exact_hash=hashlib.sha256(image_bytes).hexdigest(),
+            phash=phash,
+            thumbnail=thumbnail,
+            doc_ids=doc_ids,
+            kb_versions=vector_store_service.get_versions(list(doc_ids)),
+            bands=bands,
+        )
+
+    async def get_or_compute(self, image_bytes: bytes, context_doc_ids: list[str],
+                             compute: Callable[[], Awaitable[dict]],
+                             is_cacheable: Callable[[dict], bool] = lambda result: True) -> dict:
+        """Returns a cached answer, joins an identical in-flight request, or runs `compute`."""
+        if not config.ANSWER_CACHE_ENABLED:
+            return await compute()
+
+        key = await self.make_key(image_bytes, context_doc_ids)
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                self.hits += 1
+                CACHE_REQUESTS.labels(cache="answer", result="hit").inc()
+                return self._tag(cached, "hit")
+
+            flight = self._find_in_flight(key)
+            if flight is None:
+                flight = _InFlight(key=key, future=asyncio.get_running_loop().create_future())
+                self.in_flight[key.exact] = flight
+                self.near_in_flight.add(key)
+                owner = True
+                self.misses += 1
+                CACHE_REQUESTS.labels(cache="answer", result="miss").inc()
+            else:
+                owner = False
+                self.coalesced += 1
+                CACHE_REQUESTS.labels(cache="answer", result="coalesced").inc()
+
+        if not owner:
+            logger.info("[ANSWER-CACHE] Joining an identical request already in flight.")
+            result = await asyncio.shield(flight.future)
+            return self._tag(result, "coalesced")
+
+        try:
+            result = await compute()
+        except BaseException as e:
+            with self._lock:
+                self._end_flight(key)
+            if isinstance(e, Exception):
+                flight.future.set_exception(e)
+                # Marks the exception as retrieved even when nobody joined the request
+                flight.future.exception()
+            else:
+                flight.future.cancel()
+            raise
+
+        with self._lock:
+            self._end_flight(key)
+        self.store(key, result, is_cacheable)
+        flight.future.set_result(result)
+        return self._tag(result, "miss")
+
+    def lookup(self, key: AnswerCacheKey) -> Optional[dict]:
+        """Returns a tagged cached answer for `key`, without joining in-flight requests."""
+        if not config.ANSWER_CACHE_ENABLED:
+            return None
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is None:
+                self.misses += 1
+                CACHE_REQUESTS.labels(cache="answer", result="miss").inc()
+                return None
+            self.hits += 1
+            CACHE_REQUESTS.labels(cache="answer", result="hit").inc()
+            return self._tag(cached, "hit")
+
+    def store(self, key: AnswerCacheKey, result: dict, is_cacheable: Callable[[dict], bool] = lambda result: True):
+        if not config.ANSWER_CACHE_ENABLED:
+            return
+        with self._lock:
+            # Skip storing answers computed against documents that changed meanwhile
+            if is_cacheable(result) and key.kb_versions == vector_store_service.get_versions(list(key.doc_ids)):
+                self._store(key, result)
+
+    def invalidate_document(self, doc_id: Optional[str]):
+        """Drops every entry that references `doc_id` (or all entries when None)."""
+        with self._lock:
+            stale = [
+                exact for exact, entry in self.entries.items()
+                if doc_id is None or not entry.key.doc_ids or doc_id in entry.key.doc_ids
+            ]
+            for exact in stale:
+                self.near_entries.discard(self.entries.pop(exact).key)
+        if stale:
+            logger.info(f"[ANSWER-CACHE] Invalidated {len(stale)} entries for document {doc_id}.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "entries": len(self.entries),
+                "in_flight": len(self.in_flight),
+                "max_entries": config.ANSWER_CACHE_MAX_ENTRIES,
+            }
+
+    def _lookup(self, key: AnswerCacheKey) -> Optional[dict]:
+        now = time.time()
+        entry = self.entries.get(key.exact)
+        if entry is None and key.phash is not None:
+            entry = next(
+                (candidate for candidate in map(self.entries.get, self.near_entries.candidates(key))
+                 if self._is_near(candidate.key, key)),
+                None,
+            )
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self.entries[entry.key.exact]
+            self.near_entries.discard(entry.key)
+            return None
+        self.entries.move_to_end(entry.key.exact)
+        return entry.result
+
+    def _find_in_flight(self, key: AnswerCacheKey) -> Optional[_InFlight]:
+        flight = self.in_flight.get(key.exact)
+        if flight is None and key.phash is not None:
+            flight = next(
+                (candidate for candidate in map(self.in_flight.get, self.near_in_flight.candidates(key))
+                 if self._is_near(candidate.key, key)),
+                None,
+            )
+        return flight
+
+    def _end_flight(self, key: AnswerCacheKey):
+        if self.in_flight.pop(key.exact, None) is not None:
+            self.near_in_flight.discard(key)
+
+    def _is_near(self, a: AnswerCacheKey, b: AnswerCacheKey) -> bool:
+        if a.phash is None or b.phash is None:
+            return False
+        if bin(a.phash ^ b.phash).count("1") > config.ANSWER_CACHE_PHASH_MAX_DISTANCE:
+            return False
+        if a.thumbnail.shape != b.thumbnail.shape:
+            return False
+        return max_tile_difference(a.thumbnail, b.thumbnail) <= config.ANSWER_CACHE_MAX_TILE_DIFFERENCE
+
+    def _store(self, key: AnswerCacheKey, result: dict):
+        previous = self.entries.get(key.exact)
+        if previous is not None:
+            self.near_entries.discard(previous.key)
+        self.entries[key.exact] = _Entry(key=key, result=result, expires_at=time.time() + config.ANSWER_CACHE_TTL_SECONDS)
+        self.entries.move_to_end(key.exact)
+        self.near_entries.add(key)
+        while len(self.entries) > config.ANSWER_CACHE_MAX_ENTRIES:
+            _, evicted = self.entries.popitem(last=False)
+            self.near_entries.discard(evicted.key)
+
+    def _tag(self, result: dict, status: str) -> dict:
+        tagged = copy.deepcopy(result)
+        tagged["cache_status"] = status
+        return tagged
+
+
+answer_cache_service = AnswerCacheService()
@@ -0,0 +1,288 @@
+"""Bulk import of a directory or an archive of PDFs, without going through the HTTP API.
+
+Every PDF found, recursively in a directory or among the members of a .zip or
+.tar archive, goes through the same pipeline as an upload:
+`process_document_and_embed` extracts, chunks, embeds and writes it through
+`VectorStoreService`. Several documents are ingested side by side, so that one
+document's pages are extracted by the process pool while the chunks of
+another are embedded in batches of `ingestion.batch_size`.
+
+Progress is recorded per file in a small SQLite state file. An interrupted
+import started again skips the files already imported and resumes partly
+ingested ones after their last committed chunk; files that failed are tried
+again. Like the snapshot CLI it opens the stores in-process, so it must not
+run while a server uses the same `DB_DIR`:
+
+    PYTHONPATH=. python -m src.app.service.bulk_import_service path/to/pdfs [--concurrency 4] [--force]
+"""
+import argparse
+import asyncio
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.service.document_service import process_document_and_embed
+
+IMPORTED = "imported"
+DUPLICATE = "duplicate"
+RUNNING = "running"
+FAILED = "failed"
+# Files in these states are not ingested again, unless forced
+FINISHED = (IMPORTED, DUPLICATE)
+
+DEFAULT_STATE_PATH = config.JOBS_DIR / "bulk_import.sqlite3"
+
+
+@dataclass
+class ImportEntry:
+    # Path relative to the imported directory, or archive member name
+    key: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        """File name recorded as the document's source, as for an upload."""
+        return Path(self.key).name
+
+
+class ImportSource:
+    """The PDFs of a directory (recursively) or of a .zip / .tar(.gz) archive."""
+
+    def __init__(self, path: str):
+        self.path = Path(path).resolve()
+        self._archive_lock = threading.Lock()
+        if not self.path.exists():
+            raise ValueError(f"{path} does not exist.")
+        if self.path.is_dir():
+            self.kind = "directory"
+        elif zipfile.is_zipfile(self.path):
+            self.kind = "zip"
+        elif tarfile.is_tarfile(self.path):
+            self.kind = "tar"
+        else:
+            raise ValueError(f"{path} is neither a directory nor a .zip or .tar archive.")
+
+    def entries(self) -> list[ImportEntry]:
+        if self.kind == "directory":
+            return [
+                ImportEntry(file.relative_to(self.path).as_posix(), file.stat().st_size)
+                for file in sorted(self.path.rglob("*"))
+                if file.is_file() and file.suffix.lower() == ".pdf"
+            ]
+        if self.kind == "zip":
+            with zipfile.ZipFile(self.path) as archive:
+                return [
+                    ImportEntry(member.filename, member.file_size) for member in archive.infolist()
+                    if not member.is_dir() and member.filename.lower().endswith(".pdf")
+                ]
+        with tarfile.open(self.path) as archive:
+            return [
+                ImportEntry(member.name, member.size) for member in archive.getmembers()
+                if member.isfile() and member.name.lower().endswith(".pdf")
+            ]
+
+    def materialize(self, entry: ImportEntry) -> tuple[str, Optional[str]]:
+        """Returns a filesystem path to the entry, and the temporary directory to remove afterwards."""
+        if self.kind == "directory":
+            return str(self.path / entry.key), None
+        # PyMuPDF and the extraction workers read files, so archive members are copied out one at a time
+        temp_dir = tempfile.mkdtemp(prefix="bulk-import-")
+        target = Path(temp_dir) / entry.name
+        with self._archive_lock, open(target, "wb") as out:
+            if self.kind == "zip":
+                with zipfile.ZipFile(self.path) as archive, archive.open(entry.key) as member:
+                    shutil.copyfileobj(member, out, 1024 * 1024)
+            else:
+                with tarfile.open(self.path) as archive:
+                    shutil.copyfileobj(archive.extractfile(entry.key), out, 1024 * 1024)
+        return str(target), temp_dir
+
+
+class ImportState:
+    """Per-file progress of bulk imports, kept across runs."""
+
+    def __init__(self, db_path=None):
+        self.connection = sqlite3.connect(str(db_path or DEFAULT_STATE_PATH), check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                status TEXT NOT NULL,
+                doc_id TEXT,
+                chunks_done INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (source, key)
+            )
+            """
+        )
+        self.connection.commit()
+        self._lock = threading.Lock()
+
+    def get(self, source: str, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT * FROM files WHERE source = ? AND key = ?", (source, key)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def update(self, source: str, key: str, status: str, doc_id: Optional[str] = None, chunks_done: int = 0,
+               error: Optional[str] = None):
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (source, key, status, doc_id, chunks_done, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (source, key, status, doc_id, chunks_done, error, time.time()),
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+@dataclass
+class ImportSummary:
+    files: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    # Already imported by a previous run
+    skipped: int = 0
+    failed: dict[str, str] = field(default_factory=dict)
+    pages: int = 0
+    chunks: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+    def report(self) -> str:
+        seconds = max(self.seconds, 1e-9)
+        lines = [
+            f"{self.files} PDF files: {self.imported} imported, {self.duplicates} duplicates, "
+            f"{self.skipped} already imported, {len(self.failed)} failed, in {self.seconds:.1f}s",
+            f"Throughput: {self.imported / seconds * 60:.1f} files/min, {self.pages / seconds:.1f} pages/s, "
+            f"{self.chunks / seconds:.1f} chunks/s, {self.bytes / 1e6 / seconds:.2f} MB/s "
+            f"({self.pages} pages, {self.chunks} chunks, {self.bytes / 1e6:.1f} MB)",
+        ]
+        lines.extend(f"Failed: {key}: {error}" for key, error in self.failed.items())
+        return "\n".join(lines)
+
+
+class BulkImportService:
+    def __init__(self, state: ImportState):
+        self.state = state
+
+    async def run(self, path: str, concurrency: int = 2, force: bool = False) -> ImportSummary:
+        """Ingests every PDF of `path`, at most `concurrency` documents at a time."""
+        source = ImportSource(path)
+        entries = await asyncio.to_thread(source.entries)
+        summary = ImportSummary(files=len(entries))
+        slots = asyncio.Semaphore(concurrency)
+        started_at = time.perf_counter()
+        logger.info(f"[BULK] Importing {len(entries)} PDF files from {source.path} ({concurrency} at a time).")
+
+        async def import_entry(entry: ImportEntry):
+            previous = self.state.get(str(source.path), entry.key)
+            if previous and previous["status"] in FINISHED and not force:
+                summary.skipped += 1
+                return
+            async with slots:
+                await self._import(source, entry, previous, force, summary)
+            done = summary.imported + summary.duplicates + summary.skipped + len(summary.failed)
+            logger.info(f"[BULK] {done}/{summary.files} files done.")
+
+        await asyncio.gather(*(import_entry(entry) for entry in entries))
+        summary.seconds = time.perf_counter() - started_at
+        return summary
+
+    async def _import(self, source: ImportSource, entry: ImportEntry, previous: Optional[dict], force: bool,
+                      summary: ImportSummary):
+        source_key = str(source.path)
+        # A file interrupted after its first committed chunks resumes under the same doc_id
+        doc_id = previous["doc_id"] if previous and previous["status"] not in FINISHED else None
+        resume_from = previous["chunks_done"] if doc_id and not force else 0
+        progress = {"doc_id": doc_id, "chunks_done": resume_from}
+
+        def on_progress(doc_id: str, pages_done: int, chunks_done: int):
+            progress.update(doc_id=doc_id, chunks_done=chunks_done)
+            self.state.update(source_key, entry.key, RUNNING, doc_id, chunks_done)
+
+        temp_dir = None
+        try:
+            pdf_path, temp_dir = await asyncio.to_thread(source.materialize, entry)
+            result = await process_document_and_embed(
+                pdf_path, entry.name, force=force, on_progress=on_progress, doc_id=doc_id,
+                resume_from=resume_from, rollback_on_error=False,
+            )
+        except Exception as e:
+            logger.error(f"[BULK] {entry.key} failed: {e}")
+            self.state.update(source_key, entry.key, FAILED, progress["doc_id"], progress["chunks_done"], error=str(e))
+            summary.failed[entry.key] = str(e)
+            return
+        finally:
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        status = DUPLICATE if result["duplicate"] else IMPORTED
+        self.state.update(source_key, entry.key, status, result["doc_id"], result["chunk_count"])
+        if result["duplicate"]:
+            summary.duplicates += 1
+            return
+        summary.imported += 1
+        summary.pages += result["extraction"]["pages"]
+        summary.chunks += result["chunk_count"] - resume_from
+        summary.bytes += entry.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest every PDF of a directory or archive into the store.")
+    parser.add_argument("path", help="Directory (searched recursively), .zip or .tar archive.")
+    parser.add_argument("--concurrency", type=int, default=max(2, config.EXTRACTION_WORKERS),
+                        help="Documents ingested at the same time.")
+    parser.add_argument("--force", action="store_true", help="Ingest again files that are already imported.")
+    parser.add_argument("--state", default=str(DEFAULT_STATE_PATH), help="Progress file used to resume.")
+    args = parser.parse_args()
+
+    from src.app.service.document_catalog_service import document_catalog_service
+    from src.app.service.embedding_cache_service import embedding_cache_service
+    from src.app.service.lexical_index_service import lexical_index_service
+    from src.app.service.pdf_extraction_service import pdf_extraction_service
+    from src.app.service.vector_store_service import vector_store_service
+    from src.app.service.worker_coordination_service import worker_coordination_service
+
+    worker_coordination_service.initialize()
+    if not worker_coordination_service.is_writer:
+        parser.exit(1, "A server process owns the store; stop it or upload the files through the API.\n")
+    document_catalog_service.initialize()
+    lexical_index_service.initialize()
+    embedding_cache_service.initialize()
+    vector_store_service.initialize()
+    # Small documents are extracted by the pool too, so that documents ingested side by side use every core
+    pdf_extraction_service.inline_max_pages = 0
+
+    state = ImportState(args.state)
+    try:
+        summary = asyncio.run(BulkImportService(state).run(args.path, args.concurrency, args.force))
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    finally:
+        state.close()
+        pdf_extraction_service.shutdown()
+        worker_coordination_service.close()
+    print(summary.report())
+    if summary.failed:
+        parser.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.service.embedding_cache_service import EmbeddingCacheService, embedding_cache_service
+from src.app.service.model_call_service import INTERACTIVE, RequestBudget, model_call_service
+
+T = TypeVar("T")
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model so that already-seen texts never reach the network.
+
+    With an `operation`, the async requests that do reach the network run under
+    that operation's deadline, retries, circuit breaker and rate limit; cache
+    hits are served without going through any of them.
+
+    With a `query_task_type`, every query embedding, single or batched, asks the
+    model for that task type explicitly, so a batched document request returns
+    the same vectors as `embed_query`. Without one, batched queries are embedded
+    one by one, since the model's defaults may differ between the two calls.
+    """
+
+    DOCUMENT_TASK = "retrieval_document"
+    QUERY_TASK = "retrieval_query"
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache: EmbeddingCacheService = None,
+                 operation: Optional[str] = None, priority: str = INTERACTIVE,
+                 query_task_type: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache or embedding_cache_service
+        self.operation = operation
+        self.priority = priority
+        self.query_task_type = query_task_type
+        self._query_kwargs = {"task_type": query_task_type} if query_task_type else {}
+        # Vectors computed for another task type are kept apart in the cache
+        self.query_task = f"{self.QUERY_TASK}:{query_task_type.lower()}" if query_task_type else self.QUERY_TASK
+
+    async def _remote(self, factory: Callable[[], Awaitable[T]], budget: Optional[RequestBudget]) -> T:
+        if self.operation is None:
+            return await factory()
+        return await model_call_service.call(self.operation, factory, budget, priority=self.priority)
+
+    def _split(self, task: str, texts: List[str]):
+        cached = self.cache.get_many(self.model_name, task, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        return cached, missing
+
+    def _merge(self, task: str, texts, cached, missing, computed) -> List[List[float]]:
+        if missing:
+            self.cache.put_many(self.model_name, task, [texts[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                cached[i] = vector
+        if config.LOG_TIMINGS:
+            logger.info(f"[EMBED-CACHE] {len(texts) - len(missing)}/{len(texts)} embeddings served from cache")
+        return cached
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not config.EMBEDDING_CACHE_ENABLED:
+            return self.embeddings.embed_documents(texts)
+        cached, missing = self._split(self.DOCUMENT_TASK, texts)
+        computed = self.embeddings.embed_documents([texts[i] for i in missing]) if missing else []
+        return self._merge(self.DOCUMENT_TASK, texts, cached, missing, computed)
+
+    def embed_query(self, text: str) -> List[float]:
+        if not config.EMBEDDING_CACHE_ENABLED:
+            return self.embeddings.embed_query(text, **self._query_kwargs)
+        cached, missing = self._split(self.query_task, [text])
+        computed = [self.embeddings.embed_query(text, **self._query_kwargs)] if missing else []
+        return self._merge(self.query_task, [text], cached, missing, computed)[0]
+
+    async def aembed_documents(self, texts: List[str], budget: Optional[RequestBudget] = None) -> List[List[float]]:
+        if not config.EMBEDDING_CACHE_ENABLED:
+            return await self._remote(lambda: self.embeddings.aembed_documents(texts), budget)
+        cached, missing = await asyncio.to_thread(self._split, self.DOCUMENT_TASK, texts)
+        missing_texts = [texts[i] for i in missing]
+        computed = await self._remote(lambda: self.embeddings.aembed_documents(missing_texts), budget) \
+            if missing else []
+        return await asyncio.to_thread(self._merge, self.DOCUMENT_TASK, texts, cached, missing, computed)
+
+    async def aembed_query(self, text: str, budget: Optional[RequestBudget] = None) -> List[float]:
+        if not config.EMBEDDING_CACHE_ENABLED:
+            return await self._remote(lambda: self.embeddings.aembed_query(text, **self._query_kwargs), budget)
+        cached, missing = await asyncio.to_thread(self._split, self.query_task, [text])
+        computed = [await self._remote(lambda: self.embeddings.aembed_query(text, **self._query_kwargs), budget)] \
+            if missing else []
+        merged = await asyncio.to_thread(self._merge, self.query_task, [text], cached, missing, computed)
+        return merged[0]
+
+    async def aembed_queries(self, texts: List[str], budget: Optional[RequestBudget] = None) -> List[List[float]]:
+        """Embeds several queries, computing every cache miss in a single batched request."""
+        if not texts:
+            return []
+        if not config.EMBEDDING_CACHE_ENABLED:
+            return await self._remote(lambda: self._embed_queries(texts), budget)
+        cached, missing = await asyncio.to_thread(self._split, self.query_task, texts)
+        missing_texts = [texts[i] for i in missing]
+        computed = await self._remote(lambda: self._embed_queries(missing_texts), budget) if missing else []
+        return await asyncio.to_thread(self._merge, self.query_task, texts, cached, missing, computed)
+
+    async def _embed_queries(self, texts: List[str]) -> List[List[float]]:
+        if self.query_task_type:
+            return await self.embeddings.aembed_documents(texts, task_type=self.query_task_type)
+        return list(await asyncio.gather(*(self.embeddings.aembed_query(text) for text in texts)))
@@ -0,0 +1,218 @@
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+
+STATUS_INGESTING = "ingesting"
+STATUS_READY = "ready"
+
+LOOKUP_COLUMNS = {"file_hash", "text_hash"}
+
+
+class DocumentCatalogService:
+    """One row per document, kept next to the vector store.
+
+    Rows are created when ingestion starts and marked ready once every chunk is
+    stored, so listing documents and deduplication lookups never have to scan
+    chunk metadata. While a ready document is being updated its row stays ready
+    and describes the stored version; the new version's name, file hash and size
+    wait in the `pending_*` columns until `complete` promotes them.
+
+    `high_water` is one past the highest chunk index ever written for the
+    document, raised before the chunks are stored. Deletes remove every chunk id
+    below it, which also covers chunks an update or an interrupted ingestion
+    wrote past the recorded `chunk_count`.
+    """
+
+    # Columns added after the first release, created on older catalogs at startup
+    ADDED_COLUMNS = {"pending_name": "TEXT", "pending_file_hash": "TEXT", "pending_byte_size": "INTEGER",
+                     "high_water": "INTEGER NOT NULL DEFAULT 0"}
+
+    def __init__(self):
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def initialize(self, db_path=None):
+        db_path = db_path or config.CATALOG_DB_PATH
+        with self._lock:
+            self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    doc_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    byte_size INTEGER,
+                    page_count INTEGER,
+                    file_hash TEXT,
+                    text_hash TEXT,
+                    created_at REAL NOT NULL,
+                    completed_at REAL,
+                    pending_name TEXT,
+                    pending_file_hash TEXT,
+                    pending_byte_size INTEGER,
+                    high_water INTEGER NOT NULL DEFAULT 0
+                )
+                """
+            )
+            columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(documents)")}
+            for column, column_type in self.ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.connection.execute(f"ALTER TABLE documents ADD COLUMN {column} {column_type}")
+            if "high_water" not in columns:
+                self.connection.execute("UPDATE documents SET high_water = chunk_count")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_documents_file_hash ON documents (file_hash)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_documents_text_hash ON documents (text_hash)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_documents_listing ON documents (status, created_at)")
+            self.connection.commit()
+        logger.info(f"Document catalog initialized at {db_path}.")
+
+    def _ensure_initialized(self):
+        if self.connection is None:
+            self.initialize()
+
+    def begin(self, doc_id: str, name: str, file_hash: str, byte_size: Optional[int] = None):
+        """Records a document whose ingestion is starting (or resuming).
+
+        For a document that is already ready, this is a new version: the row
+        stays listed as it is and the new version is only recorded as pending.
+        """
+        self._ensure_initialized()
+        with self._lock:
+            self.connection.execute(
+                """
+                INSERT INTO documents (doc_id, name, status, file_hash, byte_size, created_at)
+                VALUES (:doc_id, :name, :ingesting, :file_hash, :byte_size, :now)
+                ON CONFLICT(doc_id) DO UPDATE SET
+                    name = CASE WHEN status = :ready THEN name ELSE excluded.name END,
+                    file_hash = CASE WHEN status = :ready THEN file_hash ELSE excluded.file_hash END,
+                    byte_size = CASE WHEN status = :ready THEN byte_size ELSE excluded.byte_size END,
+                    pending_name = CASE WHEN status = :ready THEN excluded.name END,
+                    pending_file_hash = CASE WHEN status = :ready THEN excluded.file_hash END,
+                    pending_byte_size = CASE WHEN status = :ready THEN excluded.byte_size END
+                """,
+                {"doc_id": doc_id, "name": name, "file_hash": file_hash, "byte_size": byte_size, "now": time.time(),
+                 "ingesting": STATUS_INGESTING, "ready": STATUS_READY},
+            )
+            self.connection.commit()
+
+    def complete(self, doc_id: str, chunk_count: int, page_count: Optional[int], text_hash: str):
+        self._ensure_initialized()
+        with self._lock:
+            self.connection.execute(
+                "UPDATE documents SET status = ?, chunk_count = ?, page_count = ?, text_hash = ?, completed_at = ?, "
+                "name = COALESCE(pending_name, name), file_hash = COALESCE(pending_file_hash, file_hash), "
+                "byte_size = COALESCE(pending_byte_size, byte_size), "
+                "pending_name = NULL, pending_file_hash = NULL, pending_byte_size = NULL, "
+                "high_water = MAX(high_water, ?) "
+                "WHERE doc_id = ?",
+                (STATUS_READY, chunk_count, page_count, text_hash, time.time(), chunk_count, doc_id),
+            )
+            self.connection.commit()
+
+    def raise_high_water(self, marks: dict[str, int]):
+        """Records that chunk indexes below `marks[doc_id]` may be stored for each document."""
+        self._ensure_initialized()
+        with self._lock:
+            self.connection.executemany(
+                "UPDATE documents SET high_water = MAX(high_water, ?) WHERE doc_id = ?",
+                [(mark, doc_id) for doc_id, mark in marks.items()],
+            )
+            self.connection.commit()
+
+    def backfill(self, documents: Iterable[dict]):
+        """Inserts ready documents discovered in an existing store, keeping rows already present."""
+        self._ensure_initialized()
+        now = time.time()
+        rows = [
+            (doc["doc_id"], doc["name"], STATUS_READY, doc["chunk_count"], doc["chunk_count"], doc.get("file_hash"),
+             doc.get("text_hash"), now, now)
+            for doc in documents
+        ]
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO documents "
+                "(doc_id, name, status, chunk_count, high_water, file_hash, text_hash, created_at, completed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.commit()
+        logger.info(f"[CATALOG] Backfilled {len(rows)} documents from the vector store.")
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        self._ensure_initialized()
+        with self._lock:
+            row = self.connection.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find(self, **where) -> Optional[dict]:
+        """Returns the ready document with the given file_hash or text_hash, if any."""
+        self._ensure_initialized()
+        key, value = next(iter(where.items()))
+        if key not in LOOKUP_COLUMNS:
+            raise ValueError(f"Unsupported catalog lookup: {key}")
+        with self._lock:
+            row = self.connection.execute(
+                f"SELECT * FROM documents WHERE {key} = ? AND status = ? LIMIT 1", (value, STATUS_READY)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def remove(self, doc_id: str):
+        self._ensure_initialized()
+        with self._lock:
+            self.connection.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+            self.connection.commit()
+
+    def clear(self):
+        self._ensure_initialized()
+        with self._lock:
+            self.connection.execute("DELETE FROM documents")
+            self.connection.commit()
+
+    def list_documents(self, limit: Optional[int] = None, offset: int = 0) -> list[dict]:
+        """Lists ready documents, oldest first."""
+        self._ensure_initialized()
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT * FROM documents WHERE status = ? ORDER BY created_at, doc_id LIMIT ? OFFSET ?",
+                (STATUS_READY, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        self._ensure_initialized()
+        with self._lock:
+            return self.connection.execute(
+                "SELECT COUNT(*) FROM documents WHERE status = ?", (STATUS_READY,)
+            ).fetchone()[0]
+
+    def is_empty(self) -> bool:
+        self._ensure_initialized()
+        with self._lock:
+            return self.connection.execute("SELECT 1 FROM documents LIMIT 1").fetchone() is None
+
+    def stats(self) -> dict:
+        self._ensure_initialized()
+        with self._lock:
+            row = self.connection.execute(
+                """
+                SELECT
+                    SUM(status = :ready) AS documents,
+                    SUM(status != :ready) AS ingesting,
+                    COALESCE(SUM(CASE WHEN status = :ready THEN chunk_count END), 0) AS chunks,
+                    COALESCE(SUM(CASE WHEN status = :ready THEN byte_size END), 0) AS bytes,
+                    COALESCE(SUM(CASE WHEN status = :ready THEN page_count END), 0) AS pages
+                FROM documents
+                """,
+                {"ready": STATUS_READY},
+            ).fetchone()
+        return {key: row[key] or 0 for key in row.keys()}
+
+
+document_catalog_service = DocumentCatalogService()
@@ -1,35 +1,378 @@
-import fitz  # PyMuPDF
+import asyncio
+import bisect
+import hashlib
+import itertools
+import os
+import time
 import uuid
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from src.app.service.vector_store_service import vector_store_service
+from dataclasses import dataclass
+from functools import cached_property
+from typing import TYPE_CHECKING, Callable, Collection, Iterable, Iterator, Optional
+from src.app.logger.logger_configuration import logger
+from src.app.metrics import INGESTION_BATCH_SECONDS
+from src.app.service.pdf_extraction_service import ExtractionStats, pdf_extraction_service
+from src.app.service.document_catalog_service import document_catalog_service
+from src.app.service.model_call_service import BACKGROUND
+from src.app.service.vector_store_service import chunk_id, vector_store_service
+from src.app.utils.context_utils import chunk_position
 from src.app import config
 
-async def process_document_and_embed(pdf_path: str, original_filename: str) -> int:
-    """Extracts text, splits it, and embeds it into ChromaDB persistently."""
-    # 1. The line `vector_store_service.clear_collection()` has been removed to ensure persistence.
+if TYPE_CHECKING:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
 
-    # 2. Extract text from PDF with PyMuPDF
-    text_content = ""
-    with fitz.open(pdf_path) as doc:
-        for page in doc:
-            text_content += page.get_text()
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+# Text is only re-split once this much has accumulated, which bounds the working buffer
+SPLIT_WINDOW_CHARS = CHUNK_SIZE * 8
 
-    if not text_content.strip():
+
+def compute_file_hash(path: str) -> str:
+    """Fingerprints the raw bytes of an uploaded file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Chunk:
+    text: str
+    # 1-based numbers of the pages the chunk starts and ends on
+    page: int
+    page_end: int
+    # Character offsets in the concatenated text of the document, end excluded
+    start_offset: int
+    end_offset: int
+
+    @cached_property
+    def hash(self) -> str:
+        return chunk_hash(self.text)
+
+    def metadata(self) -> dict:
+        return {"page": self.page, "page_end": self.page_end, "start_offset": self.start_offset,
+                "end_offset": self.end_offset, "chunk_hash": self.hash}
+
+
+def iter_chunks(page_texts: Iterable[str], text_splitter: "RecursiveCharacterTextSplitter") -> Iterator[Chunk]:
+    """Splits a stream of page texts into chunks that may span page boundaries.
+
+    Only the text from the last chunk of each window onwards is carried over to
+    the next one, so the output closely follows splitting the concatenated text
+    while the buffer stays bounded. Each chunk is located in the text to record
+    its pages and offsets.
+    """
+    page_starts: list[int] = []
+    length = 0
+    buffer = ""
+    # Offset of the buffer in the document text
+    buffer_offset = 0
+
+    def locate(chunks: list[str]) -> list[Chunk]:
+        located = []
+        search_from = 0
+        for text in chunks:
+            start = buffer.find(text, search_from)
+            if start < 0:  # Splitters that rewrite whitespace: keep the chunk next to the previous one
+                start = search_from
+            search_from = start + 1
+            start_offset = buffer_offset + start
+            end_offset = start_offset + len(text)
+            located.append(Chunk(
+                text=text,
+                page=bisect.bisect_right(page_starts, start_offset),
+                page_end=bisect.bisect_right(page_starts, max(start_offset, end_offset - 1)),
+                start_offset=start_offset,
+                end_offset=end_offset,
+            ))
+        return located
+
+    for text in page_texts:
+        page_starts.append(length)
+        length += len(text)
+        buffer += text
+        if len(buffer) < SPLIT_WINDOW_CHARS:
+            continue
+        chunks = locate(text_splitter.split_text(buffer))
+        if not chunks:
+            buffer_offset += len(buffer)
+            buffer = ""
+            continue
+        yield from chunks[:-1]
+        carried = chunks[-1].start_offset - buffer_offset
+        buffer = buffer[carried:]
+        buffer_offset += carried
+
+    if buffer.strip():
+        yield from locate(text_splitter.split_text(buffer))
+
+
+def diff_chunks(batch: list[Chunk], start_index: int, previous_hashes: dict[int, str],
+                known_hashes: Collection[str]) -> tuple[list[int], list[int], list[int]]:
+    """Compares a batch of a new document version with the chunk hashes of the previous one.
+
+    Returns the positions in the batch whose text changed, those that did not,
+    and the changed ones whose text is not stored anywhere in the previous
+    version and therefore needs embedding.
+    """
+    changed, unchanged = [], []
+    for i, chunk in enumerate(batch):
+        (unchanged if previous_hashes.get(start_index + i) == chunk.hash else changed).append(i)
+    to_embed = [i for i in changed if batch[i].hash not in known_hashes]
+    return changed, unchanged, to_embed
+
+
+class _TextFingerprint:
+    """Incremental equivalent of hashing the whitespace-normalized document text."""
+
+    def __init__(self):
+        self.digest = hashlib.sha256()
+        self.empty = True
+
+    def update(self, text: str):
+        words = text.split()
+        if not words:
+            return
+        if not self.empty:
+            self.digest.update(b" ")
+        self.digest.update(" ".join(words).encode("utf-8"))
+        self.empty = False
+
+    def hexdigest(self) -> str:
+        return self.digest.hexdigest()
+
+
+def compute_text_hash(pdf_path: str) -> str:
+    """Fingerprints the extracted text of a PDF, page by page, without splitting or keeping it."""
+    fingerprint = _TextFingerprint()
+    for text in pdf_extraction_service.iter_pages(pdf_path):
+        fingerprint.update(text)
+    return fingerprint.hexdigest()
+
+
+def _duplicate_result(existing: dict) -> dict:
+    logger.info(f"[INGEST] Document already indexed as {existing['id']}, skipping ingestion.")
+    return {"doc_id": existing["id"], "chunk_count": existing["chunk_count"], "duplicate": True}
+
+
+async def process_document_and_embed(pdf_path: str, original_filename: str, force: bool = False,
+                                     on_progress: Optional[Callable[[str, int, int], None]] = None,
+                                     doc_id: Optional[str] = None, resume_from: int = 0,
+                                     rollback_on_error: bool = True, update: bool = False) -> dict:
+    """Streams a PDF into ChromaDB page by page, embedding and writing fixed-size batches.
+
+    PDF parsing and store writes run in worker threads and up to
+    `ingestion.max_concurrent_batches` embedding requests are in flight at once,
+    so the event loop stays free for interactive requests.
+
+    Documents already present in the store (same bytes or same extracted text) are
+    not ingested again unless `force` is set, in which case they are re-ingested
+    under their existing doc_id. The text is compared after a text-only extraction
+    pass, before anything is split, embedded or written. `on_progress(doc_id, pages_done, chunks_done)` is
+    called whenever the contiguous prefix of committed chunks grows.
+
+    Passing the `doc_id` of an interrupted ingestion together with `resume_from`
+    (its committed chunk count) skips the chunks that are already stored. With
+    `rollback_on_error=False` committed chunks survive a failure so it can resume.
+
+    With `update`, the PDF is a new version of the existing document `doc_id`:
+    chunks are compared by content hash with the stored ones, and only the
+    positions whose text changed are written. Text already stored anywhere in
+    the previous version keeps its embedding, so only new text is embedded, and
+    chunks past the end of the new version are deleted. An interrupted update
+    is simply run again.
+    """
+    file_hash = await asyncio.to_thread(compute_file_hash, pdf_path)
+    # Previous version of the document being updated: chunk hash by position, embedding by chunk hash
+    previous_hashes: dict[int, str] = {}
+    previous_embeddings: dict[str, list[float]] = {}
+    update_stats = {"unchanged": 0, "reused": 0, "embedded": 0, "removed": 0}
+    if update:
+        resume_from = 0
+        existing = await asyncio.to_thread(vector_store_service.find_document, file_hash=file_hash)
+        if existing and existing["id"] == doc_id and not force:
+            return _duplicate_result(existing)
+        for stored in await asyncio.to_thread(vector_store_service.get_document_chunks, doc_id):
+            stored_hash = stored["metadata"].get("chunk_hash") or chunk_hash(stored["text"])
+            previous_hashes[chunk_position(stored["id"])[1]] = stored_hash
+            previous_embeddings[stored_hash] = stored["embedding"]
+        logger.info(f"[INGEST] Updating document {doc_id} ({len(previous_hashes)} stored chunks).")
+    elif resume_from and doc_id:
+        logger.info(f"[INGEST] Resuming document {doc_id} after {resume_from} committed chunks.")
+    else:
+        # 1. Skip everything if these exact bytes were already ingested
+        resume_from = 0
+        existing = await asyncio.to_thread(vector_store_service.find_document, file_hash=file_hash)
+        if existing and not force:
+            return _duplicate_result(existing)
+
+        # 2. A re-exported PDF may differ byte-wise while carrying the same text: extracting it once more
+        # costs far less than splitting and embedding it, and nothing of it is ever published
+        if not force:
+            text_hash = await asyncio.to_thread(compute_text_hash, pdf_path)
+            duplicate = await asyncio.to_thread(vector_store_service.find_document, text_hash=text_hash)
+            if duplicate:
+                return _duplicate_result(duplicate)
+
+        if existing:
+            doc_id = existing["id"]
+            await asyncio.to_thread(vector_store_service.delete_document, doc_id)
+            logger.info(f"[INGEST] Forced re-ingest of document {doc_id}.")
+        elif doc_id:
+            # Leftovers of an attempt that failed before its first commit
+            await asyncio.to_thread(vector_store_service.delete_document, doc_id)
+        else:
+            doc_id = str(uuid.uuid4())  # A unique ID for the entire document
+
+    byte_size = await asyncio.to_thread(os.path.getsize, pdf_path)
+    await asyncio.to_thread(document_catalog_service.begin, doc_id, original_filename, file_hash, byte_size)
+
+    # LangChain is only needed once a document is actually ingested; importing it lazily keeps startup fast
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from src.app.service.cached_embeddings import CachedEmbeddings
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    # Ingestion yields the embedding model's rate limit to interactive solves
+    embeddings_model = CachedEmbeddings(
+        GoogleGenerativeAIEmbeddings(model=config.LLM_EMBEDDING_MODEL, google_api_key=config.GEMINI_API_KEY),
+        config.LLM_EMBEDDING_MODEL,
+        operation="ingestion_embedding",
+        priority=BACKGROUND,
+    )
+    fingerprint = _TextFingerprint()
+    extraction_stats = ExtractionStats()
+    pages_done = 0
+
+    def pages() -> Iterator[str]:
+        nonlocal pages_done
+        for text in pdf_extraction_service.iter_pages(pdf_path, extraction_stats):
+            fingerprint.update(text)
+            pages_done += 1
+            yield text
+
+    # Chunking is deterministic, so already committed chunks are simply skipped
+    chunks = itertools.islice(iter_chunks(pages(), text_splitter), resume_from, None)
+
+    def next_batch() -> list[Chunk]:
+        # Runs in a worker thread: this is where PyMuPDF and the splitter do their CPU work
+        return list(itertools.islice(chunks, config.INGESTION_BATCH_SIZE))
+
+    in_flight = asyncio.Semaphore(config.INGESTION_MAX_CONCURRENT_BATCHES)
+    finished_batches: dict[int, int] = {}
+    committed = resume_from
+
+    async def embed(texts: list[str]) -> list[list[float]]:
+        return await embeddings_model.aembed_documents(texts)
+
+    async def update_batch(batch: list[Chunk], ids: list[str], metadatas: list[dict], start_index: int):
+        changed, unchanged, to_embed = diff_chunks(batch, start_index, previous_hashes, previous_embeddings.keys())
+        embeddings = dict(zip(to_embed, await embed([batch[i].text for i in to_embed]) if to_embed else []))
+        if changed:
+            await asyncio.to_thread(
+                vector_store_service.replace_documents,
+                [batch[i].text for i in changed],
+                [embeddings[i] if i in embeddings else previous_embeddings[batch[i].hash] for i in changed],
+                [metadatas[i] for i in changed],
+                [ids[i] for i in changed],
+            )
+        if unchanged:
+            # Same text at the same position: only its pages and offsets may have moved
+            await asyncio.to_thread(
+                vector_store_service.update_chunk_metadatas, [ids[i] for i in unchanged], [metadatas[i] for i in unchanged]
+            )
+        update_stats["unchanged"] += len(unchanged)
+        update_stats["reused"] += len(changed) - len(to_embed)
+        update_stats["embedded"] += len(to_embed)
+
+    async def write_batch(batch: list[Chunk], start_index: int):
+        nonlocal committed
+        try:
+            batch_start = time.perf_counter()
+            metadatas = [
+                {"source": original_filename, "doc_id": doc_id, "file_hash": file_hash,
+                 "chunk_index": start_index + i, **chunk.metadata()}
+                for i, chunk in enumerate(batch)
+            ]
+            ids = [chunk_id(doc_id, start_index + i) for i in range(len(batch))]
+            if update:
+                await update_batch(batch, ids, metadatas, start_index)
+            else:
+                texts = [chunk.text for chunk in batch]
+                embeddings = await embed(texts)
+                await asyncio.to_thread(vector_store_service.add_documents, texts, embeddings, metadatas, ids)
+            INGESTION_BATCH_SECONDS.observe(time.perf_counter() - batch_start)
+        finally:
+            in_flight.release()
+
+        # Batches may finish out of order; only report the contiguous committed prefix
+        finished_batches[start_index] = start_index + len(batch)
+        while committed in finished_batches:
+            committed = finished_batches.pop(committed)
+        if on_progress:
+            on_progress(doc_id, pages_done, committed)
+
+    # 3. Extract, split, embed and store batch by batch
+    chunk_count = resume_from
+    tasks: list[asyncio.Task] = []
+    try:
+        while True:
+            await in_flight.acquire()
+            batch = await asyncio.to_thread(next_batch)
+            if not batch:
+                in_flight.release()
+                break
+            tasks.append(asyncio.create_task(write_batch(batch, chunk_count)))
+            chunk_count += len(batch)
+            # Surface embedding failures without waiting for the whole document to be parsed
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # A failed update leaves a mix of both versions, which running it again reconciles
+        if rollback_on_error and not update:
+            await asyncio.to_thread(vector_store_service.delete_document, doc_id)
+        raise
+
+    if chunk_count == 0:
         raise ValueError("No text could be extracted from the PDF.")
 
-    # 3. Split the text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    chunks = text_splitter.split_text(text_content)
+    # 4. Two uploads of the same text ingested side by side both pass the early check; the later one is dropped
+    text_hash = fingerprint.hexdigest()
+    duplicate = None
+    if not force and not update:
+        duplicate = await asyncio.to_thread(vector_store_service.find_document, text_hash=text_hash)
+    if duplicate:
+        await asyncio.to_thread(vector_store_service.delete_document, doc_id)
+        return _duplicate_result(duplicate)
 
-    # 4. Create embeddings
-    embeddings_model = GoogleGenerativeAIEmbeddings(model=config.LLM_EMBEDDING_MODEL, google_api_key=config.GEMINI_API_KEY)
-    embeddings = embeddings_model.embed_documents(chunks)
+    if update:
+        stale = [chunk_id(doc_id, index) for index in previous_hashes if index >= chunk_count]
+        if stale:
+            await asyncio.to_thread(vector_store_service.delete_chunks, doc_id, stale)
+        update_stats["removed"] = len(stale)
+        logger.info(f"[INGEST] Update of {doc_id}: {update_stats}")
 
-    # 5. Add to ChromaDB with a unique ID for the document
-    doc_id = str(uuid.uuid4())  # A unique ID for the entire document
-    metadatas = [{"source": original_filename, "doc_id": doc_id} for _ in chunks]
-    ids = [str(uuid.uuid4()) for _ in chunks]  # Unique ID for each chunk
-    vector_store_service.add_documents(chunks, embeddings, metadatas, ids)
+    # 5. Mark the document as complete so that deduplication can find it
+    await asyncio.to_thread(
+        vector_store_service.update_metadatas,
+        [chunk_id(doc_id, i) for i in range(chunk_count)],
+        {"text_hash": text_hash, "chunk_count": chunk_count}
+    )
+    await asyncio.to_thread(document_catalog_service.complete, doc_id, chunk_count, pages_done, text_hash)
+    extraction = extraction_stats.summary()
+    logger.info(f"[INGEST] {original_filename}: {pages_done} pages, {chunk_count} chunks indexed as {doc_id}.")
+    logger.info(f"[INGEST] Extraction: {extraction}")
 
-    return len(chunks)
\ No newline at end of file
+    result = {"doc_id": doc_id, "chunk_count": chunk_count, "duplicate": False, "extraction": extraction}
+    if update:
+        result["update"] = update_stats
+    return result
@@ -0,0 +1,134 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.metrics import CACHE_REQUESTS
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so that trivially different copies share a cache entry."""
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCacheService:
+    """Persistent, size-bounded embedding cache keyed by (model, task, normalized text hash)."""
+
+    def __init__(self):
+        self.connection = None
+        self.max_entries = config.EMBEDDING_CACHE_MAX_ENTRIES
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def initialize(self, db_path=None):
+        db_path = db_path or config.EMBEDDING_CACHE_PATH
+        with self._lock:
+            self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    task TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (model, task, text_hash)
+                )
+                """
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_lru ON embeddings (last_access)")
+            self.connection.commit()
+        logger.info(f"Embedding cache initialized at {db_path}.")
+
+    def _ensure_initialized(self):
+        if self.connection is None:
+            self.initialize()
+
+    def get_many(self, model: str, task: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Returns the cached vector for each text, or None where it is missing."""
+        self._ensure_initialized()
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            # SQLite limits the number of bound parameters, so look up in slices.
+            unique_hashes = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND task = ? AND text_hash IN ({placeholders})",
+                    [model, task, *batch],
+                ).fetchall()
+                for row_hash, blob in rows:
+                    found[row_hash] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self.connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND task = ? AND text_hash = ?",
+                    [(now, model, task, h) for h in found],
+                )
+                self.connection.commit()
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        CACHE_REQUESTS.labels(cache="embedding", result="hit").inc(hit_count)
+        CACHE_REQUESTS.labels(cache="embedding", result="miss").inc(len(results) - hit_count)
+        return results
+
+    def put_many(self, model: str, task: str, texts: List[str], vectors: List[List[float]]):
+        self._ensure_initialized()
+        now = time.time()
+        rows = [
+            (model, task, text_hash(text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, task, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        """Drops the least recently used entries once the cache exceeds its bound."""
+        count = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            logger.info(f"[EMBED-CACHE] Evicted {overflow} entries.")
+
+    def stats(self) -> dict:
+        self._ensure_initialized()
+        with self._lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+            }
+
+
+embedding_cache_service = EmbeddingCacheService()
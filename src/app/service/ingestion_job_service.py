@@ -0,0 +1,357 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger, trace_id_var
+from src.app.metrics import ERRORS, RETRIES
+from src.app.service.document_service import process_document_and_embed
+from src.app.service.vector_store_service import vector_store_service
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+INGEST = "ingest"
+UPDATE = "update"
+DELETE = "delete"
+SNAPSHOT_IMPORT = "snapshot_import"
+SNAPSHOT_EXPORT = "snapshot_export"
+
+
+class IngestionJobService:
+    """Persistent ingestion queue processed by a pool of asyncio workers.
+
+    Jobs live in a SQLite table next to the uploaded PDF they refer to. Progress
+    is committed after every batch, so a job interrupted by a restart is resumed
+    from its last committed chunk instead of starting over. A job that fails
+    rolls its new document back; a failed update keeps its upload so that it can
+    be retried.
+
+    In a multi-worker deployment every process may submit jobs, but only the
+    writer process runs them: it polls the table for jobs queued by the others,
+    deletes and snapshot imports/exports included.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: list[asyncio.Task] = []
+        # Job ids put on the in-memory queue and not yet finished
+        self.enqueued: set[str] = set()
+        self._lock = threading.Lock()
+
+    def initialize(self, db_path=None):
+        db_path = db_path or config.JOBS_DB_PATH
+        with self._lock:
+            self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL DEFAULT 'ingest',
+                    filename TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    force INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    doc_id TEXT,
+                    params TEXT,
+                    pages_done INTEGER NOT NULL DEFAULT 0,
+                    chunks_done INTEGER NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    updated_at REAL NOT NULL,
+                    finished_at REAL
+                )
+                """
+            )
+            columns = {row["name"] for row in self.connection.execute("PRAGMA table_info(jobs)")}
+            if "kind" not in columns:
+                self.connection.execute(f"ALTER TABLE jobs ADD COLUMN kind TEXT NOT NULL DEFAULT '{INGEST}'")
+            if "params" not in columns:
+                self.connection.execute("ALTER TABLE jobs ADD COLUMN params TEXT")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at)")
+            self.connection.commit()
+        logger.info("Ingestion job queue initialized.")
+
+    async def start(self, worker_count: int = None):
+        """Starts the worker pool and re-enqueues jobs left unfinished by a previous run."""
+        if self.connection is None:
+            self.initialize()
+        self.queue = asyncio.Queue()
+        self.enqueued = set()
+
+        pending = self._execute(
+            "SELECT id, status FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+        ).fetchall()
+        for row in pending:
+            if row["status"] == RUNNING:
+                logger.info(f"[JOBS] Resuming interrupted job {row['id']}.")
+            self._update(row["id"], status=QUEUED)
+            self._enqueue(row["id"])
+
+        worker_count = worker_count or config.JOBS_WORKERS
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(worker_count)]
+        if config.MULTI_WORKER:
+            self.workers.append(asyncio.create_task(self._poll_submissions()))
+        logger.info(f"[JOBS] {worker_count} ingestion workers started, {len(pending)} jobs pending.")
+
+    async def stop(self):
+        """Cancels the workers; running jobs stay 'running' and resume on next start."""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    def submit(self, file_path: str, filename: str, force: bool = False, doc_id: Optional[str] = None) -> dict:
+        """Registers an uploaded PDF for ingestion and returns the new job.
+
+        With `doc_id`, the PDF is a new version of that document and only its
+        changed chunks are re-indexed.
+        """
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, filename, file_path, force, status, doc_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, UPDATE if doc_id else INGEST, filename, file_path, int(force), QUEUED,
+             doc_id or str(uuid.uuid4()), now, now),
+            commit=True,
+        )
+        if self.queue is not None:
+            self._enqueue(job_id)
+        return self.get_job(job_id)
+
+    def submit_delete(self, doc_id: str) -> dict:
+        """Queues the deletion of a document, for processes that cannot write to the store."""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, filename, file_path, status, doc_id, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, DELETE, doc_id, "", QUEUED, doc_id, now, now),
+            commit=True,
+        )
+        if self.queue is not None:
+            self._enqueue(job_id)
+        return self.get_job(job_id)
+
+    def submit_snapshot_import(self, file_path: str, filename: str, replace: bool = False) -> dict:
+        """Queues the import of an uploaded knowledge base snapshot."""
+        return self._submit_snapshot_job(SNAPSHOT_IMPORT, file_path, filename, {"replace": replace})
+
+    def submit_snapshot_export(self, file_path: str, doc_ids: list[str]) -> dict:
+        """Queues the export of a snapshot to `file_path`, for processes that cannot read the store."""
+        return self._submit_snapshot_job(SNAPSHOT_EXPORT, file_path, os.path.basename(file_path), {"doc_ids": doc_ids})
+
+    def _submit_snapshot_job(self, kind: str, file_path: str, filename: str, params: dict) -> dict:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, filename, file_path, status, params, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, filename, file_path, QUEUED, json.dumps(params), now, now),
+            commit=True,
+        )
+        if self.queue is not None:
+            self._enqueue(job_id)
+        return self.get_job(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Polls a job until it completes, fails or `timeout` elapses, and returns its last state."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get_job(job_id)
+            if job is None or job["status"] in (COMPLETED, FAILED) or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(config.CHANGE_POLL_SECONDS / 5)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list_jobs(self, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> list[dict]:
+        if status:
+            rows = self._execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (status, limit, offset),
+            ).fetchall()
+        else:
+            rows = self._execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def _enqueue(self, job_id: str):
+        if job_id not in self.enqueued:
+            self.enqueued.add(job_id)
+            self.queue.put_nowait(job_id)
+
+    async def _poll_submissions(self):
+        """Picks up the jobs other worker processes queued (multi-worker deployments)."""
+        while True:
+            await asyncio.sleep(config.CHANGE_POLL_SECONDS)
+            try:
+                rows = self._execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+            except sqlite3.Error as e:
+                logger.error(f"[JOBS] Failed to poll for submitted jobs: {e}")
+                continue
+            for row in rows:
+                self._enqueue(row["id"])
+
+    async def _worker(self, index: int):
+        while True:
+            job_id = await self.queue.get()
+            token = trace_id_var.set(job_id)
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[JOBS] Worker {index} crashed on job {job_id}: {e}")
+            finally:
+                trace_id_var.reset(token)
+                self.enqueued.discard(job_id)
+                self.queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        job = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None or job["status"] not in (QUEUED, RUNNING):
+            return
+
+        if job["attempts"]:
+            RETRIES.labels(operation="ingestion_job").inc()
+        now = time.time()
+        self._update(job_id, status=RUNNING, started_at=job["started_at"] or now, attempts=job["attempts"] + 1)
+        logger.info(f"[JOBS] Job {job_id} started ({job['filename']}, resume from chunk {job['chunks_done']}).")
+
+        def on_progress(doc_id: str, pages_done: int, chunks_done: int):
+            self._update(job_id, doc_id=doc_id, pages_done=pages_done, chunks_done=chunks_done)
+
+        try:
+            if job["kind"] == DELETE:
+                deleted = await asyncio.to_thread(vector_store_service.delete_document, job["doc_id"])
+                result = {"doc_id": job["doc_id"], "deleted": deleted, "chunk_count": 0}
+            elif job["kind"] in (SNAPSHOT_IMPORT, SNAPSHOT_EXPORT):
+                result = {"doc_id": None, **await self._run_snapshot_job(job)}
+            else:
+                result = await process_document_and_embed(
+                    job["file_path"],
+                    job["filename"],
+                    force=bool(job["force"]),
+                    on_progress=on_progress,
+                    doc_id=job["doc_id"],
+                    resume_from=job["chunks_done"],
+                    rollback_on_error=False,
+                    update=job["kind"] == UPDATE,
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[JOBS] Job {job_id} failed: {e}")
+            ERRORS.labels(stage="ingestion").inc()
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            await self._clean_up_failed_job(job_id)
+            return
+
+        self._update(
+            job_id,
+            status=COMPLETED,
+            doc_id=result["doc_id"],
+            chunks_done=result["chunk_count"],
+            result=json.dumps(result),
+            finished_at=time.time(),
+        )
+        if job["kind"] != SNAPSHOT_EXPORT:
+            self._discard_file(job["file_path"])
+        logger.info(f"[JOBS] Job {job_id} completed: {result}")
+
+    async def _clean_up_failed_job(self, job_id: str):
+        """Removes what a failed job left in the store, or keeps what retrying it needs.
+
+        Ingestion keeps its committed batches only so that a restart can resume
+        them: once a new document fails for good, its chunks are deleted with its
+        catalog entry. An update cannot be rolled back once the previous version
+        is partly overwritten, so its upload is kept for `retry`, which reconciles
+        both versions.
+        """
+        job = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job["kind"] == UPDATE:
+            return
+        if job["kind"] == INGEST and job["doc_id"]:
+            try:
+                await asyncio.to_thread(vector_store_service.delete_document, job["doc_id"])
+                self._update(job_id, chunks_done=0)
+            except Exception as e:
+                logger.error(f"[JOBS] Could not roll back document {job['doc_id']} of job {job_id}: {e}")
+        self._discard_file(job["file_path"])
+
+    def retry(self, job_id: str) -> Optional[dict]:
+        """Queues a failed job again if its upload was kept; returns None when it cannot be retried."""
+        job = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None or job["status"] != FAILED or not job["file_path"] or not os.path.exists(job["file_path"]):
+            return None
+        self._update(job_id, status=QUEUED, error=None, finished_at=None)
+        if self.queue is not None:
+            self._enqueue(job_id)
+        return self.get_job(job_id)
+
+    @staticmethod
+    async def _run_snapshot_job(job) -> dict:
+        # Snapshots need NumPy, which the app only loads when it is used
+        from src.app.service.snapshot_service import snapshot_service
+
+        params = json.loads(job["params"] or "{}")
+        if job["kind"] == SNAPSHOT_IMPORT:
+            return await asyncio.to_thread(
+                snapshot_service.import_snapshot, job["file_path"], replace=params.get("replace", False)
+            )
+        return await asyncio.to_thread(snapshot_service.export, job["file_path"], params.get("doc_ids"))
+
+    def _discard_file(self, file_path: str):
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+
+    def _execute(self, sql: str, params: tuple = (), commit: bool = False):
+        if self.connection is None:
+            raise RuntimeError("Job queue not initialized.")
+        with self._lock:
+            cursor = self.connection.execute(sql, params)
+            if commit:
+                self.connection.commit()
+            return cursor
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        self._execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id), commit=True)
+
+    def _to_dict(self, row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job.pop("file_path")
+        job["force"] = bool(job["force"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["params"] = json.loads(job["params"]) if job["params"] else None
+
+        elapsed = (job["finished_at"] or time.time()) - job["started_at"] if job["started_at"] else 0
+        job["elapsed_seconds"] = round(elapsed, 2)
+        job["pages_per_second"] = round(job["pages_done"] / elapsed, 2) if elapsed else 0.0
+        job["chunks_per_second"] = round(job["chunks_done"] / elapsed, 2) if elapsed else 0.0
+        return job
+
+
+ingestion_job_service = IngestionJobService()
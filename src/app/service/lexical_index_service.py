@@ -0,0 +1,248 @@
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# English and French function words; they carry no signal for BM25 and have huge posting lists
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were which with what
+how why when who whom whose does do not can you your than then there these those into over under between
+au aux avec ce ces cette dans de des du elle en est et il ils je la le les leur lui mais ne nous on ou par
+pas pour qu que qui sa se ses son sont sur ta te tes ton tu un une vos votre vous quel quelle quels quelles
+""".split())
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercases, strips accents and drops stopwords and one-character tokens."""
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(char for char in normalized if not unicodedata.combining(char))
+    return [token for token in TOKEN_PATTERN.findall(normalized) if len(token) > 1 and token not in STOPWORDS]
+
+
+@dataclass
+class LexicalMatch:
+    chunk_id: str
+    text: str
+    score: float
+    # Share of the idf mass of the query terms known to the corpus that this chunk matches, in [0, 1]
+    coverage: float
+    matched_terms: int
+
+
+class LexicalIndexService:
+    """Persistent inverted index over stored chunks, scored with Okapi BM25."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.connection = None
+        self.chunk_count = 0
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def initialize(self, db_path=None):
+        db_path = db_path or config.LEXICAL_INDEX_PATH
+        with self._lock:
+            self.connection = sqlite3.connect(str(db_path), check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    doc_id TEXT NOT NULL,
+                    length INTEGER NOT NULL,
+                    text TEXT NOT NULL
+                )
+                """
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_chunks_doc_id ON chunks (doc_id)")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT NOT NULL,
+                    chunk INTEGER NOT NULL,
+                    tf INTEGER NOT NULL,
+                    PRIMARY KEY (term, chunk)
+                ) WITHOUT ROWID
+                """
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk)")
+            self.connection.commit()
+            self.chunk_count, self.total_length = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks"
+            ).fetchone()
+        logger.info(f"Lexical index initialized at {db_path} ({self.chunk_count} chunks).")
+
+    def _ensure_initialized(self):
+        if self.connection is None:
+            self.initialize()
+
+    def refresh(self):
+        """Re-reads the corpus statistics after another process changed the index."""
+        self._ensure_initialized()
+        with self._lock:
+            self.chunk_count, self.total_length = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks"
+            ).fetchone()
+
+    def count(self) -> int:
+        return self.chunk_count
+
+    def add(self, ids: list[str], texts: list[str], doc_ids: list[str]):
+        self._ensure_initialized()
+        with self._lock:
+            for chunk_id, text, doc_id in zip(ids, texts, doc_ids):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO chunks (chunk_id, doc_id, length, text) VALUES (?, ?, ?, ?)",
+                    (chunk_id, doc_id, length, text),
+                )
+                if not cursor.rowcount:
+                    continue  # Already indexed (resumed ingestion)
+                self.connection.executemany(
+                    "INSERT INTO postings (term, chunk, tf) VALUES (?, ?, ?)",
+                    [(term, cursor.lastrowid, tf) for term, tf in terms.items()],
+                )
+                self.chunk_count += 1
+                self.total_length += length
+            self.connection.commit()
+
+    def delete_document(self, doc_id: str):
+        self._ensure_initialized()
+        with self._lock:
+            removed, length = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if not removed:
+                return
+            self.connection.execute(
+                "DELETE FROM postings WHERE chunk IN (SELECT id FROM chunks WHERE doc_id = ?)", (doc_id,)
+            )
+            self.connection.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            self.connection.commit()
+            self.chunk_count -= removed
+            self.total_length -= length
+
+    def delete_chunks(self, ids: list[str]):
+        self._ensure_initialized()
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                removed, length = self.connection.execute(
+                    f"SELECT COUNT(*), COALESCE(SUM(length), 0) FROM chunks WHERE chunk_id IN ({placeholders})", batch
+                ).fetchone()
+                if not removed:
+                    continue
+                self.connection.execute(
+                    f"DELETE FROM postings WHERE chunk IN (SELECT id FROM chunks WHERE chunk_id IN ({placeholders}))",
+                    batch,
+                )
+                self.connection.execute(f"DELETE FROM chunks WHERE chunk_id IN ({placeholders})", batch)
+                self.chunk_count -= removed
+                self.total_length -= length
+            self.connection.commit()
+
+    def clear(self):
+        self._ensure_initialized()
+        with self._lock:
+            self.connection.execute("DELETE FROM postings")
+            self.connection.execute("DELETE FROM chunks")
+            self.connection.commit()
+            self.chunk_count = 0
+            self.total_length = 0
+
+    def rebuild(self, batches: Iterable[tuple[list[str], list[str], list[str]]]):
+        """Replaces the whole index with the given (ids, texts, doc_ids) batches."""
+        self.clear()
+        for ids, texts, doc_ids in batches:
+            self.add(ids, texts, doc_ids)
+        logger.info(f"[LEXICAL] Rebuilt with {self.chunk_count} chunks.")
+
+    def search(self, query: str, n_results: int = 5, doc_ids: Optional[list[str]] = None) -> list[LexicalMatch]:
+        """Returns the best BM25 matches for `query`, optionally restricted to some documents."""
+        self._ensure_initialized()
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or n_results <= 0:
+            return []
+
+        with self._lock:
+            if not self.chunk_count:
+                return []
+            n, average_length = self.chunk_count, self.total_length / self.chunk_count
+            placeholders = ",".join("?" * len(terms))
+            document_frequency = dict(self.connection.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+
+            sql = (
+                f"SELECT p.term, p.chunk, p.tf, c.length FROM postings p JOIN chunks c ON c.id = p.chunk "
+                f"WHERE p.term IN ({placeholders})"
+            )
+            params = list(terms)
+            if doc_ids:
+                sql += f" AND c.doc_id IN ({','.join('?' * len(doc_ids))})"
+                params.extend(doc_ids)
+            postings = self.connection.execute(sql, params).fetchall()
+
+            # Terms absent from the corpus weigh as much as the rarest term: no chunk matches them, so a question
+            # whose distinctive words are unknown never looks fully covered by its common ones
+            idf = {
+                term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for term, df in ((term, document_frequency.get(term, 0)) for term in terms)
+            }
+            query_weight = sum(idf.values())
+
+            scores: dict[int, float] = {}
+            matched_weight: dict[int, float] = {}
+            matched_terms: dict[int, int] = {}
+            for term, chunk, tf, length in postings:
+                norm = tf + self.K1 * (1 - self.B + self.B * length / average_length)
+                scores[chunk] = scores.get(chunk, 0.0) + idf[term] * tf * (self.K1 + 1) / norm
+                matched_weight[chunk] = matched_weight.get(chunk, 0.0) + idf[term]
+                matched_terms[chunk] = matched_terms.get(chunk, 0) + 1
+
+            best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+            if not best:
+                return []
+            rows = dict(
+                (row_id, (chunk_id, text)) for row_id, chunk_id, text in self.connection.execute(
+                    f"SELECT id, chunk_id, text FROM chunks WHERE id IN ({','.join('?' * len(best))})", best
+                )
+            )
+
+        return [
+            LexicalMatch(
+                chunk_id=rows[chunk][0],
+                text=rows[chunk][1],
+                score=scores[chunk],
+                coverage=matched_weight[chunk] / query_weight,
+                matched_terms=matched_terms[chunk],
+            )
+            # A chunk deleted by another process between the two reads is skipped
+            for chunk in best if chunk in rows
+        ]
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int = 60) -> list[tuple[str, float]]:
+    """Fuses several rankings of chunk ids into (chunk_id, score) pairs, best first."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+lexical_index_service = LexicalIndexService()
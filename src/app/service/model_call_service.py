@@ -0,0 +1,556 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.metrics import (
+    CIRCUIT_OPEN, HEDGES, RETRIES, SCHEDULER_QUEUE_DEPTH, SCHEDULER_REJECTED, SCHEDULER_WAIT_SECONDS,
+)
+
+T = TypeVar("T")
+
+# Stages of one solve request, in the order they run; each gets a share of what is left of the budget
+STAGE_ORDER = ("vision", "embedding", "answer")
+
+# Priority classes of model calls, highest first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+    "BadGateway", "GatewayTimeout", "ConnectError", "ConnectTimeout", "ReadTimeout", "RemoteProtocolError",
+}
+
+
+class ModelCallError(Exception):
+    """A model call failed for good; carries the HTTP status the API should answer with."""
+
+    status_code = 502
+
+    def __init__(self, operation: str, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{operation}: {message}")
+        self.operation = operation
+        self.retry_after = retry_after
+
+
+class ModelTimeoutError(ModelCallError):
+    status_code = 504
+
+
+class ModelUnavailableError(ModelCallError):
+    """The upstream stayed overloaded or unreachable through the retries, or its circuit breaker is open."""
+
+    status_code = 503
+
+
+class ModelOverloadedError(ModelUnavailableError):
+    """The call was shed before reaching the model: too many calls are already waiting for its rate limit."""
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    for candidate in (getattr(error, "code", None), getattr(error, "status_code", None),
+                      getattr(getattr(error, "response", None), "status_code", None)):
+        if isinstance(candidate, int):
+            return candidate
+    return None
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Timeouts, rate limits, overload and connection failures are worth retrying; bad requests are not."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if _status_code(error) in TRANSIENT_STATUS_CODES:
+        return True
+    return any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the server (Retry-After header or Google RetryInfo), if any."""
+    retry_after = getattr(error, "retry_after", None)
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    return None
+
+
+def _final_error(operation: str, error: Exception) -> ModelCallError:
+    error_type = ModelUnavailableError if is_transient_error(error) else ModelCallError
+    return error_type(operation, str(error) or type(error).__name__, retry_after_seconds(error))
+
+
+class RequestBudget:
+    """Overall deadline of one request, split between its model stages.
+
+    A stage may use its share of whatever time is left, so time saved by a fast
+    stage goes to the following ones and the last stage gets everything left.
+    """
+
+    def __init__(self, total_seconds: float, shares: Optional[dict] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + total_seconds
+        self.shares = shares or config.STAGE_BUDGET_SHARES
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    def stage_timeout(self, stage: str) -> Optional[float]:
+        if stage not in STAGE_ORDER:
+            return None
+        later = STAGE_ORDER[STAGE_ORDER.index(stage):]
+        weight = sum(self.shares.get(name, 0.0) for name in later)
+        if weight <= 0:
+            return self.remaining()
+        return self.remaining() * self.shares.get(stage, 0.0) / weight
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated transient failures, then lets one probe through."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if self.probing or self.clock() >= self.opened_at + self.reset_seconds else "open"
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            wait = self.opened_at + self.reset_seconds - self.clock()
+            if wait > 0 or self.probing:
+                raise ModelUnavailableError(self.name, "upstream unavailable, circuit open",
+                                            retry_after=max(wait, 1.0))
+            self.probing = True
+            logger.info(f"[RESILIENCE] Circuit '{self.name}' half-open, sending a probe.")
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"[RESILIENCE] Circuit '{self.name}' closed.")
+                CIRCUIT_OPEN.labels(operation=self.name).set(0)
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def release(self):
+        """Frees the probe slot of a call that was cancelled before it could tell anything."""
+        with self._lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.probing:
+                    logger.error(f"[RESILIENCE] Circuit '{self.name}' opened after {self.failures} failures.")
+                self.opened_at = self.clock()
+                self.probing = False
+                CIRCUIT_OPEN.labels(operation=self.name).set(1)
+
+
+class LatencyTracker:
+    """Recent successful call durations, used to decide when a call is slow enough to hedge."""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        if len(self.samples) < min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, and bursts of up to `burst` requests."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = max(1.0, float(burst))
+        self.clock = clock
+        self.tokens = self.burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, reserve: float = 0.0) -> bool:
+        """Takes a token if one is left once `reserve` tokens are set aside."""
+        if not self.rate:
+            return True
+        self._refill()
+        if self.tokens >= 1.0 + reserve:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def wait_time(self, reserve: float = 0.0) -> float:
+        if not self.rate:
+            return 0.0
+        self._refill()
+        return max(0.0, (1.0 + reserve - self.tokens) / self.rate)
+
+
+class ModelQueue:
+    """Rate limit of one model, with the calls waiting for it by priority class."""
+
+    def __init__(self, model: str, bucket: TokenBucket):
+        self.model = model
+        self.bucket = bucket
+        self.waiters: dict[str, deque] = {priority: deque() for priority in PRIORITIES}
+        self.waits: dict[str, LatencyTracker] = {priority: LatencyTracker() for priority in PRIORITIES}
+        self.rejected: dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self.dispatcher: Optional[asyncio.Task] = None
+
+
+class ModelScheduler:
+    """Admission control in front of the models: token buckets, priority classes and bounded queues.
+
+    A call takes a token from its model's bucket when one is available and no
+    call of the same or a higher priority is waiting; otherwise it queues.
+    Interactive solves are always served before background ingestion, which
+    also leaves `interactive_reserve` tokens in the bucket so that a bulk
+    upload cannot use up the burst solves rely on. An interactive call is
+    refused with a 503 (and a Retry-After estimated from the queue) when its
+    queue is full or when its deadline would pass before its turn. Background
+    calls are never refused: nobody waits on them, so they back off until their
+    queue has room and then wait for their turn.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.queues: dict[str, ModelQueue] = {}
+
+    def queue(self, operation: str) -> ModelQueue:
+        model = config.OPERATION_MODELS.get(operation, operation)
+        if model not in self.queues:
+            limits = config.SCHEDULER_MODEL_LIMITS.get(model, {})
+            rpm = limits.get("requests_per_minute", config.SCHEDULER_DEFAULT_RPM)
+            burst = limits.get("burst", config.SCHEDULER_DEFAULT_BURST)
+            self.queues[model] = ModelQueue(model, TokenBucket(rpm / 60.0, burst, self.clock))
+        return self.queues[model]
+
+    @staticmethod
+    def _reserve(queue: ModelQueue, priority: str) -> float:
+        if priority == INTERACTIVE:
+            return 0.0
+        return min(float(config.SCHEDULER_INTERACTIVE_RESERVE), queue.bucket.burst - 1.0)
+
+    def _ahead(self, queue: ModelQueue, priority: str) -> int:
+        """Calls that will be served before a new call of this priority."""
+        return sum(len(queue.waiters[p]) for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+
+    def _retry_after(self, queue: ModelQueue, priority: str) -> float:
+        if not queue.bucket.rate:
+            return 1.0
+        return max(1.0, (self._ahead(queue, priority) + 1) / queue.bucket.rate)
+
+    def try_acquire(self, operation: str, priority: str = INTERACTIVE) -> bool:
+        """Takes a token without queueing, e.g. for optional requests such as hedges."""
+        queue = self.queue(operation)
+        return not self._ahead(queue, priority) and queue.bucket.try_take(self._reserve(queue, priority))
+
+    async def acquire(self, operation: str, priority: str = INTERACTIVE, timeout: Optional[float] = None):
+        """Waits for the operation's model to accept one more request; `timeout` only applies to interactive calls."""
+        queue = self.queue(operation)
+        start = self.clock()
+        waiters = queue.waiters[priority]
+        while True:
+            if self.try_acquire(operation, priority):
+                self._record_wait(queue, priority, self.clock() - start)
+                return
+            if len(waiters) < config.SCHEDULER_MAX_QUEUED.get(priority, 0):
+                break
+            if priority == INTERACTIVE:
+                raise self._reject(queue, priority, operation, "too many calls waiting")
+            await asyncio.sleep(self._retry_after(queue, priority))
+        if priority != INTERACTIVE:
+            timeout = None
+
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        SCHEDULER_QUEUE_DEPTH.labels(model=queue.model, priority=priority).set(len(waiters))
+        if queue.dispatcher is None or queue.dispatcher.done():
+            queue.dispatcher = asyncio.create_task(self._dispatch(queue))
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise self._reject(queue, priority, operation, "deadline would pass before a rate limit token is free")
+        finally:
+            if future in waiters:
+                waiters.remove(future)
+            SCHEDULER_QUEUE_DEPTH.labels(model=queue.model, priority=priority).set(len(waiters))
+        self._record_wait(queue, priority, self.clock() - start)
+
+    def _reject(self, queue: ModelQueue, priority: str, operation: str, reason: str) -> ModelOverloadedError:
+        queue.rejected[priority] += 1
+        SCHEDULER_REJECTED.labels(priority=priority).inc()
+        logger.warning(f"[SCHEDULER] Shedding a {priority} {operation} call: {reason}.")
+        return ModelOverloadedError(operation, f"overloaded, {reason}", retry_after=self._retry_after(queue, priority))
+
+    @staticmethod
+    def _record_wait(queue: ModelQueue, priority: str, seconds: float):
+        queue.waits[priority].record(seconds)
+        SCHEDULER_WAIT_SECONDS.labels(priority=priority).observe(seconds)
+
+    async def _dispatch(self, queue: ModelQueue):
+        """Hands tokens to waiting calls, highest priority first, as the bucket refills."""
+        while True:
+            for waiters in queue.waiters.values():
+                while waiters and waiters[0].done():  # Timed out or cancelled
+                    waiters.popleft()
+            priority = next((p for p in PRIORITIES if queue.waiters[p]), None)
+            if priority is None:
+                return
+            reserve = self._reserve(queue, priority)
+            if queue.bucket.try_take(reserve):
+                queue.waiters[priority].popleft().set_result(None)
+            else:
+                await asyncio.sleep(queue.bucket.wait_time(reserve))
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "requests_per_minute": round(queue.bucket.rate * 60, 2),
+                "tokens": round(queue.bucket.tokens, 2),
+                **{
+                    priority: {
+                        "queued": len(queue.waiters[priority]),
+                        "rejected": queue.rejected[priority],
+                        "wait_p50_seconds": queue.waits[priority].quantile(0.5, 1),
+                        "wait_p95_seconds": queue.waits[priority].quantile(0.95, 1),
+                    }
+                    for priority in PRIORITIES
+                },
+            }
+            for model, queue in self.queues.items()
+        }
+
+
+class ModelCallService:
+    """Deadlines, jittered retries, hedging and circuit breaking around calls to the hosted models.
+
+    Every request sent upstream, retries and hedges included, is first admitted
+    by the scheduler, which enforces the per-model rate limits and priorities.
+    """
+
+    def __init__(self):
+        self.breakers: dict[str, CircuitBreaker] = {}
+        self.latencies: dict[str, LatencyTracker] = {}
+        self.scheduler = ModelScheduler()
+        self._lock = threading.Lock()
+
+    def breaker(self, operation: str) -> CircuitBreaker:
+        with self._lock:
+            if operation not in self.breakers:
+                self.breakers[operation] = CircuitBreaker(
+                    operation, config.CIRCUIT_FAILURE_THRESHOLD, config.CIRCUIT_RESET_SECONDS
+                )
+            return self.breakers[operation]
+
+    def _tracker(self, operation: str) -> LatencyTracker:
+        with self._lock:
+            return self.latencies.setdefault(operation, LatencyTracker())
+
+    def _timeout(self, operation: str, budget: Optional[RequestBudget]) -> float:
+        timeout = config.STAGE_TIMEOUTS.get(operation, config.DEFAULT_STAGE_TIMEOUT_SECONDS)
+        stage_budget = budget.stage_timeout(operation) if budget is not None else None
+        return timeout if stage_budget is None else min(timeout, stage_budget)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter keeps clients that failed together from retrying together
+        cap = min(config.RETRY_BACKOFF_MAX_SECONDS, config.RETRY_BACKOFF_BASE_SECONDS * 2 ** attempt)
+        delay = random.uniform(0, cap)
+        requested = retry_after_seconds(error)
+        return max(delay, requested) if requested is not None else delay
+
+    def _retry_delay(self, operation: str, breaker: CircuitBreaker, error: Exception, attempt: int,
+                     deadline: float) -> Optional[float]:
+        """Returns how long to wait before retrying, or None when the error is final."""
+        if not is_transient_error(error):
+            # The upstream answered; the request itself is at fault
+            breaker.record_success()
+            return None
+        delay = self._backoff(attempt, error)
+        if attempt >= config.MODEL_MAX_RETRIES or time.monotonic() + delay >= deadline:
+            breaker.record_failure()
+            return None
+        logger.info(f"[RESILIENCE] {operation} failed ({type(error).__name__}), retry {attempt + 1} in {delay:.2f}s.")
+        RETRIES.labels(operation=operation).inc()
+        return delay
+
+    async def _admit(self, operation: str, priority: str, breaker: CircuitBreaker, deadline: float) -> float:
+        """Waits for the scheduler and returns the deadline of the request it admitted.
+
+        Time a background call spends queued does not count against its deadline,
+        which only bounds the model request. A shed call tells nothing about the
+        upstream, so it frees the probe slot.
+        """
+        start = time.monotonic()
+        try:
+            await self.scheduler.acquire(operation, priority, timeout=max(0.0, deadline - start))
+        except BaseException:
+            breaker.release()
+            raise
+        return deadline if priority == INTERACTIVE else deadline + time.monotonic() - start
+
+    async def call(self, operation: str, factory: Callable[[], Awaitable[T]],
+                   budget: Optional[RequestBudget] = None, priority: str = INTERACTIVE) -> T:
+        """Runs `factory()` under the operation's deadline, retrying transient failures.
+
+        `factory` must start a new, idempotent request each time it is called, as
+        it is invoked again for retries and hedged duplicates. Background work
+        such as ingestion passes `priority=BACKGROUND`.
+        """
+        breaker = self.breaker(operation)
+        breaker.before_call()
+        deadline = time.monotonic() + self._timeout(operation, budget)
+        attempt = 0
+        while True:
+            deadline = await self._admit(operation, priority, breaker, deadline)
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                result = await asyncio.wait_for(self._attempt(operation, factory, priority), remaining)
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise ModelTimeoutError(operation, "deadline exceeded")
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                delay = self._retry_delay(operation, breaker, e, attempt, deadline)
+                if delay is None:
+                    raise _final_error(operation, e) from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            breaker.record_success()
+            return result
+
+    async def _attempt(self, operation: str, factory: Callable[[], Awaitable[T]], priority: str) -> T:
+        """One attempt; once it runs longer than the usual tail latency a duplicate request races it."""
+        tracker = self._tracker(operation)
+        hedge_after = tracker.quantile(config.HEDGING_QUANTILE, config.HEDGING_MIN_SAMPLES) \
+            if config.HEDGING_ENABLED else None
+        start = time.monotonic()
+        if hedge_after is None:
+            result = await factory()
+            tracker.record(time.monotonic() - start)
+            return result
+
+        tasks = [asyncio.ensure_future(factory())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            # A hedge is optional: it is only sent when the rate limit has a token to spare right away
+            if not done and self.scheduler.try_acquire(operation, priority):
+                HEDGES.labels(operation=operation).inc()
+                tasks.append(asyncio.ensure_future(factory()))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        tracker.record(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def stream(self, operation: str, factory: Callable[[], AsyncIterator[T]],
+                     budget: Optional[RequestBudget] = None, priority: str = INTERACTIVE) -> AsyncIterator[T]:
+        """Streaming variant of `call`: retries only until the first item has been yielded."""
+        breaker = self.breaker(operation)
+        breaker.before_call()
+        deadline = time.monotonic() + self._timeout(operation, budget)
+        attempt = 0
+        while True:
+            deadline = await self._admit(operation, priority, breaker, deadline)
+            iterator = factory().__aiter__()
+            started = False
+            try:
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    try:
+                        item = await asyncio.wait_for(iterator.__anext__(), remaining)
+                    except StopAsyncIteration:
+                        break
+                    started = True
+                    yield item
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise ModelTimeoutError(operation, "deadline exceeded")
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.release()
+                raise
+            except Exception as e:
+                if started:
+                    # Tokens already reached the client, so the stream cannot be replayed
+                    if is_transient_error(e):
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                    delay = None
+                else:
+                    delay = self._retry_delay(operation, breaker, e, attempt, deadline)
+                if delay is None:
+                    raise _final_error(operation, e) from e
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            finally:
+                close = getattr(iterator, "aclose", None)
+                if close is not None:
+                    try:
+                        await close()
+                    except Exception:
+                        pass
+            breaker.record_success()
+            return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {"state": breaker.state, "failures": breaker.failures}
+                for name, breaker in self.breakers.items()
+            }
+
+
+model_call_service = ModelCallService()
@@ -0,0 +1,559 @@
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+
+# Compact representations searches can scan instead of the float32 matrix, by file suffix. float16 is left
+# out: NumPy converts it to float32 so slowly that its scans were several times slower than float32 ones.
+QUANTIZED_DTYPES = {"int8": ("i8", np.int8)}
+# Quantized rows are converted to float32 this many at a time while scanning, small enough to stay in CPU cache
+SCAN_BLOCK_ROWS = 1024
+
+
+class NumpyVectorIndex:
+    """Brute-force vector index over a memory-mapped float32 matrix.
+
+    Rows of a document are kept in contiguous ranges so that a query filtered on
+    a few documents only scans their slices. Chunk texts and row ownership live
+    in a small SQLite table next to the matrix. Deleted rows are left in place
+    and reclaimed by compaction, which rewrites the matrix under a new
+    generation so that a crash never leaves the table and the file out of step.
+
+    Row slots are written once per generation, which lets other processes open
+    the index read-only and follow the writer: `refresh` maps the rows it
+    committed since the previous snapshot, and a new generation is remapped
+    from scratch.
+
+    With `quantization`, every row also gets an int8 copy, with one scale per
+    row, in a file of its own. Searches scan that copy, then re-rank
+    `rerank_factor` times more candidates than requested with the float32 rows,
+    of which only those candidates are read: the memory a search keeps hot
+    shrinks about 4x while the returned distances stay exact. The float32 rows
+    stay on disk, so the index takes about a quarter more disk space.
+    """
+
+    MIN_CAPACITY = 1024
+
+    def __init__(self, directory: Path, read_only: bool = False, quantization: Optional[str] = None):
+        self.directory = Path(directory)
+        self.read_only = read_only
+        self.quantization = quantization or config.VECTOR_INDEX_QUANTIZATION
+        if self.quantization != "none" and self.quantization not in QUANTIZED_DTYPES:
+            raise ValueError(f"Unknown vector quantization '{self.quantization}', expected 'none' or 'int8'.")
+        self.connection = None
+        self.vectors: Optional[np.memmap] = None
+        # Quantized copy of the rows and, for int8, the scale of each row
+        self.codes: Optional[np.memmap] = None
+        self.scales: Optional[np.memmap] = None
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.dim = 0
+        self.generation = 0
+        self.size = 0
+        self.live = 0
+        # doc_id -> list of [start, end) row ranges, in row order
+        self.segments: dict[str, list[list[int]]] = {}
+        self._lock = threading.RLock()
+
+    # --- Lifecycle -----------------------------------------------------------
+
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            self.connection = sqlite3.connect(str(self.directory / "index.sqlite3"), check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rows (
+                    row INTEGER PRIMARY KEY,
+                    chunk_id TEXT NOT NULL UNIQUE,
+                    doc_id TEXT NOT NULL,
+                    text TEXT NOT NULL
+                )
+                """
+            )
+            self.connection.commit()
+            if self.read_only:
+                self.refresh()
+                logger.info(f"[INDEX] NumPy index opened read-only with {self.live} vectors.")
+                return
+            meta = dict(self.connection.execute("SELECT key, value FROM meta").fetchall())
+            self.generation = meta.get("generation", 0)
+            self.dim = meta.get("dim", 0)
+            self._remove_stale_files()
+            self._load_rows()
+            # Slots of rows deleted at the end of the matrix are not reused before the next compaction
+            self.size = max(self.size, meta.get("size", 0))
+            if self.dim:
+                quantized = self._codes_path(self.generation)
+                missing_codes = quantized is not None and not quantized.exists()
+                self._open_matrix(max(self.size, self.MIN_CAPACITY))
+                if missing_codes and self.size:
+                    logger.info(f"[INDEX] Quantizing {self.size} vectors to {self.quantization}...")
+                    for start in range(0, self.size, SCAN_BLOCK_ROWS):
+                        self._write_codes(start, np.asarray(self.vectors[start:start + SCAN_BLOCK_ROWS]))
+                    self._flush()
+                self._refresh_norms(0, self.size)
+            if self._needs_compaction() or self._is_fragmented():
+                self.compact()
+        logger.info(f"[INDEX] NumPy index opened with {self.live} vectors ({len(self.segments)} documents).")
+
+    def close(self):
+        with self._lock:
+            if self.vectors is not None:
+                self._flush()
+                self.vectors = self.codes = self.scales = None
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def _matrix_path(self, generation: int) -> Path:
+        return self.directory / f"vectors-{generation}.f32"
+
+    def _codes_path(self, generation: int) -> Optional[Path]:
+        if self.quantization == "none":
+            return None
+        return self.directory / f"vectors-{generation}.{QUANTIZED_DTYPES[self.quantization][0]}"
+
+    def _scales_path(self, generation: int) -> Path:
+        return self.directory / f"vectors-{generation}.scales"
+
+    def _generation_files(self, generation: int) -> list[Path]:
+        paths = [self._matrix_path(generation)]
+        if self.quantization != "none":
+            paths.append(self._codes_path(generation))
+        if self.quantization == "int8":
+            paths.append(self._scales_path(generation))
+        return paths
+
+    def _remove_stale_files(self):
+        # Also drops the quantized copy when quantization was turned off, so it is never left stale
+        current = set(self._generation_files(self.generation))
+        for path in self.directory.glob("vectors-*"):
+            if path not in current:
+                path.unlink(missing_ok=True)
+
+    def _load_rows(self):
+        self.segments = {}
+        self.size = 0
+        self.live = 0
+        for row, doc_id in self.connection.execute("SELECT row, doc_id FROM rows ORDER BY row"):
+            self._extend_segment(doc_id, row, row + 1)
+            self.size = row + 1
+            self.live += 1
+
+    def _open_matrix(self, min_rows: int):
+        """Maps the matrix files, growing them geometrically to hold at least `min_rows` rows."""
+        path = self._matrix_path(self.generation)
+        row_bytes = self.dim * 4
+        current_rows = path.stat().st_size // row_bytes if path.exists() else 0
+        if self.vectors is not None and current_rows >= min_rows:
+            return
+        if current_rows < min_rows:
+            current_rows = max(self.MIN_CAPACITY, min_rows, current_rows * 2)
+            if self.vectors is not None:
+                self._flush()
+                self.vectors = self.codes = self.scales = None
+        self.vectors, self.codes, self.scales = self._map_generation(self.generation, current_rows, "r+")
+        if len(self.norms) < current_rows:
+            self.norms = np.concatenate([self.norms, np.zeros(current_rows - len(self.norms), dtype=np.float32)])
+
+    def _map_generation(self, generation: int, rows: int, mode: str) -> tuple[np.memmap, ...]:
+        """Maps the float32 matrix of a generation and its quantized copy, creating or growing them in 'r+' mode."""
+        def map_file(path: Path, dtype, shape: tuple) -> np.memmap:
+            if mode == "r+":
+                size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+                with open(path, "ab") as handle:
+                    if handle.tell() < size:
+                        handle.truncate(size)
+            return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
+
+        vectors = map_file(self._matrix_path(generation), np.float32, (rows, self.dim))
+        codes = scales = None
+        codes_path = self._codes_path(generation)
+        if codes_path is not None:
+            dtype = QUANTIZED_DTYPES[self.quantization][1]
+            if mode == "r" and (not codes_path.exists() or codes_path.stat().st_size < rows * self.dim * dtype().itemsize):
+                # The writer does not quantize (or is growing the file): scan the float32 rows
+                return vectors, None, None
+            codes = map_file(codes_path, dtype, (rows, self.dim))
+            if self.quantization == "int8":
+                scales = map_file(self._scales_path(generation), np.float32, (rows,))
+        return vectors, codes, scales
+
+    def _flush(self):
+        for array in (self.vectors, self.codes, self.scales):
+            if array is not None:
+                array.flush()
+
+    def _write_codes(self, start: int, matrix: np.ndarray):
+        """Stores the quantized copy of rows `start..start + len(matrix)`."""
+        if self.codes is None:
+            return
+        end = start + len(matrix)
+        # Symmetric scale per row, so that each row uses the whole [-127, 127] range
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        self.codes[start:end] = np.rint(matrix / scales[:, None]).astype(np.int8)
+        self.scales[start:end] = scales
+
+    def _scanned_rows(self, start: int, end: int) -> np.ndarray:
+        """The rows searches compare queries with: the dequantized copy when there is one."""
+        if self.codes is None:
+            return self.vectors[start:end]
+        block = self.codes[start:end].astype(np.float32)
+        if self.scales is not None:
+            block *= self.scales[start:end, None]
+        return block
+
+    def _refresh_norms(self, start: int, end: int):
+        for block_start in range(start, end, SCAN_BLOCK_ROWS):
+            block_end = min(end, block_start + SCAN_BLOCK_ROWS)
+            block = self._scanned_rows(block_start, block_end)
+            self.norms[block_start:block_end] = np.einsum("ij,ij->i", block, block)
+
+    # --- Writes --------------------------------------------------------------
+
+    def count(self) -> int:
+        return self.live
+
+    def add(self, ids: list[str], embeddings: list[list[float]], texts: list[str], doc_ids: list[str]):
+        if not ids:
+            return
+        with self._lock:
+            existing = self._existing_ids(ids)
+            keep = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+            if not keep:
+                return
+            matrix = np.asarray([embeddings[i] for i in keep], dtype=np.float32)
+            if not self.dim:
+                self.dim = matrix.shape[1]
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dim', ?)", (self.dim,))
+                self.connection.commit()
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match the index ({self.dim}).")
+
+            start, end = self.size, self.size + len(keep)
+            self._open_matrix(end)
+            self.vectors[start:end] = matrix
+            self._write_codes(start, matrix)
+            self._flush()
+            # Rows become visible (and durable) only once the table references them
+            self.connection.executemany(
+                "INSERT INTO rows (row, chunk_id, doc_id, text) VALUES (?, ?, ?, ?)",
+                [(start + offset, ids[i], doc_ids[i], texts[i]) for offset, i in enumerate(keep)],
+            )
+            self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('size', ?)", (end,))
+            self.connection.commit()
+            self._refresh_norms(start, end)
+            for offset, i in enumerate(keep):
+                self._extend_segment(doc_ids[i], start + offset, start + offset + 1)
+            self.size = end
+            self.live += len(keep)
+
+    def _existing_ids(self, ids: list[str]) -> set[str]:
+        found = set()
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.update(
+                row[0] for row in self.connection.execute(
+                    f"SELECT chunk_id FROM rows WHERE chunk_id IN ({placeholders})", batch
+                )
+            )
+        return found
+
+    def _extend_segment(self, doc_id: str, start: int, end: int):
+        ranges = self.segments.setdefault(doc_id, [])
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+
+    def delete_document(self, doc_id: str) -> int:
+        with self._lock:
+            ranges = self.segments.pop(doc_id, None)
+            if not ranges:
+                return 0
+            self.connection.execute("DELETE FROM rows WHERE doc_id = ?", (doc_id,))
+            self.connection.commit()
+            removed = sum(end - start for start, end in ranges)
+            self.live -= removed
+            if self._needs_compaction():
+                self.compact()
+            return removed
+
+    def delete_chunks(self, ids: list[str]) -> int:
+        """Deletes single chunks, leaving holes in their documents' ranges until the next compaction."""
+        with self._lock:
+            rows = []
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self.connection.execute(
+                    f"SELECT row, doc_id FROM rows WHERE chunk_id IN ({placeholders})", batch
+                ).fetchall())
+                self.connection.execute(f"DELETE FROM rows WHERE chunk_id IN ({placeholders})", batch)
+            self.connection.commit()
+            for row, doc_id in rows:
+                ranges = []
+                for start, end in self.segments.get(doc_id, []):
+                    if start <= row < end:
+                        ranges.extend(r for r in ([start, row], [row + 1, end]) if r[0] < r[1])
+                    else:
+                        ranges.append([start, end])
+                if ranges:
+                    self.segments[doc_id] = ranges
+                else:
+                    self.segments.pop(doc_id, None)
+            self.live -= len(rows)
+            if self._needs_compaction():
+                self.compact()
+            return len(rows)
+
+    def clear(self):
+        """Empties the index; the next rows go to a fresh matrix generation."""
+        with self._lock:
+            next_generation = self.generation + 1
+            with self.connection:
+                self.connection.execute("DELETE FROM rows")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (next_generation,)
+                )
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('size', 0)")
+            self.vectors = self.codes = self.scales = None
+            self.norms = np.zeros(0, dtype=np.float32)
+            self.generation = next_generation
+            self.segments = {}
+            self.size = 0
+            self.live = 0
+            self._remove_stale_files()
+
+    def rebuild(self, batches: Iterable[tuple[list[str], list[list[float]], list[str], list[str]]]):
+        """Replaces the whole index with the given (ids, embeddings, texts, doc_ids) batches."""
+        with self._lock:
+            self.clear()
+            for ids, embeddings, texts, doc_ids in batches:
+                self.add(ids, embeddings, texts, doc_ids)
+            if self._is_fragmented():
+                self.compact()
+
+    def _needs_compaction(self) -> bool:
+        dead = self.size - self.live
+        return dead > 0 and dead >= self.size * config.VECTOR_INDEX_COMPACTION_RATIO
+
+    def _is_fragmented(self) -> bool:
+        return any(len(ranges) > 1 for ranges in self.segments.values())
+
+    def compact(self):
+        """Rewrites live rows document by document into a fresh matrix without holes."""
+        with self._lock:
+            if not self.dim:
+                return
+            old = (self.vectors, self.codes, self.scales)
+            next_generation = self.generation + 1
+            capacity = max(self.MIN_CAPACITY, self.live)
+            for path in self._generation_files(next_generation):
+                path.unlink(missing_ok=True)
+            new = self._map_generation(next_generation, capacity, "r+")
+
+            mapping = []
+            segments = {}
+            cursor = 0
+            for doc_id, ranges in self.segments.items():
+                doc_start = cursor
+                for start, end in ranges:
+                    for old_array, new_array in zip(old, new):
+                        if new_array is not None:
+                            new_array[cursor:cursor + end - start] = old_array[start:end]
+                    mapping.extend((old_row, cursor + old_row - start) for old_row in range(start, end))
+                    cursor += end - start
+                segments[doc_id] = [[doc_start, cursor]]
+            for new_array in new:
+                if new_array is not None:
+                    new_array.flush()
+
+            with self.connection:
+                self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS row_mapping (old INTEGER PRIMARY KEY, new INTEGER)")
+                self.connection.execute("DELETE FROM row_mapping")
+                self.connection.executemany("INSERT INTO row_mapping (old, new) VALUES (?, ?)", mapping)
+                self.connection.execute("DROP TABLE IF EXISTS rows_next")
+                self.connection.execute(
+                    "CREATE TABLE rows_next (row INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, "
+                    "doc_id TEXT NOT NULL, text TEXT NOT NULL)"
+                )
+                self.connection.execute(
+                    "INSERT INTO rows_next (row, chunk_id, doc_id, text) "
+                    "SELECT m.new, r.chunk_id, r.doc_id, r.text FROM rows r JOIN row_mapping m ON m.old = r.row"
+                )
+                self.connection.execute("DROP TABLE rows")
+                self.connection.execute("ALTER TABLE rows_next RENAME TO rows")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (next_generation,)
+                )
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('size', ?)", (cursor,))
+                self.connection.execute("DROP TABLE row_mapping")
+
+            reclaimed = self.size - self.live
+            self.vectors, self.codes, self.scales = new
+            self.generation = next_generation
+            self.segments = segments
+            self.size = cursor
+            self.norms = np.zeros(capacity, dtype=np.float32)
+            self._refresh_norms(0, self.size)
+            del old
+            self._remove_stale_files()
+            logger.info(f"[INDEX] Compacted to {self.size} rows ({reclaimed} reclaimed).")
+
+    # --- Read-only replicas ---------------------------------------------------
+
+    def refresh(self):
+        """Catches up with what the writer process committed (read-only indexes only)."""
+        with self._lock:
+            for _ in range(3):
+                try:
+                    self._load_snapshot()
+                    return
+                except FileNotFoundError:
+                    # Compacted again between reading the table and mapping the file: read it anew
+                    continue
+            logger.warning("[INDEX] Could not catch up with a compacting writer, keeping the previous snapshot.")
+
+    def _load_snapshot(self):
+        previous_generation, previous_size = self.generation, self.size
+        # One read transaction, so that the generation and the rows belong to the same commit
+        self.connection.execute("BEGIN")
+        try:
+            meta = dict(self.connection.execute("SELECT key, value FROM meta").fetchall())
+            generation = meta.get("generation", 0)
+            dim = meta.get("dim", 0)
+            segments, live, last_row = self._read_segments()
+        finally:
+            self.connection.commit()
+        size = max(last_row, meta.get("size", 0))
+
+        arrays, norms, refresh_from = (self.vectors, self.codes, self.scales), self.norms, previous_size
+        if generation != previous_generation or dim != self.dim or self.vectors is None:
+            arrays, norms, refresh_from = (None, None, None), np.zeros(0, dtype=np.float32), 0
+        vectors, codes, _ = arrays
+        quantized_pending = self.quantization != "none" and codes is None
+        if dim and size and (vectors is None or len(vectors) < size or quantized_pending):
+            path = self._matrix_path(generation)
+            self.dim = dim
+            arrays = self._map_generation(generation, path.stat().st_size // (dim * 4), "r")
+            if len(norms) < len(arrays[0]):
+                norms = np.concatenate([norms, np.zeros(len(arrays[0]) - len(norms), dtype=np.float32)])
+            if (codes is None) != (arrays[1] is None):
+                # Norms are those of the rows searches scan, which just switched representation
+                refresh_from = 0
+
+        self.generation, self.dim, self.norms = generation, dim, norms
+        self.vectors, self.codes, self.scales = arrays
+        self.segments, self.live, self.size = segments, live, size
+        if self.vectors is not None and size > refresh_from:
+            self._refresh_norms(refresh_from, size)
+
+    def _read_segments(self) -> tuple[dict[str, list[list[int]]], int, int]:
+        segments: dict[str, list[list[int]]] = {}
+        live = last_row = 0
+        for row, doc_id in self.connection.execute("SELECT row, doc_id FROM rows ORDER BY row"):
+            ranges = segments.setdefault(doc_id, [])
+            if ranges and ranges[-1][1] == row:
+                ranges[-1][1] = row + 1
+            else:
+                ranges.append([row, row + 1])
+            live += 1
+            last_row = row + 1
+        return segments, live, last_row
+
+    # --- Reads ---------------------------------------------------------------
+
+    @staticmethod
+    def _coalesce(ranges: list[list[int]]) -> list[list[int]]:
+        """Merges adjacent ranges so that neighbouring documents are scanned in one product."""
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and merged[-1][1] == start:
+                merged[-1][1] = end
+            else:
+                merged.append([start, end])
+        return merged
+
+    def search(self, query_embedding: list[float], n_results: int = 5,
+               doc_ids: Optional[list[str]] = None, _retry: bool = True) -> list[tuple[str, str, float]]:
+        """Returns the (chunk id, text, squared L2 distance) of the nearest chunks, closest first."""
+        with self._lock:
+            if not self.live or n_results <= 0:
+                return []
+            query = np.asarray(query_embedding, dtype=np.float32)
+            if doc_ids:
+                ranges = [r for doc_id in dict.fromkeys(doc_ids) for r in self.segments.get(doc_id, [])]
+            else:
+                ranges = [r for doc_ranges in self.segments.values() for r in doc_ranges]
+            if not ranges:
+                return []
+            ranges = self._coalesce(ranges)
+
+            rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+            # ||x - q||^2 = ||x||^2 - 2 x.q + ||q||^2, the metric Chroma uses by default
+            distances = np.concatenate(
+                [self.norms[start:end] - 2.0 * self._dot(start, end, query) for start, end in ranges]
+            ) + float(query @ query)
+
+            k = min(n_results, len(rows))
+            candidates = k if self.codes is None else min(len(rows), k * config.VECTOR_INDEX_RERANK_FACTOR)
+            top = np.argpartition(distances, candidates - 1)[:candidates] if candidates < len(rows) \
+                else np.arange(len(rows))
+            if self.codes is not None:
+                # Exact re-ranking: only the candidate rows of the float32 matrix are read
+                exact = self.vectors[rows[top]] - query
+                distances[top] = np.einsum("ij,ij->i", exact, exact)
+            top = top[np.argsort(distances[top])][:k]
+            selected = [int(rows[i]) for i in top]
+
+            if self.read_only:
+                generation, chunks = self._read_chunks(selected)
+                if generation != self.generation and _retry:
+                    # The writer compacted since our snapshot and row numbers moved: search the new one
+                    self.refresh()
+                    return self.search(query_embedding, n_results, doc_ids, _retry=False)
+            else:
+                chunks = self._select_chunks(selected)
+            # Rows another process deleted since our snapshot are skipped
+            return [
+                (*chunks[row], max(0.0, float(distances[i]))) for row, i in zip(selected, top) if row in chunks
+            ]
+
+    def _dot(self, start: int, end: int, query: np.ndarray) -> np.ndarray:
+        if self.codes is None:
+            return self.vectors[start:end] @ query
+        products = np.concatenate([
+            self.codes[block:min(end, block + SCAN_BLOCK_ROWS)].astype(np.float32) @ query
+            for block in range(start, end, SCAN_BLOCK_ROWS)
+        ])
+        # Scaling the products rather than the rows saves a pass over the block
+        return products * self.scales[start:end] if self.scales is not None else products
+
+    def _select_chunks(self, rows: list[int]) -> dict[int, tuple[str, str]]:
+        placeholders = ",".join("?" * len(rows))
+        return {
+            row: (chunk_id, text) for row, chunk_id, text in self.connection.execute(
+                f"SELECT row, chunk_id, text FROM rows WHERE row IN ({placeholders})", rows
+            )
+        }
+
+    def _read_chunks(self, rows: list[int]) -> tuple[int, dict[int, tuple[str, str]]]:
+        """Reads the chunks of some rows with the generation they belong to, in one transaction."""
+        self.connection.execute("BEGIN")
+        try:
+            generation = self.connection.execute(
+                "SELECT COALESCE(MAX(value), 0) FROM meta WHERE key = 'generation'"
+            ).fetchone()[0]
+            return generation, self._select_chunks(rows)
+        finally:
+            self.connection.commit()
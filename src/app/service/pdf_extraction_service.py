@@ -0,0 +1,130 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.metrics import INGESTION_PAGE_SECONDS
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> list[tuple[int, str, float]]:
+    """Worker entry point: opens the file itself and extracts pages [start, end)."""
+    import fitz  # PyMuPDF
+
+    pages = []
+    with fitz.open(pdf_path) as doc:
+        for page_number in range(start, end):
+            page_start = time.perf_counter()
+            text = doc[page_number].get_text()
+            pages.append((page_number, text, time.perf_counter() - page_start))
+    return pages
+
+
+class ExtractionStats:
+    """Per-page extraction timings for one document."""
+
+    def __init__(self):
+        self.page_timings: list[tuple[int, float]] = []
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+
+    def record(self, page_number: int, seconds: float):
+        self.page_timings.append((page_number, seconds))
+        INGESTION_PAGE_SECONDS.observe(seconds)
+        if seconds >= config.EXTRACTION_SLOW_PAGE_SECONDS:
+            logger.info(f"[EXTRACT] Slow page {page_number + 1}: {seconds:.2f}s")
+
+    def summary(self, slowest: int = 5) -> dict:
+        if not self.page_timings:
+            return {"pages": 0, "wall_time": 0.0, "cpu_time": 0.0, "mean_page_time": 0.0, "slowest_pages": []}
+        total = sum(seconds for _, seconds in self.page_timings)
+        wall_time = (self.finished_at or time.perf_counter()) - self.started_at
+        worst = sorted(self.page_timings, key=lambda timing: timing[1], reverse=True)[:slowest]
+        return {
+            "pages": len(self.page_timings),
+            "wall_time": round(wall_time, 3),
+            "cpu_time": round(total, 3),
+            "mean_page_time": round(total / len(self.page_timings), 4),
+            "slowest_pages": [{"page": page + 1, "seconds": round(seconds, 3)} for page, seconds in worst],
+        }
+
+
+class PdfExtractionService:
+    """Extracts PDF text by sharding page ranges across a process pool.
+
+    Each worker opens the file on its own and returns the text of its shard;
+    shards are consumed in page order with a bounded number in flight, so the
+    caller still sees a lazy, ordered stream of pages.
+    """
+
+    def __init__(self):
+        self.executor: Optional[ProcessPoolExecutor] = None
+        # Documents this short are extracted in the calling thread, which is faster for one upload;
+        # bulk imports set it to 0 so that documents ingested side by side use every core
+        self.inline_max_pages: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self.executor is None:
+                # spawn avoids forking a process that already runs threads (uvicorn, workers)
+                self.executor = ProcessPoolExecutor(
+                    max_workers=config.EXTRACTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"[EXTRACT] Process pool started with {config.EXTRACTION_WORKERS} workers.")
+            return self.executor
+
+    def shutdown(self):
+        with self._lock:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+    def iter_pages(self, pdf_path: str, stats: Optional[ExtractionStats] = None) -> Iterator[str]:
+        """Yields the text of every page in order."""
+        stats = stats or ExtractionStats()
+        stats.started_at = time.perf_counter()
+        import fitz  # PyMuPDF, only loaded once a document is ingested
+
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+
+        shard_size = config.EXTRACTION_PAGES_PER_SHARD
+        inline_max_pages = shard_size if self.inline_max_pages is None else self.inline_max_pages
+        if config.EXTRACTION_WORKERS <= 1 or page_count <= inline_max_pages:
+            for page_number, text, seconds in _extract_page_range(pdf_path, 0, page_count):
+                stats.record(page_number, seconds)
+                yield text
+            stats.finished_at = time.perf_counter()
+            return
+
+        executor = self._get_executor()
+        shards = iter(range(0, page_count, shard_size))
+        pending = deque()
+        # Keep every worker busy plus one shard of look-ahead each, never the whole document
+        max_pending = config.EXTRACTION_WORKERS * 2
+        try:
+            for start in shards:
+                pending.append(executor.submit(_extract_page_range, pdf_path, start, min(start + shard_size, page_count)))
+                if len(pending) >= max_pending:
+                    break
+            while pending:
+                for page_number, text, seconds in pending.popleft().result():
+                    stats.record(page_number, seconds)
+                    yield text
+                start = next(shards, None)
+                if start is not None:
+                    pending.append(
+                        executor.submit(_extract_page_range, pdf_path, start, min(start + shard_size, page_count))
+                    )
+        finally:
+            for future in pending:
+                future.cancel()
+        stats.finished_at = time.perf_counter()
+
+
+pdf_extraction_service = PdfExtractionService()
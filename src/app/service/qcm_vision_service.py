@@ -1,17 +1,30 @@
-import base64
+import asyncio
 import json
 import time
-from io import BytesIO
-from typing import Dict, List, Optional
+from collections import Counter
+from typing import AsyncIterator, Callable, Dict, List, Optional
 
-from PIL import Image
 from langchain.prompts import PromptTemplate
 from langchain_core.messages import HumanMessage
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
 
 from src.app import config
 from src.app.logger.logger_configuration import logger
+from src.app.metrics import ERRORS, RETRIEVAL_PATHS, SPECULATIVE_RETRIEVALS, observe_stage
+from src.app.service.document_service import CHUNK_OVERLAP
+from src.app.service.cached_embeddings import CachedEmbeddings
+from src.app.service.model_call_service import ModelCallError, RequestBudget, model_call_service
+from src.app.service.lexical_index_service import LexicalMatch, lexical_index_service, reciprocal_rank_fusion
 from src.app.service.vector_store_service import vector_store_service
+from src.app.utils.context_utils import ContextCandidate, assemble_context, count_tokens
+from src.app.utils.image_utils import preprocess_image
+from src.app.utils.json_utils import complete_string_field
+
+
+CONTEXT_ERROR_MESSAGE = "Error while retrieving context."
+ANSWER_ERROR_MESSAGE = "Error during answer generation."
+# Gemini task type of question embeddings, matched against chunks embedded as RETRIEVAL_DOCUMENT
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
 
 
 class QCMVisionAnalysisService:
@@ -20,6 +33,7 @@ class QCMVisionAnalysisService:
             raise ValueError("GEMINI_API_KEY is missing")
 
         self.vision_extraction_prompt = self._load_prompt(config.VISION_PROMPT_FILE)
+        self.batch_vision_extraction_prompt = self._load_prompt(config.BATCH_VISION_PROMPT_FILE)
         self.answer_generation_prompt = self._load_prompt(config.ANSWER_PROMPT_FILE)
 
         self.vision_llm = ChatGoogleGenerativeAI(
@@ -33,12 +47,23 @@ class QCMVisionAnalysisService:
             temperature=config.ANSWER_TEMPERATURE
         )
 
-        self.embeddings_model = GoogleGenerativeAIEmbeddings(
-            model=config.LLM_EMBEDDING_MODEL,
-            google_api_key=config.GEMINI_API_KEY
+        self.embeddings_model = CachedEmbeddings(
+            GoogleGenerativeAIEmbeddings(
+                model=config.LLM_EMBEDDING_MODEL,
+                google_api_key=config.GEMINI_API_KEY
+            ),
+            config.LLM_EMBEDDING_MODEL,
+            operation="embedding",
+            # Sent explicitly so that single and batched query embeddings never depend on the client's defaults
+            query_task_type=QUERY_TASK_TYPE,
         )
 
         self.answer_prompt = PromptTemplate.from_template(self.answer_generation_prompt)
+        self.retrieval_paths = Counter({"lexical": 0, "hybrid": 0, "vector": 0, "lexical_fallback": 0})
+
+    def warm_up(self):
+        """Prompts and model clients are built in the constructor; this also loads the context tokenizer."""
+        count_tokens(self.answer_generation_prompt)
 
     def _load_prompt(self, filename: str) -> str:
         try:
@@ -49,48 +74,102 @@ class QCMVisionAnalysisService:
         except Exception as e:
             raise IOError(f"Error loading prompt file '{filename}': {e}")
 
-    def analyze_qcm_complete(self, image_path: str, context_doc_ids: List[str]) -> Dict:
+    async def analyze_qcm_complete(self, image_bytes: bytes, context_doc_ids: List[str]) -> Dict:
+        """Runs the complete pipeline and returns the final result."""
+        result = None
+        async for event in self.stream_qcm_analysis(image_bytes, context_doc_ids):
+            if event["event"] == "done":
+                result = event["data"]
+        return result
+
+    async def stream_qcm_analysis(self, image_bytes: bytes, context_doc_ids: List[str]) -> AsyncIterator[Dict]:
+        """
+        Runs vision extraction, retrieval and answer generation, yielding each result
+        as soon as it is available: `question`, `context`, one `token` event per
+        streamed answer fragment and finally `done` with the complete result.
+        """
         total_start = time.time()
+        budget = RequestBudget(config.REQUEST_BUDGET_SECONDS)
 
         if config.LOG_TIMINGS:
             logger.info("[qcm-ANALYSIS] === STARTING COMPLETE ANALYSIS ===")
-            logger.info(f"[qcm-ANALYSIS] Image: {image_path}")
+            logger.info(f"[qcm-ANALYSIS] Image: {len(image_bytes)} bytes")
             logger.info(f"[qcm-ANALYSIS] Selected context: {context_doc_ids}")
 
         if config.LOG_TIMINGS:
             logger.info("[VISION] === STEP 1: VISION EXTRACTION ===")
 
+        # Retrieval started from the streamed question while the model is still writing the options
+        speculative: Dict = {}
+        on_question = None
+        if config.SPECULATIVE_RETRIEVAL:
+            def on_question(early_question: str):
+                if len(early_question.strip()) < config.MIN_QUESTION_LENGTH:
+                    return
+                task = asyncio.create_task(self._retrieve_context(early_question, context_doc_ids, budget))
+                task.add_done_callback(lambda _: speculative.update(finished=time.time()))
+                speculative.update(question=early_question, started=time.time(), task=task)
+
         vision_start = time.time()
-        qcm_data = self._extract_qcm_from_image(image_path)
-        vision_time = time.time() - vision_start
+        try:
+            qcm_data = await self._extract_qcm_from_image(image_bytes, budget, on_question)
+            vision_end = time.time()
+            vision_time = vision_end - vision_start
 
-        if not qcm_data:
-            raise ValueError("Failed to extract qcm from the image")
+            if not qcm_data:
+                raise ValueError("Failed to extract qcm from the image")
 
-        question = qcm_data['question']
-        options = qcm_data['options']
+            question = qcm_data['question']
+            options = qcm_data['options']
 
-        if config.LOG_TIMINGS:
-            logger.info(f"[VISION] Finished in {vision_time:.2f}s")
-            logger.info(f"[VISION] Extracted question: {question[:100]}...")
-            logger.info(f"[VISION] Options: {[opt[:50] + '...' if len(opt) > 50 else opt for opt in options]}")
+            if config.LOG_TIMINGS:
+                logger.info(f"[VISION] Finished in {vision_time:.2f}s")
+                logger.info(f"[VISION] Extracted question: {question[:100]}...")
+                logger.info(f"[VISION] Options: {[opt[:50] + '...' if len(opt) > 50 else opt for opt in options]}")
 
-        if config.LOG_TIMINGS:
-            logger.info("[RAG] === STEP 2: CONTEXT RETRIEVAL ===")
+            yield {"event": "question", "data": {"extracted_question": question, "options": options}}
 
-        rag_start = time.time()
-        context_text = self._retrieve_context(question, context_doc_ids)
-        rag_time = time.time() - rag_start
+            if config.LOG_TIMINGS:
+                logger.info("[RAG] === STEP 2: CONTEXT RETRIEVAL ===")
+
+            rag_start = time.time()
+            overlap_time = 0.0
+            task = speculative.pop("task", None)
+            if task is not None and speculative["question"].strip() == question.strip():
+                context_text = await task
+                overlap_time = max(0.0, min(speculative.get("finished", time.time()), vision_end) - speculative["started"])
+                SPECULATIVE_RETRIEVALS.labels(result="used").inc()
+            else:
+                if task is not None:
+                    # The validated question is not the one retrieval started from
+                    self._discard(task)
+                    SPECULATIVE_RETRIEVALS.labels(result="cancelled").inc()
+                    logger.info("[RAG] Question changed after streaming, speculative retrieval cancelled.")
+                context_text = await self._retrieve_context(question, context_doc_ids, budget)
+            rag_time = time.time() - rag_start
+        finally:
+            if "task" in speculative:
+                self._discard(speculative["task"])
 
         if config.LOG_TIMINGS:
-            logger.info(f"[RAG] Finished in {rag_time:.2f}s")
+            logger.info(f"[RAG] Finished in {rag_time:.2f}s ({overlap_time:.2f}s overlapped with vision)")
             logger.info(f"[RAG] Retrieved context: {len(context_text)} characters")
 
+        yield {"event": "context", "data": {"retrieved_context": context_text}}
+
         if config.LOG_TIMINGS:
             logger.info("[ANSWER] === STEP 3: ANSWER GENERATION ===")
 
         answer_start = time.time()
-        answer = self._generate_answer(question, options, context_text)
+        first_token_time = None
+        answer_parts = []
+        # A failed generation propagates as a ModelCallError so that the API reports it with a proper status
+        async for token in self._stream_answer(question, options, context_text, budget):
+            if first_token_time is None:
+                first_token_time = time.time() - answer_start
+            answer_parts.append(token)
+            yield {"event": "token", "data": {"text": token}}
+        answer = "".join(answer_parts).strip()
         answer_time = time.time() - answer_start
 
         if config.LOG_TIMINGS:
@@ -107,7 +186,10 @@ class QCMVisionAnalysisService:
             "timings": {
                 "vision_time": round(vision_time, 2),
                 "rag_time": round(rag_time, 2),
+                # Retrieval work done while the vision model was still generating, saved from the total
+                "retrieval_overlap_time": round(overlap_time, 2),
                 "answer_time": round(answer_time, 2),
+                "answer_first_token_time": round(first_token_time or answer_time, 2),
                 "total_time": round(total_time, 2)
             }
         }
@@ -118,110 +200,347 @@ class QCMVisionAnalysisService:
             logger.info(
                 f"[qcm-ANALYSIS] Breakdown: Vision({vision_time:.1f}s) + RAG({rag_time:.1f}s) + Answer({answer_time:.1f}s)")
 
-        return result
+        # Only sent once the answer is complete: a generation failing mid-stream raises instead, after the
+        # tokens already yielded, and the caller reports the failure rather than a partial result
+        yield {"event": "done", "data": result}
+
+    @staticmethod
+    def _discard(task: asyncio.Task):
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Retrieved so that asyncio does not report it as never retrieved
+            task.exception()
+
+    def is_cacheable_result(self, result: Dict) -> bool:
+        """Answers produced after a failed retrieval or generation step must not be reused."""
+        return result["answer"] != ANSWER_ERROR_MESSAGE and result["retrieved_context"] != CONTEXT_ERROR_MESSAGE
+
+    async def analyze_qcm_batch(self, images: List[bytes], context_doc_ids: List[str]) -> Dict:
+        """
+        Solves every question found in several images, each of which may contain
+        several questions. There is one vision call per image and one batched
+        embedding call for all questions. Answers are generated concurrently.
+        """
+        total_start = time.time()
+        budget = RequestBudget(config.REQUEST_BUDGET_SECONDS)
+        limit = asyncio.Semaphore(config.BATCH_MAX_CONCURRENCY)
 
-    def _extract_qcm_from_image(self, image_path: str) -> Optional[Dict]:
+        async def extract(index: int, image_bytes: bytes):
+            async with limit:
+                try:
+                    return index, await self._extract_qcm_batch_from_image(image_bytes, budget), None
+                except Exception as e:
+                    logger.error(f"[BATCH] Vision extraction error on image {index}: {e}")
+                    return index, [], e
+
+        vision_start = time.time()
+        extractions = await asyncio.gather(*(extract(i, image) for i, image in enumerate(images)))
+        vision_time = time.time() - vision_start
+
+        questions = []
+        errors = []
+        for image_index, qcms, error in extractions:
+            if error or not qcms:
+                errors.append({"image_index": image_index,
+                               "detail": str(error) if error else "No question could be extracted."})
+            for question_index, qcm in enumerate(qcms):
+                questions.append({"image_index": image_index, "question_index": question_index, **qcm})
+        questions = questions[:config.BATCH_MAX_QUESTIONS]
+
+        # When the vision model itself is down or out of time for every image, report it as such
+        model_errors = [error for _, _, error in extractions if isinstance(error, ModelCallError)]
+        if not questions and model_errors and len(model_errors) == len(images):
+            raise model_errors[0]
+
+        if config.LOG_TIMINGS:
+            logger.info(f"[BATCH] {len(questions)} questions extracted from {len(images)} images in {vision_time:.2f}s")
+
+        rag_start = time.time()
+        lexical = await asyncio.gather(*(self._lexical_candidates(q["question"], context_doc_ids) for q in questions))
+        to_embed = [
+            i for i, qcm in enumerate(questions) if not self._is_lexical_match_confident(qcm["question"], lexical[i])
+        ]
         try:
-            image = Image.open(image_path)
-            buffer = BytesIO()
-            image.save(buffer, format="PNG")
-            image_b64 = base64.b64encode(buffer.getvalue()).decode()
-            if config.LOG_TIMINGS:
-                logger.info(f"[VISION] Image loaded: {image.size} pixels")
-
-            message = HumanMessage(
-                content=[
-                    {
-                        "type": "text",
-                        "text": self.vision_extraction_prompt,
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": f"data:image/png;base64,{image_b64}"
-                    },
-                ]
-            )
+            texts = [questions[i]["question"] for i in to_embed]
+            with observe_stage("embedding"):
+                vectors = await self.embeddings_model.aembed_queries(texts, budget) if texts else []
+            embeddings = dict(zip(to_embed, vectors))
+        except Exception as e:
+            logger.error(f"[BATCH] Error embedding questions: {e}")
+            embeddings = None
+
+        async def retrieve(index: int) -> str:
+            if index not in to_embed:
+                return self._build_context(self._fuse([], lexical[index]), "lexical")
+            if embeddings is None:
+                if lexical[index]:
+                    return self._build_context(self._fuse([], lexical[index]), "lexical_fallback")
+                return CONTEXT_ERROR_MESSAGE
+            async with limit:
+                try:
+                    return await self._search_context(embeddings[index], context_doc_ids, lexical[index])
+                except Exception as e:
+                    logger.error(f"Error retrieving context: {e}")
+                    return CONTEXT_ERROR_MESSAGE
+
+        contexts = await asyncio.gather(*(retrieve(i) for i in range(len(questions))))
+        rag_time = time.time() - rag_start
 
-            logger.info("[VISION] Calling Gemini Vision via LangChain...")
-            response = self.vision_llm.invoke([message])
-            response_text = response.content.strip()
+        async def answer(qcm: Dict, context: str) -> str:
+            async with limit:
+                try:
+                    return await self._generate_answer(qcm["question"], qcm["options"], context, budget)
+                except ModelCallError as e:
+                    errors.append({"image_index": qcm["image_index"], "question_index": qcm["question_index"],
+                                   "detail": str(e)})
+                    return ANSWER_ERROR_MESSAGE
 
-            if config.LOG_GEMINI_RESPONSES:
-                logger.info(f"[VISION] Raw Gemini response ({len(response_text)} chars):")
-                logger.info(f"[VISION] {response_text}")
+        answer_start = time.time()
+        answers = await asyncio.gather(*(answer(q, c) for q, c in zip(questions, contexts)))
+        answer_time = time.time() - answer_start
 
-            cleaned_response = self._clean_json_response(response_text)
-            qcm_data = json.loads(cleaned_response)
+        results = [
+            {
+                "image_index": qcm["image_index"],
+                "question_index": qcm["question_index"],
+                "extracted_question": qcm["question"],
+                "options": qcm["options"],
+                "answer": answer_text,
+                "retrieved_context": context,
+            }
+            for qcm, context, answer_text in zip(questions, contexts, answers)
+        ]
+        total_time = time.time() - total_start
+
+        if config.LOG_TIMINGS:
+            logger.info(
+                f"[BATCH] {len(results)} answers in {total_time:.2f}s: "
+                f"Vision({vision_time:.1f}s) + RAG({rag_time:.1f}s) + Answer({answer_time:.1f}s)")
+
+        return {
+            "results": results,
+            "errors": errors,
+            "timings": {
+                "vision_time": round(vision_time, 2),
+                "rag_time": round(rag_time, 2),
+                "answer_time": round(answer_time, 2),
+                "total_time": round(total_time, 2)
+            }
+        }
+
+    async def _extract_qcm_from_image(self, image_bytes: bytes, budget: Optional[RequestBudget] = None,
+                                      on_question: Optional[Callable[[str], None]] = None) -> Optional[Dict]:
+        try:
+            qcm_data = await self._invoke_vision(image_bytes, self.vision_extraction_prompt, budget, on_question)
 
             if not self._validate_qcm_data(qcm_data):
+                ERRORS.labels(stage="vision_validation").inc()
                 return None
 
             return qcm_data
 
+        except ModelCallError:
+            raise
         except Exception as e:
             logger.error(f"Vision extraction error: {e}")
             return None
 
-    def _retrieve_context(self, question: str, context_doc_ids: List[str]) -> str:
+    async def _extract_qcm_batch_from_image(self, image_bytes: bytes,
+                                            budget: Optional[RequestBudget] = None) -> List[Dict]:
+        """Extracts every question of a (possibly multi-question) image in a single vision call."""
+        qcm_data = await self._invoke_vision(image_bytes, self.batch_vision_extraction_prompt, budget)
+        return self._validate_qcm_batch(qcm_data)
+
+    async def _invoke_vision(self, image_bytes: bytes, prompt: str, budget: Optional[RequestBudget] = None,
+                             on_question: Optional[Callable[[str], None]] = None) -> Dict:
+        """Extracts the QCM JSON; with `on_question`, the response is streamed and the callback
+        receives the question as soon as it is complete, before the options are generated."""
+        with observe_stage("image_preprocessing"):
+            image = await asyncio.to_thread(preprocess_image, image_bytes)
+        if config.LOG_TIMINGS:
+            logger.info(
+                f"[VISION] Image prepared: {image.original_size} -> {image.size} pixels, "
+                f"{image.original_bytes} -> {len(image.data)} bytes ({image.mime_type}, "
+                f"{'re-encoded' if image.reencoded else 'passed through'})")
+
+        message = HumanMessage(
+            content=[
+                {
+                    "type": "text",
+                    "text": prompt,
+                },
+                {
+                    "type": "image_url",
+                    "image_url": image.to_data_url()
+                },
+            ]
+        )
+
+        logger.info("[VISION] Calling Gemini Vision via LangChain...")
+        with observe_stage("vision"):
+            if on_question is None:
+                response = await model_call_service.call("vision", lambda: self.vision_llm.ainvoke([message]), budget)
+                response_text = response.content.strip()
+            else:
+                response_text = (await self._stream_vision(message, budget, on_question)).strip()
+
+        if config.LOG_GEMINI_RESPONSES:
+            logger.info(f"[VISION] Raw Gemini response ({len(response_text)} chars):")
+            logger.info(f"[VISION] {response_text}")
+
+        cleaned_response = self._clean_json_response(response_text)
+        return json.loads(cleaned_response)
+
+    async def _stream_vision(self, message: HumanMessage, budget: Optional[RequestBudget],
+                             on_question: Callable[[str], None]) -> str:
+        parts = []
+        question = None
+        async for chunk in model_call_service.stream("vision", lambda: self.vision_llm.astream([message]), budget):
+            parts.append(chunk.content)
+            if question is None:
+                question = complete_string_field("".join(parts), "question")
+                if question is not None:
+                    on_question(question)
+        return "".join(parts)
+
+    async def _retrieve_context(self, question: str, context_doc_ids: List[str],
+                                budget: Optional[RequestBudget] = None) -> str:
         try:
+            lexical = await self._lexical_candidates(question, context_doc_ids)
+            if self._is_lexical_match_confident(question, lexical):
+                return self._build_context(self._fuse([], lexical), "lexical")
+
             logger.info(f"[RAG] Generating embedding for: {question[:100]}...")
 
-            query_embedding = self.embeddings_model.embed_query(question)
+            try:
+                with observe_stage("embedding"):
+                    query_embedding = await self.embeddings_model.aembed_query(question, budget)
+            except ModelCallError as e:
+                if not lexical:
+                    raise
+                # Lexical matches are a weaker context than a hybrid search, but better than no answer
+                logger.error(f"[RAG] Embedding unavailable ({e}), falling back to lexical matches.")
+                return self._build_context(self._fuse([], lexical), "lexical_fallback")
+            return await self._search_context(query_embedding, context_doc_ids, lexical)
+
+        except ModelCallError:
+            raise
+        except Exception as e:
+            logger.error(f"Error retrieving context: {e}")
+            return CONTEXT_ERROR_MESSAGE
+
+    async def _lexical_candidates(self, question: str, context_doc_ids: List[str]) -> List[LexicalMatch]:
+        if not config.LEXICAL_INDEX_ENABLED:
+            return []
+        with observe_stage("lexical_query"):
+            return await asyncio.to_thread(
+                lexical_index_service.search, question, config.RETRIEVAL_CANDIDATES, context_doc_ids
+            )
+
+    def _is_lexical_match_confident(self, question: str, lexical: List[LexicalMatch]) -> bool:
+        """The embedding call can be skipped when one chunk contains nearly all of the question's rare terms."""
+        return (
+            config.LEXICAL_FAST_PATH
+            and bool(lexical)
+            and lexical[0].matched_terms >= config.LEXICAL_FAST_PATH_MIN_TERMS
+            and lexical[0].coverage >= config.LEXICAL_FAST_PATH_MIN_COVERAGE
+        )
 
-            logger.info(f"[RAG] Searching in documents: {context_doc_ids}")
-            context_chunks = vector_store_service.query(
+    async def _search_context(self, query_embedding: List[float], context_doc_ids: List[str],
+                              lexical: Optional[List[LexicalMatch]] = None) -> str:
+        logger.info(f"[RAG] Searching in documents: {context_doc_ids}")
+        with observe_stage("vector_query"):
+            matches = await asyncio.to_thread(
+                vector_store_service.search,
                 query_embedding,
-                n_results=config.RAG_CHUNKS_COUNT,
+                n_results=config.RETRIEVAL_CANDIDATES,
                 context_doc_ids=context_doc_ids
             )
 
-            logger.info(f"[RAG] {len(context_chunks)} chunks retrieved")
-
-            if config.LOG_RAG_CHUNKS and context_chunks:
-                for i, chunk in enumerate(context_chunks, 1):
-                    logger.info(f"[RAG] Chunk {i}: {chunk[:200]}...")
-
-            if not context_chunks:
-                return "No relevant context found in the selected documents."
+        if config.HYBRID_RETRIEVAL and lexical:
+            return self._build_context(self._fuse(matches, lexical), "hybrid")
+        return self._build_context(self._fuse(matches, []), "vector")
+
+    def _fuse(self, matches: List[Dict], lexical: List[LexicalMatch]) -> List[ContextCandidate]:
+        """Ranks vector and lexical hits together, keeping the vector distance for thresholding."""
+        texts = {match.chunk_id: match.text for match in lexical}
+        texts.update((match["id"], match["text"]) for match in matches)
+        distances = {match["id"]: match["distance"] for match in matches}
+        rankings = [ranking for ranking in ([m["id"] for m in matches], [m.chunk_id for m in lexical]) if ranking]
+        return [
+            ContextCandidate(chunk_id=chunk_id, text=texts[chunk_id], relevance=score,
+                             distance=distances.get(chunk_id))
+            for chunk_id, score in reciprocal_rank_fusion(rankings, k=config.RRF_K)
+        ]
+
+    def _build_context(self, candidates: List[ContextCandidate], path: str) -> str:
+        self.retrieval_paths[path] += 1
+        RETRIEVAL_PATHS.labels(path=path).inc()
+        context_chunks = assemble_context(
+            candidates,
+            max_chunks=config.RAG_CHUNKS_COUNT,
+            max_tokens=config.MAX_CONTEXT_TOKENS,
+            similarity_threshold=config.RAG_SIMILARITY_THRESHOLD,
+            mmr_lambda=config.RAG_MMR_LAMBDA,
+            max_overlap=CHUNK_OVERLAP * 2,
+        )
+        logger.info(f"[RAG] {len(context_chunks)} context blocks retrieved ({path} path)")
 
-            context = "\n\n---\n\n".join(context_chunks)
+        if config.LOG_RAG_CHUNKS and context_chunks:
+            for i, chunk in enumerate(context_chunks, 1):
+                logger.info(f"[RAG] Chunk {i}: {chunk[:200]}...")
 
-            if len(context) > config.MAX_CONTEXT_CHARS:
-                context = context[:config.MAX_CONTEXT_CHARS] + "\n\n[... context truncated ...]"
-                logger.info(f"[RAG] Context truncated to {config.MAX_CONTEXT_CHARS} chars")
+        if not context_chunks:
+            return "No relevant context found in the selected documents."
 
-            return context
+        return "\n\n---\n\n".join(context_chunks)
 
-        except Exception as e:
-            logger.error(f"Error retrieving context: {e}")
-            return "Error while retrieving context."
+    def retrieval_stats(self) -> Dict:
+        """How often each retrieval path was taken since startup."""
+        total = sum(self.retrieval_paths.values())
+        return {
+            "paths": dict(self.retrieval_paths),
+            "lexical_fast_path_rate": round(self.retrieval_paths["lexical"] / total, 4) if total else 0.0,
+            "lexical_index_chunks": lexical_index_service.count(),
+        }
 
-    def _generate_answer(self, question: str, options: List[str], context: str) -> str:
-        try:
-            options_text = "\n".join([f"{i + 1}. {opt}" for i, opt in enumerate(options)])
+    def _build_answer_input(self, question: str, options: List[str], context: str) -> Dict:
+        options_text = "\n".join([f"{i + 1}. {opt}" for i, opt in enumerate(options)])
+        return {
+            "question": question,
+            "options": options_text,
+            "context": context
+        }
 
-            prompt_input = {
-                "question": question,
-                "options": options_text,
-                "context": context
-            }
+    async def _stream_answer(self, question: str, options: List[str], context: str,
+                             budget: Optional[RequestBudget] = None) -> AsyncIterator[str]:
+        prompt_input = self._build_answer_input(question, options, context)
 
-            logger.info("[ANSWER] Generating answer via LLM...")
+        logger.info("[ANSWER] Generating answer via LLM...")
 
-            chain = self.answer_prompt | self.llm
-            response = chain.invoke(prompt_input)
+        chain = self.answer_prompt | self.llm
+        with observe_stage("answer"):
+            async for chunk in model_call_service.stream("answer", lambda: chain.astream(prompt_input), budget):
+                if chunk.content:
+                    yield chunk.content
 
-            answer = response.content.strip()
+        if config.LOG_GEMINI_RESPONSES:
+            logger.info(f"[ANSWER] Prompt sent: {question}")
 
-            if config.LOG_GEMINI_RESPONSES:
-                logger.info(f"[ANSWER] Prompt sent: {question}")
-                logger.info(f"[ANSWER] LLM Answer: {answer}")
+    async def _generate_answer(self, question: str, options: List[str], context: str,
+                               budget: Optional[RequestBudget] = None) -> str:
+        chain = self.answer_prompt | self.llm
+        prompt_input = self._build_answer_input(question, options, context)
+        with observe_stage("answer"):
+            response = await model_call_service.call("answer", lambda: chain.ainvoke(prompt_input), budget)
+        answer = response.content.strip()
 
-            return answer
+        if config.LOG_GEMINI_RESPONSES:
+            logger.info(f"[ANSWER] Prompt sent: {question}")
+            logger.info(f"[ANSWER] LLM Answer: {answer}")
 
-        except Exception as e:
-            logger.error(f"Error generating answer: {e}")
-            return "Error during answer generation."
+        return answer
 
     def _clean_json_response(self, response: str) -> str:
         response = response.strip()
@@ -244,6 +563,17 @@ class QCMVisionAnalysisService:
 
         return response
 
+    def _validate_qcm_batch(self, qcm_data: Dict) -> List[Dict]:
+        """Returns the valid questions of a multi-question extraction (or of a single-question one)."""
+        if not isinstance(qcm_data, dict):
+            logger.info("[VALIDATION] Error: not a JSON object")
+            return []
+        items = qcm_data.get("questions", [qcm_data])
+        if not isinstance(items, list):
+            logger.info("[VALIDATION] Error: 'questions' is not a list")
+            return []
+        return [item for item in items if isinstance(item, dict) and self._validate_qcm_data(item)]
+
     def _validate_qcm_data(self, qcm_data: Dict) -> bool:
         try:
             if 'question' not in qcm_data or 'options' not in qcm_data:
@@ -270,5 +600,3 @@ class QCMVisionAnalysisService:
             logger.error(f"[VALIDATION] Error: {e}")
             return False
 
-
-qcm_vision_analysis_service = QCMVisionAnalysisService()
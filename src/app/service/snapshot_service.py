@@ -0,0 +1,307 @@
+"""Knowledge base snapshots, to bootstrap an instance without re-ingesting its PDFs.
+
+A snapshot is a zip archive of columns: the embeddings as one contiguous
+little-endian float32 matrix, and the chunk ids, texts and JSON metadata as
+UTF-8 blobs with an int64 offsets array each. `manifest.json` describes the
+documents (their catalog rows), the embedding model and dimension, and the
+SHA-256 of every column, all checked before anything is imported.
+
+Chunks are loaded with bulk inserts into the vector store and its derived
+indexes. The CLI opens the stores in-process, so it must not run while a
+server uses the same `DB_DIR`:
+
+    PYTHONPATH=. python -m src.app.service.snapshot_service export kb.snapshot [--doc-id ID ...]
+    PYTHONPATH=. python -m src.app.service.snapshot_service import kb.snapshot [--replace]
+"""
+import argparse
+import hashlib
+import json
+import shutil
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.service.document_catalog_service import STATUS_READY, document_catalog_service
+from src.app.service.vector_store_service import vector_store_service
+
+SNAPSHOT_FORMAT = "flashanswer-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+EMBEDDINGS = "embeddings.f32"
+STRING_COLUMNS = ("ids", "texts", "metadatas")
+# Chunks written to the store per bulk insert
+IMPORT_BATCH_SIZE = 1000
+# Catalog columns carried by a snapshot
+DOCUMENT_FIELDS = ("doc_id", "name", "chunk_count", "byte_size", "page_count", "file_hash", "text_hash")
+
+
+class SnapshotError(Exception):
+    """A snapshot that cannot be exported or imported, with the HTTP status describing why."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class IncompatibleSnapshotError(SnapshotError):
+    """The snapshot's embeddings come from another model than the one this instance queries with."""
+
+    def __init__(self, message: str):
+        super().__init__(message, status_code=409)
+
+
+class _ColumnWriter:
+    """Appends values to a column file while hashing it."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.handle = open(path, "wb")
+        self.digest = hashlib.sha256()
+        self.offsets = [0]
+
+    def write(self, data: bytes):
+        self.handle.write(data)
+        self.digest.update(data)
+
+    def append(self, value: str):
+        data = value.encode("utf-8")
+        self.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self) -> dict:
+        self.handle.close()
+        return {"sha256": self.digest.hexdigest(), "bytes": self.path.stat().st_size}
+
+
+class SnapshotService:
+    """Exports and imports the chunks, embeddings and catalog rows of ready documents."""
+
+    # --- Export ----------------------------------------------------------------
+
+    def export(self, path: str, doc_ids: Optional[list[str]] = None) -> dict:
+        """Writes the given documents (all ready documents by default) to a snapshot file."""
+        if doc_ids:
+            documents = []
+            for doc_id in dict.fromkeys(doc_ids):
+                document = document_catalog_service.get(doc_id)
+                if document is None or document["status"] != STATUS_READY:
+                    raise SnapshotError(f"Document {doc_id} not found.", status_code=404)
+                documents.append(document)
+        else:
+            documents = document_catalog_service.list_documents()
+
+        start = time.perf_counter()
+        workdir = Path(tempfile.mkdtemp(prefix="snapshot-", dir=Path(path).resolve().parent))
+        try:
+            embeddings = _ColumnWriter(workdir / EMBEDDINGS)
+            columns = {name: _ColumnWriter(workdir / f"{name}.bin") for name in STRING_COLUMNS}
+            dim = 0
+            exported = []
+            for document in documents:
+                records = vector_store_service.get_document_records(document["doc_id"])
+                if not records["ids"]:
+                    continue
+                matrix = np.asarray(records["embeddings"], dtype="<f4")
+                if dim and matrix.shape[1] != dim:
+                    raise SnapshotError(f"Document {document['doc_id']} has {matrix.shape[1]}-dimensional "
+                                        f"embeddings, the others {dim}.", status_code=500)
+                dim = matrix.shape[1]
+                embeddings.write(np.ascontiguousarray(matrix).tobytes())
+                for chunk_id, text, metadata in zip(records["ids"], records["documents"], records["metadatas"]):
+                    columns["ids"].append(chunk_id)
+                    columns["texts"].append(text)
+                    columns["metadatas"].append(json.dumps(metadata, ensure_ascii=False))
+                exported.append({**{field: document[field] for field in DOCUMENT_FIELDS},
+                                 "chunk_count": len(records["ids"])})
+
+            files = {EMBEDDINGS: embeddings.close()}
+            for name, column in columns.items():
+                files[f"{name}.bin"] = column.close()
+                offsets = np.asarray(column.offsets, dtype="<i8").tobytes()
+                (workdir / f"{name}.offsets").write_bytes(offsets)
+                files[f"{name}.offsets"] = {"sha256": hashlib.sha256(offsets).hexdigest(), "bytes": len(offsets)}
+            manifest = {
+                "format": SNAPSHOT_FORMAT,
+                "version": SNAPSHOT_VERSION,
+                "created_at": time.time(),
+                "embedding_model": config.LLM_EMBEDDING_MODEL,
+                "dim": dim,
+                "chunk_count": len(columns["ids"].offsets) - 1,
+                "documents": exported,
+                "files": files,
+            }
+            with zipfile.ZipFile(path, "w") as archive:
+                archive.writestr(MANIFEST, json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+                # Embeddings do not compress; texts and metadata do
+                archive.write(workdir / EMBEDDINGS, EMBEDDINGS, compress_type=zipfile.ZIP_STORED)
+                for name in files:
+                    if name != EMBEDDINGS:
+                        archive.write(workdir / name, name, compress_type=zipfile.ZIP_DEFLATED)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        summary = {"documents": len(exported), "chunk_count": manifest["chunk_count"], "dim": dim,
+                   "bytes": Path(path).stat().st_size, "seconds": round(time.perf_counter() - start, 3)}
+        logger.info(f"[SNAPSHOT] Exported {summary}")
+        return summary
+
+    # --- Import ----------------------------------------------------------------
+
+    def read_manifest(self, path: str) -> dict:
+        """Checks a snapshot against its manifest and this instance, and returns the manifest."""
+        try:
+            with zipfile.ZipFile(path) as archive:
+                manifest = json.loads(archive.read(MANIFEST))
+                if manifest.get("format") != SNAPSHOT_FORMAT:
+                    raise SnapshotError("Not a knowledge base snapshot.")
+                if manifest.get("version") != SNAPSHOT_VERSION:
+                    raise SnapshotError(f"Unsupported snapshot version {manifest.get('version')}.")
+                self._check_compatibility(manifest)
+                self._check_integrity(archive, manifest)
+        except (zipfile.BadZipFile, KeyError, json.JSONDecodeError) as e:
+            raise SnapshotError(f"Corrupted snapshot: {e}")
+        return manifest
+
+    @staticmethod
+    def _check_compatibility(manifest: dict):
+        if manifest["embedding_model"] != config.LLM_EMBEDDING_MODEL:
+            raise IncompatibleSnapshotError(
+                f"The snapshot was embedded with {manifest['embedding_model']}, "
+                f"this instance uses {config.LLM_EMBEDDING_MODEL}."
+            )
+        dim = vector_store_service.embedding_dimension()
+        if dim and manifest["chunk_count"] and manifest["dim"] != dim:
+            raise IncompatibleSnapshotError(
+                f"The snapshot has {manifest['dim']}-dimensional embeddings, the store {dim}-dimensional ones."
+            )
+
+    @staticmethod
+    def _check_integrity(archive: zipfile.ZipFile, manifest: dict):
+        for name, expected in manifest["files"].items():
+            digest = hashlib.sha256()
+            size = 0
+            # Reading a member to the end also checks its zip CRC
+            with archive.open(name) as handle:
+                for block in iter(lambda: handle.read(1024 * 1024), b""):
+                    digest.update(block)
+                    size += len(block)
+            if digest.hexdigest() != expected["sha256"] or size != expected["bytes"]:
+                raise SnapshotError(f"Corrupted snapshot: {name} does not match its checksum.")
+
+        count = manifest["chunk_count"]
+        if manifest["files"][EMBEDDINGS]["bytes"] != count * manifest["dim"] * 4:
+            raise SnapshotError("Corrupted snapshot: the embedding matrix does not hold one row per chunk.")
+        if sum(document["chunk_count"] for document in manifest["documents"]) != count:
+            raise SnapshotError("Corrupted snapshot: document chunk counts do not add up.")
+        for name in STRING_COLUMNS:
+            offsets = np.frombuffer(archive.read(f"{name}.offsets"), dtype="<i8")
+            if len(offsets) != count + 1 or offsets[-1] != manifest["files"][f"{name}.bin"]["bytes"] \
+                    or np.any(np.diff(offsets) < 0):
+                raise SnapshotError(f"Corrupted snapshot: invalid {name} offsets.")
+
+    def import_snapshot(self, path: str, replace: bool = False) -> dict:
+        """Loads a snapshot into the store with bulk inserts.
+
+        Documents already present (same doc_id, or same file for another doc_id)
+        are skipped, unless `replace` is set, in which case a document with the
+        same doc_id is deleted first. Importing the same snapshot again after an
+        interruption completes it.
+        """
+        manifest = self.read_manifest(path)
+        start = time.perf_counter()
+        selected, skipped = set(), []
+        for document in manifest["documents"]:
+            doc_id = document["doc_id"]
+            existing = document_catalog_service.get(doc_id)
+            ready = existing is not None and existing["status"] == STATUS_READY
+            duplicate = document["file_hash"] and document_catalog_service.find(file_hash=document["file_hash"])
+            if ready and replace:
+                vector_store_service.delete_document(doc_id)
+            elif ready or (duplicate and duplicate["doc_id"] != doc_id):
+                skipped.append(doc_id)
+                continue
+            selected.add(doc_id)
+            document_catalog_service.begin(doc_id, document["name"], document["file_hash"], document["byte_size"])
+
+        imported_chunks = 0
+        with zipfile.ZipFile(path) as archive:
+            for ids, texts, metadatas, embeddings in self._iter_batches(archive, manifest):
+                keep = [i for i, metadata in enumerate(metadatas) if metadata.get("doc_id") in selected]
+                if not keep:
+                    continue
+                vector_store_service.add_documents(
+                    [texts[i] for i in keep], embeddings[keep], [metadatas[i] for i in keep], [ids[i] for i in keep]
+                )
+                imported_chunks += len(keep)
+
+        for document in manifest["documents"]:
+            if document["doc_id"] in selected:
+                document_catalog_service.complete(
+                    document["doc_id"], document["chunk_count"], document["page_count"], document["text_hash"]
+                )
+        summary = {"documents": len(selected), "chunk_count": imported_chunks, "skipped": skipped,
+                   "seconds": round(time.perf_counter() - start, 3)}
+        logger.info(f"[SNAPSHOT] Imported {summary}")
+        return summary
+
+    @staticmethod
+    def _iter_batches(archive: zipfile.ZipFile, manifest: dict) -> Iterator[tuple]:
+        """Yields (ids, texts, metadatas, embeddings) batches, reading every column sequentially."""
+        count, dim = manifest["chunk_count"], manifest["dim"]
+        offsets = {name: np.frombuffer(archive.read(f"{name}.offsets"), dtype="<i8") for name in STRING_COLUMNS}
+        handles = {name: archive.open(f"{name}.bin") for name in STRING_COLUMNS}
+        try:
+            with archive.open(EMBEDDINGS) as matrix:
+                for start in range(0, count, IMPORT_BATCH_SIZE):
+                    end = min(count, start + IMPORT_BATCH_SIZE)
+                    columns = {}
+                    for name, handle in handles.items():
+                        bounds = offsets[name][start:end + 1]
+                        blob = handle.read(int(bounds[-1] - bounds[0]))
+                        columns[name] = [
+                            blob[a - bounds[0]:b - bounds[0]].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])
+                        ]
+                    embeddings = np.frombuffer(matrix.read((end - start) * dim * 4), dtype="<f4").reshape(-1, dim)
+                    yield (columns["ids"], columns["texts"], [json.loads(m) for m in columns["metadatas"]],
+                           embeddings.astype(np.float32))
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+
+snapshot_service = SnapshotService()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a knowledge base snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write ready documents to a snapshot file.")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--doc-id", action="append", dest="doc_ids", help="Only this document (repeatable).")
+    import_parser = commands.add_parser("import", help="Load a snapshot file into the store.")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--replace", action="store_true", help="Replace documents that already exist.")
+    args = parser.parse_args()
+
+    document_catalog_service.initialize()
+    from src.app.service.lexical_index_service import lexical_index_service
+
+    lexical_index_service.initialize()
+    vector_store_service.initialize()
+    try:
+        if args.command == "export":
+            print(json.dumps(snapshot_service.export(args.path, args.doc_ids)))
+        else:
+            print(json.dumps(snapshot_service.import_snapshot(args.path, replace=args.replace)))
+    except SnapshotError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
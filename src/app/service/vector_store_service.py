@@ -1,77 +1,560 @@
-import chromadb
+import hashlib
+import heapq
+import itertools
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional
+from urllib.parse import urlparse
 
 from src.app import config
 from src.app.logger.logger_configuration import logger
+from src.app.metrics import CHUNKS
+from src.app.service.document_catalog_service import document_catalog_service
+from src.app.service.lexical_index_service import lexical_index_service
+from src.app.service.worker_coordination_service import worker_coordination_service
+from src.app.utils.context_utils import chunk_position
+
+if TYPE_CHECKING:
+    from src.app.service.numpy_vector_index import NumpyVectorIndex
+
+
+# Chroma collection names: 3 to 512 characters from [a-zA-Z0-9._-], starting and ending with a letter or digit
+PARTITION_NAME_PATTERN = re.compile(r"[a-zA-Z0-9][a-zA-Z0-9._-]{0,400}[a-zA-Z0-9]")
+
+
+def chunk_id(doc_id: str, index: int) -> str:
+    return f"{doc_id}-{index}"
+
+
+def partition_name(doc_id: str) -> str:
+    """Name of the Chroma collection holding one document's chunks in the partitioned layout."""
+    if PARTITION_NAME_PATTERN.fullmatch(doc_id) and ".." not in doc_id:
+        return f"{config.VECTOR_STORE_COLLECTION}-{doc_id}"
+    return f"{config.VECTOR_STORE_COLLECTION}-{hashlib.sha1(doc_id.encode()).hexdigest()}"
 
 
 class VectorStoreService:
+    """Chunks and embeddings in Chroma, plus the derived indexes kept in sync with them.
+
+    With the "document" partitioning every document gets its own collection: a
+    query restricted to some documents only searches their collections (in
+    parallel, merging the top-k), and deleting a document drops its collection.
+    """
+
     def __init__(self):
         self.client = None
+        # Single layout: the collection holding every chunk
         self.collection = None
+        # Partitioned layout: one collection per document, by doc_id
+        self.partitioned = False
+        self.partitions: dict = {}
+        self._partitions_lock = threading.Lock()
+        self._query_executor: Optional[ThreadPoolExecutor] = None
+        # Optional in-process index answering similarity queries; Chroma stays the system of record
+        self.index: Optional["NumpyVectorIndex"] = None
+        # Reader processes of a multi-worker deployment only query; the writer process owns every write
+        self.read_only = False
+        # Knowledge-base versions, bumped whenever a document's chunks change
+        self.version = 0
+        self.document_versions: dict[str, int] = {}
+        self.listeners: list[Callable[[Optional[str]], None]] = []
+        self._version_lock = threading.Lock()
 
     def initialize(self):
-        db_path = config.CHROMA_DB_PATH
-        self.client = chromadb.PersistentClient(path=str(db_path))
-        self.collection = self.client.get_or_create_collection(name=config.VECTOR_STORE_COLLECTION)
-        logger.info("ChromaDB initialized.")
+        self.read_only = not worker_coordination_service.is_writer
+        self.partitioned = self._partitioning() == "document"
+        if self.read_only:
+            self._initialize_reader()
+            return
 
-    def add_documents(self, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict], ids: list[str]):
-        if self.collection is None:
+        self.client = self._open_client()
+        self._open_collections()
+        self._migrate_layout()
+        logger.info(f"ChromaDB initialized ({len(self.partitions)} partitions)." if self.partitioned
+                    else "ChromaDB initialized.")
+
+        count = self.count()
+        if document_catalog_service.is_empty() and count:
+            self._backfill_catalog()
+
+        if config.LEXICAL_INDEX_ENABLED and lexical_index_service.count() != count:
+            self._rebuild_lexical_index()
+
+        if config.VECTOR_INDEX_BACKEND == "numpy":
+            from src.app.service.numpy_vector_index import NumpyVectorIndex
+
+            self.index = NumpyVectorIndex(config.VECTOR_INDEX_PATH)
+            self.index.open()
+            if self.index.count() != count:
+                self._rebuild_index()
+        elif config.VECTOR_INDEX_BACKEND != "chroma":
+            raise ValueError(f"Unknown vector index backend: {config.VECTOR_INDEX_BACKEND}")
+
+        # Readers that opened their indexes while this process was rebuilding them reload them
+        worker_coordination_service.publish(None)
+
+    def _initialize_reader(self):
+        """Opens the stores for queries only: the NumPy index, or the Chroma server when there is one."""
+        if config.VECTOR_INDEX_BACKEND == "numpy":
+            from src.app.service.numpy_vector_index import NumpyVectorIndex
+
+            self.index = NumpyVectorIndex(config.VECTOR_INDEX_PATH, read_only=True)
+            self.index.open()
+        elif config.VECTOR_STORE_SERVER_URL:
+            self.client = self._open_client()
+            self._open_collections()
+        else:
+            # Only one process may open the Chroma files
+            raise ValueError("Read-only workers need the numpy index backend or a Chroma server (server_url).")
+        logger.info("Vector store opened read-only.")
+
+    @staticmethod
+    def _open_client():
+        # Chroma is heavy to import, so it is only loaded when the store is opened
+        import chromadb
+
+        if config.VECTOR_STORE_SERVER_URL:
+            url = urlparse(config.VECTOR_STORE_SERVER_URL)
+            return chromadb.HttpClient(
+                host=url.hostname, port=url.port or (443 if url.scheme == "https" else 8000), ssl=url.scheme == "https"
+            )
+        return chromadb.PersistentClient(path=str(config.CHROMA_DB_PATH))
+
+    @staticmethod
+    def _partitioning() -> str:
+        if config.VECTOR_STORE_PARTITIONING not in ("none", "document"):
+            raise ValueError(f"Unknown vector store partitioning: {config.VECTOR_STORE_PARTITIONING}")
+        return config.VECTOR_STORE_PARTITIONING
+
+    def _open_collections(self):
+        if self.partitioned:
+            self._load_partitions()
+        else:
+            self.collection = self.client.get_or_create_collection(name=config.VECTOR_STORE_COLLECTION)
+
+    def _load_partitions(self):
+        """Lists the per-document collections; each records its doc_id in its metadata."""
+        partitions = {
+            collection.metadata["doc_id"]: collection
+            for collection in self.client.list_collections()
+            if collection.metadata and "doc_id" in collection.metadata
+            and collection.name.startswith(f"{config.VECTOR_STORE_COLLECTION}-")
+        }
+        with self._partitions_lock:
+            self.partitions = partitions
+
+    def _partition(self, doc_id: str, create: bool = False):
+        """Returns the collection of a document, None when it has none and `create` is False."""
+        with self._partitions_lock:
+            collection = self.partitions.get(doc_id)
+            if collection is None and create:
+                collection = self.client.get_or_create_collection(
+                    name=partition_name(doc_id), metadata={"doc_id": doc_id}
+                )
+                self.partitions[doc_id] = collection
+            return collection
+
+    def _collection_for(self, doc_id: Optional[str], create: bool = False):
+        """Collection holding (or receiving, with `create`) the chunks of a document."""
+        if self.client is None:
             raise RuntimeError("Vector store not initialized.")
-        self.collection.add(embeddings=embeddings, documents=chunks, metadatas=metadatas, ids=ids)
+        if not self.partitioned:
+            return self.collection
+        if doc_id is None:
+            raise ValueError("Chunks stored in a partitioned vector store need a doc_id.")
+        return self._partition(doc_id, create)
+
+    def _collections(self) -> list:
+        if not self.partitioned:
+            return [self.collection] if self.collection is not None else []
+        with self._partitions_lock:
+            return list(self.partitions.values())
+
+    def count(self) -> int:
+        """Number of chunks stored in Chroma."""
+        return sum(collection.count() for collection in self._collections())
+
+    def _migrate_layout(self, batch_size: int = 1000):
+        """Moves the chunks stored under the other layout (after `partitioning` was changed) into this one."""
+        from chromadb.errors import NotFoundError
+
+        if self.partitioned:
+            try:
+                sources = [self.client.get_collection(name=config.VECTOR_STORE_COLLECTION)]
+            except NotFoundError:
+                return
+        else:
+            self._load_partitions()
+            sources, self.partitions = list(self.partitions.values()), {}
+        if not sources:
+            return
+
+        moved = 0
+        for source in sources:
+            for results in self._iter_records(["embeddings", "documents", "metadatas"], batch_size, [source]):
+                groups: dict = {}
+                for record in zip(results['ids'], results['embeddings'], results['documents'], results['metadatas']):
+                    groups.setdefault(record[3].get('doc_id'), []).append(record)
+                for doc_id, records in groups.items():
+                    ids, embeddings, documents, metadatas = (list(column) for column in zip(*records))
+                    self._collection_for(doc_id, create=True).upsert(
+                        ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas
+                    )
+                moved += len(results['ids'])
+            self.client.delete_collection(name=source.name)
+        logger.info(f"[PARTITIONS] Moved {moved} chunks from {len(sources)} collections to the "
+                    f"{'per-document' if self.partitioned else 'single'} layout.")
+
+    def _ensure_writable(self):
+        if self.read_only:
+            raise RuntimeError("This worker is read-only: writes go through the writer process.")
+
+    def _backfill_catalog(self):
+        """One-off scan of chunk metadata for stores created before the catalog existed."""
+        documents = {}
+        for results in self._iter_records(["metadatas"], batch_size=5000):
+            for meta in results['metadatas']:
+                doc_id = meta.get('doc_id')
+                if doc_id and doc_id not in documents and meta.get('chunk_count'):
+                    documents[doc_id] = {
+                        "doc_id": doc_id,
+                        "name": meta.get('source', 'Unknown Document'),
+                        "chunk_count": meta['chunk_count'],
+                        "file_hash": meta.get('file_hash'),
+                        "text_hash": meta.get('text_hash'),
+                    }
+        document_catalog_service.backfill(documents.values())
+
+    def _iter_records(self, include: list[str], batch_size: int = 1000, collections: Optional[list] = None):
+        for collection in self._collections() if collections is None else collections:
+            offset = 0
+            while True:
+                results = collection.get(limit=batch_size, offset=offset, include=include)
+                if not results['ids']:
+                    break
+                yield results
+                offset += len(results['ids'])
+
+    def _rebuild_index(self):
+        """Reloads the NumPy index from the Chroma collections."""
+        logger.info(f"[INDEX] Rebuilding from {self.count()} Chroma records...")
+        self.index.rebuild(
+            (results['ids'], results['embeddings'], results['documents'],
+             [meta.get('doc_id') for meta in results['metadatas']])
+            for results in self._iter_records(["embeddings", "documents", "metadatas"])
+        )
+
+    def _rebuild_lexical_index(self):
+        """Reloads the lexical index from the Chroma collections."""
+        logger.info(f"[LEXICAL] Rebuilding from {self.count()} Chroma records...")
+        lexical_index_service.rebuild(
+            (results['ids'], results['documents'], [meta.get('doc_id') for meta in results['metadatas']])
+            for results in self._iter_records(["documents", "metadatas"])
+        )
+
+    def _write(self, method: str, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict],
+               ids: list[str]) -> list[Optional[str]]:
+        """Calls the collection's `add` or `upsert`, once per partition; returns the chunks' doc_ids."""
+        doc_ids = [meta.get('doc_id') for meta in metadatas]
+        # Raised before the write, so that a crash in between never leaves stored chunks past the mark
+        marks: dict[str, int] = {}
+        for chunk in ids:
+            position = chunk_position(chunk)
+            if position is not None:
+                marks[position[0]] = max(marks.get(position[0], 0), position[1] + 1)
+        document_catalog_service.raise_high_water(marks)
+        if not self.partitioned:
+            collection = self._collection_for(None)
+            getattr(collection, method)(embeddings=embeddings, documents=chunks, metadatas=metadatas, ids=ids)
+            return doc_ids
+        for doc_id in dict.fromkeys(doc_ids):
+            rows = [i for i, row_doc_id in enumerate(doc_ids) if row_doc_id == doc_id]
+            getattr(self._collection_for(doc_id, create=True), method)(
+                embeddings=[embeddings[i] for i in rows], documents=[chunks[i] for i in rows],
+                metadatas=[metadatas[i] for i in rows], ids=[ids[i] for i in rows],
+            )
+        return doc_ids
+
+    def _chunks_by_collection(self, ids: list[str]) -> list[tuple[object, list[int]]]:
+        """Groups chunk ids (by position in `ids`) by the collection holding them; unknown partitions are skipped."""
+        if not self.partitioned:
+            return [(self._collection_for(None), list(range(len(ids))))]
+        groups: dict = {}
+        for i, chunk in enumerate(ids):
+            position = chunk_position(chunk)
+            groups.setdefault(position[0] if position else None, []).append(i)
+        return [
+            (collection, rows) for collection, rows in
+            ((self._partition(doc_id) if doc_id is not None else None, rows) for doc_id, rows in groups.items())
+            if collection is not None
+        ]
+
+    def add_documents(self, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict], ids: list[str]):
+        self._ensure_writable()
+        doc_ids = self._write("add", chunks, embeddings, metadatas, ids)
+        CHUNKS.labels(operation="indexed").inc(len(ids))
+        if self.index is not None:
+            self.index.add(ids, embeddings, chunks, doc_ids)
+        if config.LEXICAL_INDEX_ENABLED:
+            lexical_index_service.add(ids, chunks, doc_ids)
+        for doc_id in set(doc_ids):
+            self._notify_change(doc_id)
+
+    def subscribe(self, listener: Callable[[Optional[str]], None]):
+        """Registers a callback invoked with the changed doc_id (None when everything changed)."""
+        self.listeners.append(listener)
+
+    def get_versions(self, doc_ids: list[str]) -> tuple:
+        """Returns the version of each document, or of the whole knowledge base when none is given."""
+        with self._version_lock:
+            if not doc_ids:
+                return (("*", self.version),)
+            return tuple((doc_id, self.document_versions.get(doc_id, 0)) for doc_id in sorted(doc_ids))
+
+    def _notify_change(self, doc_id: Optional[str]):
+        self._bump_version(doc_id)
+        worker_coordination_service.publish(doc_id)
+
+    def apply_remote_changes(self, doc_ids: list[Optional[str]]):
+        """Reloads the read-only indexes after the writer process changed the given documents."""
+        if self.partitioned and self.client is not None:
+            self._load_partitions()
+        if self.index is not None:
+            self.index.refresh()
+        if config.LEXICAL_INDEX_ENABLED:
+            lexical_index_service.refresh()
+        for doc_id in dict.fromkeys(doc_ids):
+            self._bump_version(doc_id)
+        logger.info(f"[WORKERS] Applied {len(doc_ids)} changes from the writer.")
+
+    def _bump_version(self, doc_id: Optional[str]):
+        with self._version_lock:
+            self.version += 1
+            if doc_id is not None:
+                self.document_versions[doc_id] = self.document_versions.get(doc_id, 0) + 1
+        for listener in self.listeners:
+            listener(doc_id)
+
+    def update_metadatas(self, ids: list[str], values: dict, batch_size: int = 1000):
+        """Merges `values` into the metadata of the given chunks."""
+        self._ensure_writable()
+        for collection, rows in self._chunks_by_collection(ids):
+            for start in range(0, len(rows), batch_size):
+                batch = [ids[i] for i in rows[start:start + batch_size]]
+                collection.update(ids=batch, metadatas=[dict(values) for _ in batch])
+
+    def update_chunk_metadatas(self, ids: list[str], metadatas: list[dict]):
+        """Replaces the metadata of chunks whose text did not change."""
+        self._ensure_writable()
+        for collection, rows in self._chunks_by_collection(ids):
+            collection.update(ids=[ids[i] for i in rows], metadatas=[metadatas[i] for i in rows])
+
+    def replace_documents(self, chunks: list[str], embeddings: list[list[float]], metadatas: list[dict],
+                          ids: list[str]):
+        """Writes chunks that may already exist under the same ids, replacing their text and embedding."""
+        self._ensure_writable()
+        doc_ids = self._write("upsert", chunks, embeddings, metadatas, ids)
+        CHUNKS.labels(operation="indexed").inc(len(ids))
+        if self.index is not None:
+            self.index.delete_chunks(ids)
+            self.index.add(ids, embeddings, chunks, doc_ids)
+        if config.LEXICAL_INDEX_ENABLED:
+            lexical_index_service.delete_chunks(ids)
+            lexical_index_service.add(ids, chunks, doc_ids)
+        for doc_id in set(doc_ids):
+            self._notify_change(doc_id)
+
+    def delete_chunks(self, doc_id: str, ids: list[str]):
+        """Deletes some chunks of a document, e.g. those past the end of its new version."""
+        self._ensure_writable()
+        collection = self._collection_for(doc_id)
+        if collection is not None:
+            for start in range(0, len(ids), 5000):
+                collection.delete(ids=ids[start:start + 5000])
+        CHUNKS.labels(operation="deleted").inc(len(ids))
+        if self.index is not None:
+            self.index.delete_chunks(ids)
+        if config.LEXICAL_INDEX_ENABLED:
+            lexical_index_service.delete_chunks(ids)
+        self._notify_change(doc_id)
+
+    def get_document_records(self, doc_id: str) -> dict:
+        """Returns the ids, documents, embeddings and metadatas of a document's chunks, in chunk order."""
+        collection = self._collection_for(doc_id)
+        if collection is None:
+            return {"ids": [], "documents": [], "embeddings": [], "metadatas": []}
+        include = ["documents", "embeddings", "metadatas"]
+        # A partition only holds its document's chunks, so it is read without a metadata filter
+        results = collection.get(include=include) if self.partitioned else \
+            collection.get(where={"doc_id": doc_id}, include=include)
+        order = sorted(range(len(results['ids'])), key=lambda i: chunk_position(results['ids'][i]) or (doc_id, i))
+        return {
+            "ids": [results['ids'][i] for i in order],
+            "documents": [results['documents'][i] for i in order],
+            "embeddings": [results['embeddings'][i] for i in order],
+            "metadatas": [results['metadatas'][i] for i in order],
+        }
+
+    def get_document_chunks(self, doc_id: str) -> list[dict]:
+        """Returns the stored chunks of a document as {id, text, embedding, metadata} dicts."""
+        records = self.get_document_records(doc_id)
+        return [
+            {"id": chunk_id, "text": text, "embedding": [float(value) for value in embedding], "metadata": metadata}
+            for chunk_id, text, embedding, metadata in zip(
+                records['ids'], records['documents'], records['embeddings'], records['metadatas']
+            )
+        ]
+
+    def embedding_dimension(self) -> int:
+        """Dimension of the stored embeddings, 0 while the store is empty."""
+        if self.index is not None and self.index.dim:
+            return self.index.dim
+        for collection in self._collections():
+            sample = collection.peek(1).get('embeddings')
+            if sample is not None and len(sample):
+                return len(sample[0])
+        return 0
 
     def query(self, query_embedding: list[float], n_results: int = 5, context_doc_ids: list[str] = None) -> list[str]:
-        if self.collection is None:
+        return [match["text"] for match in self.search(query_embedding, n_results, context_doc_ids)]
+
+    def search(self, query_embedding: list[float], n_results: int = 5,
+               context_doc_ids: list[str] = None) -> list[dict]:
+        """Returns the nearest chunks as {id, text, distance} dicts, closest first."""
+        if self.client is None and self.index is None:
             raise RuntimeError("Vector store not initialized.")
 
+        if self.index is not None:
+            return [
+                {"id": chunk_id, "text": text, "distance": distance}
+                for chunk_id, text, distance in self.index.search(query_embedding, n_results, context_doc_ids)
+            ]
+
+        if not self.partitioned:
+            # Add a where filter if context_doc_ids are provided
+            where = {"doc_id": {"$in": context_doc_ids}} if context_doc_ids else None
+            return self._query_collection(self.collection, query_embedding, n_results, where)
+
+        if context_doc_ids:
+            collections = [self._partition(doc_id) for doc_id in dict.fromkeys(context_doc_ids)]
+            collections = [collection for collection in collections if collection is not None]
+        else:
+            collections = self._collections()
+        if len(collections) <= 1:
+            matches = [self._query_collection(collection, query_embedding, n_results) for collection in collections]
+        else:
+            matches = self._get_query_executor().map(
+                lambda collection: self._query_collection(collection, query_embedding, n_results), collections
+            )
+        return heapq.nsmallest(n_results, itertools.chain.from_iterable(matches), key=lambda match: match["distance"])
+
+    @staticmethod
+    def _query_collection(collection, query_embedding: list[float], n_results: int,
+                          where: Optional[dict] = None) -> list[dict]:
         query_params = {
             "query_embeddings": [query_embedding],
             "n_results": n_results
         }
+        if where:
+            query_params["where"] = where
 
-        # Add a where filter if context_doc_ids are provided
-        if context_doc_ids:
-            query_params["where"] = {"doc_id": {"$in": context_doc_ids}}
+        results = collection.query(**query_params)
+        if not results or not results.get('documents'):
+            return []
+        return [
+            {"id": chunk_id, "text": text, "distance": distance}
+            for chunk_id, text, distance in zip(results['ids'][0], results['documents'][0], results['distances'][0])
+        ]
 
-        results = self.collection.query(**query_params)
-        return results['documents'][0] if results and 'documents' in results and results['documents'] else []
+    def _get_query_executor(self) -> ThreadPoolExecutor:
+        with self._partitions_lock:
+            if self._query_executor is None:
+                self._query_executor = ThreadPoolExecutor(
+                    max_workers=config.VECTOR_STORE_QUERY_WORKERS, thread_name_prefix="partition-query"
+                )
+            return self._query_executor
 
     def clear_collection(self):
-        if self.collection:
+        self._ensure_writable()
+        if self.client is None:
+            return
+        if self.partitioned:
+            for collection in self._collections():
+                self.client.delete_collection(name=collection.name)
+            with self._partitions_lock:
+                self.partitions = {}
+        else:
             self.client.delete_collection(name=self.collection.name)
             self.collection = self.client.get_or_create_collection(name=config.VECTOR_STORE_COLLECTION)
-            logger.info(f"Collection '{self.collection.name}' cleared.")
+        if self.index is not None:
+            self.index.clear()
+        document_catalog_service.clear()
+        if config.LEXICAL_INDEX_ENABLED:
+            lexical_index_service.clear()
+        logger.info("Vector store cleared.")
+        self._notify_change(None)
 
-    def get_all_documents(self) -> list[dict]:
-        """Retrieves a list of unique documents from the collection's metadata."""
-        if self.collection is None:
-            return []
+    def get_all_documents(self, limit: Optional[int] = None, offset: int = 0) -> list[dict]:
+        """Lists the documents that finished ingestion, from the document catalog."""
+        return [self._document_summary(doc) for doc in document_catalog_service.list_documents(limit, offset)]
 
-        all_metadatas = self.collection.get(include=["metadatas"])['metadatas']
-        if not all_metadatas:
-            return []
-
-        documents = {}
-        for meta in all_metadatas:
-            doc_id = meta.get('doc_id')
-            if doc_id and doc_id not in documents:
-                documents[doc_id] = {"id": doc_id, "name": meta.get('source', 'Unknown Document')}
+    def find_document(self, **where) -> dict | None:
+        """Returns the ingested document with the given file_hash or text_hash, if any."""
+        document = document_catalog_service.find(**where)
+        return self._document_summary(document) if document else None
 
-        return list(documents.values())
+    @staticmethod
+    def _document_summary(document: dict) -> dict:
+        return {
+            "id": document["doc_id"],
+            "name": document["name"],
+            "chunk_count": document["chunk_count"],
+            "byte_size": document["byte_size"],
+            "page_count": document["page_count"],
+            "ingested_at": document["completed_at"],
+            "file_hash": document["file_hash"],
+        }
 
     def delete_document(self, doc_id: str) -> bool:
         """Deletes all chunks associated with a specific doc_id."""
-        if self.collection is None:
+        self._ensure_writable()
+        if self.client is None:
             return False
 
-        # Find all chunk IDs for the given document ID
-        ids_to_delete = self.collection.get(where={"doc_id": doc_id})['ids']
-
-        if not ids_to_delete:
-            return False
-
-        self.collection.delete(ids=ids_to_delete)
+        document = document_catalog_service.get(doc_id)
+        if self.partitioned:
+            deleted = self._drop_partition(doc_id)
+            if deleted is None and document is None:
+                return False
+        else:
+            if document is None:
+                return False
+            # Chunk ids are derived from the document id and the chunk position; ids below the high-water
+            # mark that were never written, or were already removed, are ignored by Chroma
+            ids_to_delete = [chunk_id(doc_id, i) for i in range(document["high_water"])]
+            stored = self.collection.count()
+            for start in range(0, len(ids_to_delete), 5000):
+                self.collection.delete(ids=ids_to_delete[start:start + 5000])
+            deleted = stored - self.collection.count()
+        CHUNKS.labels(operation="deleted").inc(deleted or 0)
+        if self.index is not None:
+            self.index.delete_document(doc_id)
+        if config.LEXICAL_INDEX_ENABLED:
+            lexical_index_service.delete_document(doc_id)
+        document_catalog_service.remove(doc_id)
+        self._notify_change(doc_id)
         return True
 
+    def _drop_partition(self, doc_id: str) -> Optional[int]:
+        """Deletes a document's collection; returns how many chunks it held, None when it had none."""
+        with self._partitions_lock:
+            collection = self.partitions.pop(doc_id, None)
+        if collection is None:
+            return None
+        deleted = collection.count()
+        self.client.delete_collection(name=collection.name)
+        return deleted
+
 
 vector_store_service = VectorStoreService()
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+
+# Change log rows kept for readers that fall behind; older ones are trimmed by the writer
+CHANGE_LOG_RETENTION = 10000
+
+
+class WorkerCoordinationService:
+    """Single-writer coordination between the worker processes of one deployment.
+
+    When several uvicorn workers share the stores, the first process to take an
+    exclusive lock on `writer.lock` becomes the writer: it owns Chroma, the
+    derived indexes and the ingestion workers. The other processes serve queries
+    from read-only indexes and follow a change log the writer appends to, so
+    that documents it ingests or deletes become visible without a restart. The
+    lock is released by the kernel when the writer exits, and the next process
+    uvicorn starts in its place takes it over.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.is_writer = True
+        self.last_seq = 0
+        self.follower: Optional[asyncio.Task] = None
+        self._lock_file = None
+        self._lock = threading.Lock()
+
+    @property
+    def role(self) -> str:
+        return "writer" if self.is_writer else "reader"
+
+    def initialize(self, lock_path=None, db_path=None):
+        if not config.MULTI_WORKER:
+            self.is_writer = True
+            return
+        self.is_writer = self._acquire_writer_lock(lock_path or config.WRITER_LOCK_PATH)
+        with self._lock:
+            self.connection = sqlite3.connect(str(db_path or config.CHANGES_DB_PATH), check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    doc_id TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self.connection.commit()
+            self.last_seq = self.connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        logger.info(f"[WORKERS] Process {os.getpid()} is the {self.role}.")
+
+    def _acquire_writer_lock(self, path) -> bool:
+        # POSIX only, like the multi-process deployments that need it
+        import fcntl
+
+        handle = open(path, "a+")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(str(os.getpid()))
+        handle.flush()
+        self._lock_file = handle
+        return True
+
+    def close(self):
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+        if self._lock_file is not None:
+            # Closing the file releases the lock
+            self._lock_file.close()
+            self._lock_file = None
+
+    # --- Change log ------------------------------------------------------------
+
+    def publish(self, doc_id: Optional[str]):
+        """Records that a document's chunks changed (None: the whole knowledge base)."""
+        if self.connection is None or not self.is_writer:
+            return
+        with self._lock:
+            seq = self.connection.execute(
+                "INSERT INTO changes (doc_id, created_at) VALUES (?, ?)", (doc_id, time.time())
+            ).lastrowid
+            if seq % 1000 == 0:
+                self.connection.execute("DELETE FROM changes WHERE seq <= ?", (seq - CHANGE_LOG_RETENTION,))
+            self.connection.commit()
+
+    def poll(self) -> list[Optional[str]]:
+        """Returns the documents changed since the previous poll, oldest first."""
+        if self.connection is None:
+            return []
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT seq, doc_id FROM changes WHERE seq > ? ORDER BY seq", (self.last_seq,)
+            ).fetchall()
+            if not rows:
+                return []
+            missed = rows[0][0] > self.last_seq + 1 and self.last_seq > 0
+            self.last_seq = rows[-1][0]
+        if missed:
+            # The log was trimmed past our position: reload everything
+            return [None]
+        return [doc_id for _, doc_id in rows]
+
+    async def catch_up(self, apply: Callable[[list[Optional[str]]], None]):
+        """Applies the changes published since the previous poll, off the event loop."""
+        changes = await asyncio.to_thread(self.poll)
+        if changes:
+            await asyncio.to_thread(apply, changes)
+
+    async def start(self, apply: Callable[[list[Optional[str]]], None]):
+        """Starts following the writer's change log (readers only)."""
+        if self.connection is None or self.is_writer:
+            return
+        self.follower = asyncio.create_task(self._follow(apply))
+
+    async def stop(self):
+        if self.follower is not None:
+            self.follower.cancel()
+            await asyncio.gather(self.follower, return_exceptions=True)
+            self.follower = None
+        self.close()
+
+    async def _follow(self, apply: Callable[[list[Optional[str]]], None]):
+        while True:
+            await asyncio.sleep(config.CHANGE_POLL_SECONDS)
+            try:
+                await self.catch_up(apply)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[WORKERS] Failed to apply changes from the writer: {e}")
+
+
+worker_coordination_service = WorkerCoordinationService()
@@ -21,6 +21,12 @@ export class ApiService {
         return response.json();
     }
 
+    async fetchJob(jobId) {
+        const response = await fetch(`/api/jobs/${jobId}`);
+        if (!response.ok) throw new Error('Failed to fetch ingestion job.');
+        return response.json();
+    }
+
     async deleteDocument(docId) {
         const response = await fetch(`/api/documents/${docId}`, { method: 'DELETE' });
         if (!response.ok) throw new Error('Server error during deletion.');
@@ -35,4 +41,41 @@ export class ApiService {
         if (!response.ok) throw new Error(result.detail || 'Server error during QCM solving.');
         return result;
     }
+
+    /**
+     * Streams the solving stages; `onEvent` receives each NDJSON event as it arrives.
+     * Resolves with the final result carried by the `done` event.
+     */
+    async solveQcmStream(file, contextIds, onEvent) {
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('context_ids', JSON.stringify(contextIds));
+        const response = await fetch('/api/solve-qcm/stream', { method: 'POST', body: formData });
+        if (!response.ok) {
+            const err = await response.json();
+            throw new Error(err.detail || 'Server error during QCM solving.');
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (value) buffer += decoder.decode(value, { stream: !done });
+            let newline;
+            while ((newline = buffer.indexOf('\n')) !== -1) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (!line) continue;
+                const event = JSON.parse(line);
+                if (event.event === 'error') throw new Error(event.data.detail);
+                if (event.event === 'done') result = event.data;
+                onEvent(event);
+            }
+            if (done) break;
+        }
+        if (!result) throw new Error('Server error during QCM solving.');
+        return result;
+    }
 }
\ No newline at end of file
@@ -52,7 +52,10 @@ export class App {
     async processDocument(file) {
         this.sidebar.setUploadStatus(this.i18n.t('processingPdf'));
         try {
-            await this.apiService.uploadDocument(file);
+            const result = await this.apiService.uploadDocument(file);
+            if (result.job_id) {
+                await this.waitForJob(result.job_id);
+            }
             this.sidebar.setUploadStatus(this.i18n.t('pdfAdded', { fileName: file.name }), true);
             await this.loadDocuments();
         } catch (error) {
@@ -60,6 +63,18 @@ export class App {
         }
     }
 
+    async waitForJob(jobId) {
+        while (true) {
+            const job = await this.apiService.fetchJob(jobId);
+            if (job.status === 'completed') return job;
+            if (job.status === 'failed') throw new Error(job.error || 'Document processing failed.');
+            this.sidebar.setUploadStatus(
+                this.i18n.t('processingPdfProgress', { pages: job.pages_done, chunks: job.chunks_done })
+            );
+            await new Promise((resolve) => setTimeout(resolve, 1000));
+        }
+    }
+
     async deleteDocument(docId) {
         if (!confirm(this.i18n.t('deleteConfirm'))) return;
         try {
@@ -82,7 +97,21 @@ export class App {
         this.stateManager.setUiState('loading', this.i18n.t('solvingQcm'));
         try {
             const contextIds = Array.from(selectedContextIds);
-            const result = await this.apiService.solveQcm(file, contextIds);
+            let partial = null;
+            const result = await this.apiService.solveQcmStream(file, contextIds, (event) => {
+                // Show the question as soon as it is extracted, then fill in context and answer
+                if (event.event === 'question') {
+                    partial = { ...event.data, answer: '', retrieved_context: '' };
+                } else if (event.event === 'context' && partial) {
+                    partial.retrieved_context = event.data.retrieved_context;
+                } else if (event.event === 'token' && partial) {
+                    partial.answer += event.data.text;
+                } else {
+                    return;
+                }
+                this.stateManager.setLastResult(partial);
+                this.stateManager.setUiState('success', partial);
+            });
             this.stateManager.setLastResult(result);
             this.stateManager.setUiState('success', result);
         } catch (error) {
@@ -15,6 +15,7 @@ export const translations = {
         noDocuments: "No documents in the database.",
         processing: "Processing...",
         processingPdf: "Analyzing document...",
+        processingPdfProgress: "Analyzing document... {{pages}} pages, {{chunks}} segments",
         solvingQcm: "Finding answer...",
         error: "Error",
         retry: "Retry",
@@ -59,6 +60,7 @@ export const translations = {
         noDocuments: "Aucun document dans la base.",
         processing: "Traitement en cours...",
         processingPdf: "Analyse du document...",
+        processingPdfProgress: "Analyse du document... {{pages}} pages, {{chunks}} segments",
         solvingQcm: "Recherche de la réponse...",
         error: "Erreur",
         retry: "Réessayer",
@@ -0,0 +1,165 @@
+# src/app/utils/context_utils.py
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from src.app import config
+from src.app.logger.logger_configuration import logger
+from src.app.service.lexical_index_service import tokenize
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+@dataclass
+class ContextCandidate:
+    chunk_id: str
+    text: str
+    # Fused rank score, higher is better
+    relevance: float
+    # Squared L2 distance from the query, when the chunk came from vector search
+    distance: Optional[float] = None
+
+
+def _get_encoding():
+    """Loads the tiktoken encoding once; returns None when it is unavailable (e.g. offline)."""
+    global _encoding, _encoding_loaded
+    with _encoding_lock:
+        if not _encoding_loaded:
+            _encoding_loaded = True
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(config.CONTEXT_TOKEN_ENCODING)
+            except Exception as e:
+                logger.info(f"[RAG] tiktoken unavailable ({type(e).__name__}), estimating 4 characters per token.")
+        return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def chunk_position(chunk_id: str) -> Optional[tuple[str, int]]:
+    """Splits a `<doc_id>-<index>` chunk id into its document id and chunk index."""
+    doc_id, _, index = chunk_id.rpartition("-")
+    if not doc_id or not index.isdigit():
+        return None
+    return doc_id, int(index)
+
+
+def similarity(distance: float) -> float:
+    """Cosine similarity equivalent of a squared L2 distance between unit vectors."""
+    return 1.0 - distance / 2.0
+
+
+def merge_overlapping(first: str, second: str, max_overlap: int) -> str:
+    """Concatenates two consecutive chunks, dropping the text the splitter repeated between them."""
+    for size in range(min(len(first), len(second), max_overlap), 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def select_diverse(candidates: list[ContextCandidate], count: int, mmr_lambda: float) -> list[ContextCandidate]:
+    """Maximal marginal relevance over term sets: trades relevance against redundancy with the selection."""
+    if not candidates:
+        return []
+    top = max(candidate.relevance for candidate in candidates) or 1.0
+    terms = {id(candidate): set(tokenize(candidate.text)) for candidate in candidates}
+    remaining = list(candidates)
+    selected: list[ContextCandidate] = []
+    while remaining and len(selected) < count:
+        best = max(
+            remaining,
+            key=lambda candidate: mmr_lambda * candidate.relevance / top - (1 - mmr_lambda) * max(
+                (_jaccard(terms[id(candidate)], terms[id(chosen)]) for chosen in selected), default=0.0
+            ),
+        )
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+def _merge_adjacent(selected: list[ContextCandidate], max_overlap: int) -> list[str]:
+    """Joins selected chunks that follow each other in the same document, keeping the best one's rank.
+
+    Chunks are grouped in document order, since the selection order can put a
+    run's middle chunk after both of its neighbours; blocks are then ranked by
+    their best chunk.
+    """
+    rank = {id(candidate): i for i, candidate in enumerate(selected)}
+    positioned = sorted(
+        ((chunk_position(candidate.chunk_id), candidate) for candidate in selected
+         if chunk_position(candidate.chunk_id) is not None),
+        key=lambda item: item[0],
+    )
+    groups: list[list[ContextCandidate]] = []
+    previous = None
+    for position, candidate in positioned:
+        if previous is None or position != (previous[0], previous[1] + 1):
+            groups.append([])
+        groups[-1].append(candidate)
+        previous = position
+    groups.extend([candidate] for candidate in selected if chunk_position(candidate.chunk_id) is None)
+    groups.sort(key=lambda group: min(rank[id(candidate)] for candidate in group))
+
+    blocks = []
+    for group in groups:
+        text = group[0].text
+        for candidate in group[1:]:
+            text = merge_overlapping(text, candidate.text, max_overlap)
+        blocks.append(text)
+    return blocks
+
+
+def assemble_context(candidates: list[ContextCandidate], max_chunks: int, max_tokens: int,
+                     similarity_threshold: float = 0.0, mmr_lambda: float = 0.7,
+                     max_overlap: int = 200) -> list[str]:
+    """
+    Turns ranked retrieval candidates into the context blocks sent to the LLM:
+    drops chunks below the similarity threshold, picks a diverse subset, merges
+    consecutive chunks of a document and packs the blocks, best first, into the
+    token budget. Only the last block that fits partially is truncated.
+    """
+    kept = [
+        candidate for candidate in candidates
+        if similarity_threshold <= 0 or candidate.distance is None
+        or similarity(candidate.distance) >= similarity_threshold
+    ]
+    selected = select_diverse(kept, max_chunks, mmr_lambda)
+    blocks = _merge_adjacent(selected, max_overlap)
+
+    packed = []
+    budget = max_tokens
+    for block in blocks:
+        tokens = count_tokens(block)
+        if tokens <= budget:
+            packed.append(block)
+            budget -= tokens
+        elif budget >= max_tokens // 4:
+            packed.append(truncate_to_tokens(block, budget) + "\n[... truncated ...]")
+            budget = 0
+        if budget <= 0:
+            break
+
+    logger.info(
+        f"[RAG] Context assembled: {len(candidates)} candidates, {len(candidates) - len(kept)} below threshold, "
+        f"{len(selected)} selected, {len(blocks)} blocks, {len(packed)} packed ({max_tokens - budget} tokens)")
+    return packed
@@ -1,4 +1,5 @@
 # src/app/utils/file_utils.py
+import shutil
 import tempfile
 from pathlib import Path
 from fastapi import UploadFile
@@ -35,3 +36,15 @@ def save_temp_file(file: UploadFile) -> str:
             return temp_file.name
     except Exception as e:
         raise IOError(f"Unable to save temporary file: {e}")
+
+
+def save_upload_file(file: UploadFile, destination: Path) -> str:
+    """
+    Saves an UploadFile to a persistent location and returns its path.
+    """
+    try:
+        with open(destination, "wb") as out_file:
+            shutil.copyfileobj(file.file, out_file)
+        return str(destination)
+    except Exception as e:
+        raise IOError(f"Unable to save uploaded file: {e}")
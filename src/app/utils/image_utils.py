@@ -0,0 +1,121 @@
+# src/app/utils/image_utils.py
+import base64
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image, ImageChops
+
+from src.app import config
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass
+class PreprocessedImage:
+    data: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    original_size: Tuple[int, int]
+    original_bytes: int
+    reencoded: bool
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode()}"
+
+
+def find_content_box(image: Image.Image, tolerance: int = 16, margin: int = 8) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Returns the bounding box of the content, ignoring a uniform border
+    (whitespace or a dark screen frame) that has the color of the top-left pixel.
+    """
+    rgb = image.convert("RGB")
+    background = Image.new("RGB", rgb.size, rgb.getpixel((0, 0)))
+    diff = ImageChops.difference(rgb, background).convert("L")
+    mask = diff.point(lambda value: 255 if value > tolerance else 0)
+    box = mask.getbbox()
+    if box is None:
+        return None
+    left, top, right, bottom = box
+    return (
+        max(0, left - margin),
+        max(0, top - margin),
+        min(rgb.width, right + margin),
+        min(rgb.height, bottom + margin),
+    )
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    buffer = BytesIO()
+    if fmt == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", quality=config.IMAGE_LOSSY_QUALITY, method=4)
+    else:
+        image.convert("RGB").save(buffer, format="JPEG", quality=config.IMAGE_LOSSY_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    """Drops transparency and palettes so that every encoder accepts the image."""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        flattened = Image.new("RGB", rgba.size, "white")
+        flattened.paste(rgba, mask=rgba.getchannel("A"))
+        return flattened
+    if image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def preprocess_image(image_bytes: bytes) -> PreprocessedImage:
+    """
+    Prepares a screenshot for the vision model: crops uniform borders, downscales
+    to a text-legible resolution and picks the smallest encoding. Images that are
+    already small enough in an accepted format are passed through untouched.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    original_size = image.size
+    fmt = image.format
+
+    crop_box = None
+    if config.IMAGE_AUTOCROP:
+        box = find_content_box(image)
+        if box is not None:
+            cropped_area = (box[2] - box[0]) * (box[3] - box[1])
+            # Ignore negligible crops; they would only cost a re-encode
+            if cropped_area < original_size[0] * original_size[1] * 0.95:
+                crop_box = box
+
+    needs_resize = max(original_size) > config.IMAGE_MAX_DIMENSION
+    if (
+        crop_box is None
+        and not needs_resize
+        and fmt in MIME_TYPES
+        and len(image_bytes) <= config.IMAGE_MAX_PASSTHROUGH_BYTES
+    ):
+        return PreprocessedImage(
+            data=image_bytes,
+            mime_type=MIME_TYPES[fmt],
+            size=original_size,
+            original_size=original_size,
+            original_bytes=len(image_bytes),
+            reencoded=False,
+        )
+
+    image = _flatten(image)
+    if crop_box is not None:
+        image = image.crop(crop_box)
+    if needs_resize or max(image.size) > config.IMAGE_MAX_DIMENSION:
+        image.thumbnail((config.IMAGE_MAX_DIMENSION, config.IMAGE_MAX_DIMENSION), Image.LANCZOS)
+
+    candidates = {out_fmt: _encode(image, out_fmt) for out_fmt in config.IMAGE_OUTPUT_FORMATS}
+    best_fmt = min(candidates, key=lambda out_fmt: len(candidates[out_fmt]))
+    return PreprocessedImage(
+        data=candidates[best_fmt],
+        mime_type=MIME_TYPES[best_fmt],
+        size=image.size,
+        original_size=original_size,
+        original_bytes=len(image_bytes),
+        reencoded=True,
+    )
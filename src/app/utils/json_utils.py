@@ -0,0 +1,28 @@
+# src/app/utils/json_utils.py
+import json
+import re
+from typing import Optional
+
+
+def complete_string_field(partial: str, field: str) -> Optional[str]:
+    """
+    Returns the value of the first `"field": "..."` pair of a JSON document that
+    is still being generated, once the closing quote of the value has arrived.
+    Returns None while the value is incomplete or when the field has not started.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(field), partial)
+    if match is None:
+        return None
+    position = match.end()
+    while position < len(partial):
+        char = partial[position]
+        if char == "\\":
+            position += 2
+            continue
+        if char == '"':
+            try:
+                return json.loads(partial[match.end() - 1:position + 1])
+            except json.JSONDecodeError:
+                return None
+        position += 1
+    return None
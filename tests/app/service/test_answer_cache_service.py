@@ -0,0 +1,179 @@
+import asyncio
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from src.app import config
+from src.app.service.answer_cache_service import AnswerCacheService, phash_bands
+from src.app.service.vector_store_service import vector_store_service
+
+
+def make_screenshot(question: str, options=("A. TCP", "B. UDP", "C. ICMP", "D. ARP"),
+                    fmt: str = "PNG", scale: float = 1.0) -> bytes:
+    image = Image.new("RGB", (1280, 720), "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=28)
+    draw.text((40, 40), question, fill="black", font=font)
+    for i, option in enumerate(options):
+        draw.text((60, 140 + i * 60), option, fill="black", font=font)
+    if scale != 1.0:
+        image = image.resize((int(1280 * scale), int(720 * scale)))
+    buffer = BytesIO()
+    image.save(buffer, format=fmt, quality=80)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(config, "ANSWER_CACHE_TTL_SECONDS", 3600)
+    monkeypatch.setattr(config, "ANSWER_CACHE_MAX_ENTRIES", 10)
+    service = AnswerCacheService()
+    yield service
+    vector_store_service.listeners.remove(service.invalidate_document)
+
+
+def counting_pipeline():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": "B", "retrieved_context": "ctx"}
+
+    return calls, compute
+
+
+def test_identical_requests_are_served_from_cache(cache):
+    """Teste qu'une capture déjà résolue ne relance pas le pipeline."""
+    calls, compute = counting_pipeline()
+    image = make_screenshot("What is the capital of France?")
+
+    async def scenario():
+        first = await cache.get_or_compute(image, ["doc-1"], compute)
+        second = await cache.get_or_compute(image, ["doc-1"], compute)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert first["cache_status"] == "miss"
+    assert second["cache_status"] == "hit"
+    assert second["answer"] == "B"
+
+
+def test_concurrent_requests_are_coalesced(cache):
+    """Teste que des requêtes identiques simultanées partagent une seule exécution."""
+    calls, compute = counting_pipeline()
+    image = make_screenshot("What is the capital of France?")
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get_or_compute(image, ["doc-1"], compute) for _ in range(5)])
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(r["cache_status"] for r in results) == ["coalesced"] * 4 + ["miss"]
+
+
+def test_reencoded_screenshot_matches_perceptually(cache):
+    """Teste qu'une même capture ré-encodée en JPEG et réduite réutilise la réponse."""
+    calls, compute = counting_pipeline()
+    question = "Which protocol guarantees ordered delivery?"
+
+    async def scenario():
+        await cache.get_or_compute(make_screenshot(question), ["doc-1"], compute)
+        return await cache.get_or_compute(make_screenshot(question, fmt="JPEG", scale=0.6), ["doc-1"], compute)
+
+    result = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert result["cache_status"] == "hit"
+
+
+def test_similar_layout_with_different_text_is_not_matched(cache):
+    """Teste que deux questions de même mise en page ne partagent pas la réponse."""
+    calls, compute = counting_pipeline()
+    question = "Which protocol guarantees ordered delivery?"
+
+    async def scenario():
+        await cache.get_or_compute(make_screenshot(question), ["doc-1"], compute)
+        await cache.get_or_compute(make_screenshot("Which protocol provides connectionless delivery?"), ["doc-1"], compute)
+        await cache.get_or_compute(make_screenshot(question, options=("A. TCP", "B. UDP", "C. ICMP", "D. SCTP")),
+                                   ["doc-1"], compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 3
+
+
+def test_context_selection_is_part_of_the_key(cache):
+    """Teste qu'une sélection de documents différente ne partage pas la réponse."""
+    calls, compute = counting_pipeline()
+    image = make_screenshot("What is the capital of France?")
+
+    async def scenario():
+        await cache.get_or_compute(image, ["doc-1"], compute)
+        await cache.get_or_compute(image, ["doc-2"], compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_document_change_invalidates_entries(cache):
+    """Teste que la suppression ou ré-ingestion d'un document invalide ses réponses."""
+    calls, compute = counting_pipeline()
+    image = make_screenshot("What is the capital of France?")
+
+    async def scenario():
+        await cache.get_or_compute(image, ["doc-1"], compute)
+        vector_store_service._notify_change("doc-1")
+        return await cache.get_or_compute(image, ["doc-1"], compute)
+
+    result = asyncio.run(scenario())
+    assert len(calls) == 2
+    assert result["cache_status"] == "miss"
+
+
+def test_failed_results_are_not_cached(cache):
+    """Teste que les réponses en erreur ne sont pas conservées."""
+    calls, compute = counting_pipeline()
+    image = make_screenshot("What is the capital of France?")
+
+    async def scenario():
+        await cache.get_or_compute(image, ["doc-1"], compute, is_cacheable=lambda result: False)
+        await cache.get_or_compute(image, ["doc-1"], compute)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_hashes_within_the_distance_share_a_band():
+    """Teste que deux empreintes distantes d'au plus max_distance bits partagent toujours une bande."""
+    rng = random.Random(0)
+    for _ in range(200):
+        phash = rng.getrandbits(256)
+        near = phash
+        for bit in rng.sample(range(256), 12):
+            near ^= 1 << bit
+        assert set(phash_bands(phash, 256, 12)) & set(phash_bands(near, 256, 12))
+
+
+def test_near_lookups_only_compare_keys_sharing_a_band(cache, monkeypatch):
+    """Teste que la recherche approchée ne compare que les entrées d'un même compartiment, évictions comprises."""
+    calls, compute = counting_pipeline()
+    questions = [f"Question {i}: which layer handles routing?" for i in range(8)]
+    compared = []
+    is_near = cache._is_near
+    monkeypatch.setattr(cache, "_is_near", lambda a, b: compared.append(a) or is_near(a, b))
+
+    async def scenario():
+        for question in questions:
+            await cache.get_or_compute(make_screenshot(question, options=()), ["doc-1"], compute)
+        compared.clear()
+        return await cache.get_or_compute(make_screenshot(questions[-1], options=(), fmt="JPEG"), ["doc-1"], compute)
+
+    result = asyncio.run(scenario())
+    assert result["cache_status"] == "hit"
+    assert len(compared) < len(questions)
+
+    cache.invalidate_document("doc-1")
+    assert not cache.near_entries.buckets and not cache.near_in_flight.buckets
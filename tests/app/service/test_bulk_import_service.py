@@ -0,0 +1,51 @@
+import asyncio
+import zipfile
+
+from src.app.service import bulk_import_service as bulk_module
+from src.app.service.bulk_import_service import BulkImportService, ImportSource, ImportState
+
+
+def test_sources_list_pdfs_of_directories_and_archives(tmp_path):
+    """Teste que les PDF sont trouvés récursivement dans un dossier comme dans une archive zip."""
+    folder = tmp_path / "semestre"
+    (folder / "td").mkdir(parents=True)
+    for name in ("cours.pdf", "td/td1.PDF", "notes.txt"):
+        (folder / name).write_bytes(b"%PDF-" + name.encode())
+    archive_path = tmp_path / "semestre.zip"
+    with zipfile.ZipFile(archive_path, "w") as archive:
+        for file in folder.rglob("*"):
+            if file.is_file():
+                archive.write(file, file.relative_to(folder).as_posix())
+
+    for source in (ImportSource(str(folder)), ImportSource(str(archive_path))):
+        entries = sorted(source.entries(), key=lambda entry: entry.key)
+        assert [entry.key for entry in entries] == ["cours.pdf", "td/td1.PDF"]
+        path, temp_dir = source.materialize(entries[1])
+        with open(path, "rb") as f:
+            assert f.read() == b"%PDF-td/td1.PDF"
+
+
+def test_interrupted_imports_resume_where_they_stopped(tmp_path, monkeypatch):
+    """Teste qu'une reprise saute les fichiers importés et reprend les autres après leur dernier chunk validé."""
+    for name in ("a.pdf", "b.pdf"):
+        (tmp_path / name).write_bytes(b"%PDF-1.4")
+    calls = []
+
+    async def ingest(pdf_path, name, force, on_progress, doc_id, resume_from, rollback_on_error):
+        calls.append((name, doc_id, resume_from))
+        doc_id = doc_id or f"doc-{name}"
+        on_progress(doc_id, 1, resume_from + 64)
+        if name == "b.pdf" and resume_from == 0:
+            raise RuntimeError("embedding quota exhausted")
+        return {"doc_id": doc_id, "chunk_count": 100, "duplicate": False, "extraction": {"pages": 10}}
+
+    monkeypatch.setattr(bulk_module, "process_document_and_embed", ingest)
+    service = BulkImportService(ImportState(tmp_path / "state.sqlite3"))
+
+    first = asyncio.run(service.run(str(tmp_path)))
+    second = asyncio.run(service.run(str(tmp_path)))
+
+    assert (first.imported, list(first.failed)) == (1, ["b.pdf"])
+    assert (second.imported, second.skipped, second.failed) == (1, 1, {})
+    assert second.chunks == 100 - 64
+    assert calls == [("a.pdf", None, 0), ("b.pdf", None, 0), ("b.pdf", "doc-b.pdf", 64)]
@@ -0,0 +1,92 @@
+import pytest
+
+from src.app.service.document_catalog_service import DocumentCatalogService
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = DocumentCatalogService()
+    catalog.initialize(tmp_path / "documents.sqlite3")
+    return catalog
+
+
+def test_only_completed_documents_are_listed(catalog):
+    """Teste qu'un document en cours d'ingestion n'apparaît ni dans la liste ni dans la déduplication."""
+    catalog.begin("doc-1", "cours.pdf", "hash-1", byte_size=2048)
+
+    assert catalog.list_documents() == []
+    assert catalog.find(file_hash="hash-1") is None
+
+    catalog.complete("doc-1", chunk_count=12, page_count=3, text_hash="text-1")
+
+    [document] = catalog.list_documents()
+    assert document["chunk_count"] == 12
+    assert document["page_count"] == 3
+    assert document["byte_size"] == 2048
+    assert catalog.find(file_hash="hash-1")["doc_id"] == "doc-1"
+    assert catalog.find(text_hash="text-1")["doc_id"] == "doc-1"
+
+
+def test_listing_is_paginated(catalog):
+    """Teste la pagination de la liste des documents."""
+    for i in range(5):
+        catalog.begin(f"doc-{i}", f"cours-{i}.pdf", f"hash-{i}")
+        catalog.complete(f"doc-{i}", chunk_count=1, page_count=1, text_hash=f"text-{i}")
+
+    page = catalog.list_documents(limit=2, offset=2)
+
+    assert [document["doc_id"] for document in page] == ["doc-2", "doc-3"]
+    assert catalog.count() == 5
+
+
+def test_stats_and_removal(catalog):
+    """Teste les totaux de la base et la suppression d'un document."""
+    catalog.begin("doc-1", "a.pdf", "hash-1", byte_size=100)
+    catalog.complete("doc-1", chunk_count=10, page_count=2, text_hash="text-1")
+    catalog.begin("doc-2", "b.pdf", "hash-2", byte_size=50)
+
+    assert catalog.stats() == {"documents": 1, "ingesting": 1, "chunks": 10, "bytes": 100, "pages": 2}
+
+    catalog.remove("doc-1")
+    assert catalog.get("doc-1") is None
+    assert catalog.stats()["documents"] == 0
+
+
+def test_backfill_keeps_existing_rows(catalog):
+    """Teste que la reprise d'une base existante n'écrase pas le catalogue."""
+    catalog.begin("doc-1", "a.pdf", "hash-1", byte_size=100)
+    catalog.complete("doc-1", chunk_count=10, page_count=2, text_hash="text-1")
+
+    catalog.backfill([
+        {"doc_id": "doc-1", "name": "other.pdf", "chunk_count": 99},
+        {"doc_id": "doc-2", "name": "b.pdf", "chunk_count": 4, "file_hash": "hash-2"},
+    ])
+
+    assert catalog.get("doc-1")["name"] == "a.pdf"
+    assert catalog.find(file_hash="hash-2")["chunk_count"] == 4
+
+
+def test_documents_stay_listed_while_a_new_version_is_ingested(catalog):
+    """Teste qu'une mise à jour garde l'ancienne version visible jusqu'à sa fin, puis la remplace."""
+    catalog.begin("doc-1", "v1.pdf", "hash-1", byte_size=100)
+    catalog.complete("doc-1", chunk_count=4, page_count=1, text_hash="text-1")
+
+    catalog.begin("doc-1", "v2.pdf", "hash-2", byte_size=300)
+
+    [document] = catalog.list_documents()
+    assert (document["name"], document["file_hash"], document["byte_size"]) == ("v1.pdf", "hash-1", 100)
+    assert document["pending_file_hash"] == "hash-2"
+    assert catalog.find(file_hash="hash-1")["doc_id"] == "doc-1"
+    assert catalog.find(file_hash="hash-2") is None
+
+    catalog.complete("doc-1", chunk_count=9, page_count=3, text_hash="text-2")
+
+    document = catalog.get("doc-1")
+    assert (document["name"], document["file_hash"], document["byte_size"]) == ("v2.pdf", "hash-2", 300)
+    assert document["chunk_count"] == 9 and document["pending_file_hash"] is None
+    assert document["high_water"] == 9
+
+    catalog.raise_high_water({"doc-1": 12})
+    catalog.raise_high_water({"doc-1": 5})
+    catalog.begin("doc-1", "v3.pdf", "hash-3")
+    assert catalog.get("doc-1")["high_water"] == 12
@@ -0,0 +1,176 @@
+import asyncio
+
+import fitz
+import langchain_google_genai
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from src.app import config
+from src.app.service import cached_embeddings as cached_embeddings_module
+from src.app.service import document_service as document_module
+from src.app.service import vector_store_service as vector_store_module
+from src.app.service.document_catalog_service import DocumentCatalogService
+from src.app.service.document_service import Chunk, chunk_hash, diff_chunks, iter_chunks, process_document_and_embed
+from src.app.service.model_call_service import ModelCallService
+from src.app.service.vector_store_service import VectorStoreService, chunk_id
+
+
+class FakeEmbeddings:
+    """Faux modèle d'embedding : garde les textes reçus et le nombre maximal de lots simultanés."""
+
+    def __init__(self):
+        self.texts = []
+        self.delay = 0.0
+        self.active = 0
+        self.max_active = 0
+
+    async def aembed_documents(self, texts):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0, 0.0, 0.0] for text in texts]
+
+
+@pytest.fixture
+def ingestion(tmp_path, monkeypatch):
+    """Magasin Chroma et catalogue neufs ; les embeddings passent par un faux modèle."""
+    monkeypatch.setattr(config, "VECTOR_INDEX_BACKEND", "chroma")
+    monkeypatch.setattr(config, "LEXICAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "CHROMA_DB_PATH", tmp_path / "chroma")
+    monkeypatch.setattr(config, "SCHEDULER_DEFAULT_RPM", 0)
+    monkeypatch.setattr(config, "SCHEDULER_MODEL_LIMITS", {})
+    catalog = DocumentCatalogService()
+    catalog.initialize(tmp_path / "catalog.sqlite3")
+    monkeypatch.setattr(vector_store_module, "document_catalog_service", catalog)
+    monkeypatch.setattr(document_module, "document_catalog_service", catalog)
+    store = VectorStoreService()
+    store.initialize()
+    monkeypatch.setattr(document_module, "vector_store_service", store)
+    monkeypatch.setattr(cached_embeddings_module, "model_call_service", ModelCallService())
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(langchain_google_genai, "GoogleGenerativeAIEmbeddings", lambda **kwargs: embeddings)
+    return catalog, store, embeddings
+
+
+def write_pdf(path, pages: int, title: str = "cours", edited: tuple = ()) -> str:
+    """PDF de `pages` pages d'environ 2 500 caractères ; `title` change les octets sans changer le texte.
+
+    Les pages listées dans `edited` portent d'autres mots, comme dans une nouvelle version du cours.
+    """
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        word = "neuf" if p in edited else "mot"
+        text = " ".join(f"page{p}{word}{i}" for i in range(250))
+        page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=7)
+    doc.set_metadata({"title": title})
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def chunk(text: str) -> Chunk:
+    return Chunk(text=text, page=1, page_end=1, start_offset=0, end_offset=len(text))
+
+
+def test_chunks_record_their_pages_and_offsets():
+    """Teste que chaque chunk connaît ses pages et sa position dans le texte complet du document."""
+    pages = [f"Page {p} : " + " ".join(f"mot{p}_{i}" for i in range(500)) + " " for p in range(1, 6)]
+    document = "".join(pages)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=300, chunk_overlap=30)
+
+    chunks = list(iter_chunks(pages, splitter))
+
+    page_starts = [sum(len(page) for page in pages[:p]) for p in range(len(pages))]
+    assert [c.page for c in chunks] == sorted(c.page for c in chunks)
+    for c in chunks:
+        assert document[c.start_offset:c.end_offset] == c.text
+        assert page_starts[c.page - 1] <= c.start_offset
+        assert c.page <= c.page_end and c.end_offset - 1 < page_starts[c.page_end - 1] + len(pages[c.page_end - 1])
+    assert chunks[-1].page_end == 5
+    assert any(c.page != c.page_end for c in chunks)
+
+
+def test_only_new_text_needs_embedding():
+    """Teste le classement d'une nouvelle version : inchangé, déplacé (embedding réutilisé) ou nouveau."""
+    previous_hashes = {10: chunk_hash("a"), 11: chunk_hash("b"), 12: chunk_hash("c")}
+    batch = [chunk("a"), chunk("c"), chunk("d")]
+
+    changed, unchanged, to_embed = diff_chunks(batch, 10, previous_hashes, set(previous_hashes.values()))
+
+    assert unchanged == [0]
+    assert changed == [1, 2]
+    assert to_embed == [2]
+
+
+def test_documents_with_the_same_text_are_ingested_once(ingestion, tmp_path):
+    """Teste qu'un PDF aux octets différents mais au texte identique est reconnu comme doublon."""
+    catalog, store, embeddings = ingestion
+    original = write_pdf(tmp_path / "cours.pdf", pages=3)
+    reexported = write_pdf(tmp_path / "cours-export.pdf", pages=3, title="export")
+
+    first = asyncio.run(process_document_and_embed(original, "cours.pdf"))
+    embedded = len(embeddings.texts)
+    duplicate = asyncio.run(process_document_and_embed(reexported, "cours-export.pdf"))
+
+    assert not first["duplicate"] and first["chunk_count"] > 1
+    assert duplicate["duplicate"] and duplicate["doc_id"] == first["doc_id"]
+    assert len(embeddings.texts) == embedded
+    assert store.count() == first["chunk_count"]
+    assert [document["doc_id"] for document in catalog.list_documents()] == [first["doc_id"]]
+
+    same_bytes = asyncio.run(process_document_and_embed(original, "cours.pdf"))
+
+    assert same_bytes["duplicate"] and same_bytes["doc_id"] == first["doc_id"]
+    assert len(embeddings.texts) == embedded
+
+
+def test_embedding_batches_overlap_up_to_the_configured_limit(ingestion, tmp_path, monkeypatch):
+    """Teste que les lots se chevauchent sans dépasser max_concurrent_batches, avec une progression contiguë."""
+    monkeypatch.setattr(config, "INGESTION_BATCH_SIZE", 2)
+    monkeypatch.setattr(config, "INGESTION_MAX_CONCURRENT_BATCHES", 3)
+    catalog, store, embeddings = ingestion
+    embeddings.delay = 0.02
+    progress = []
+
+    result = asyncio.run(process_document_and_embed(
+        write_pdf(tmp_path / "cours.pdf", pages=6), "cours.pdf",
+        on_progress=lambda doc_id, pages_done, chunks_done: progress.append(chunks_done),
+    ))
+
+    assert result["chunk_count"] >= 12
+    assert embeddings.max_active == 3
+    assert len(embeddings.texts) == store.count() == result["chunk_count"]
+    assert progress == sorted(progress) and progress[-1] == result["chunk_count"]
+    assert catalog.get(result["doc_id"])["chunk_count"] == result["chunk_count"]
+
+
+def test_update_embeds_only_the_edited_text_and_drops_trailing_chunks(ingestion, tmp_path):
+    """Teste une mise à jour de bout en bout : seul le texte modifié est embeddé, les chunks en trop disparaissent."""
+    catalog, store, embeddings = ingestion
+    first = asyncio.run(process_document_and_embed(write_pdf(tmp_path / "v1.pdf", pages=4), "cours.pdf"))
+    doc_id = first["doc_id"]
+    first_texts = set(embeddings.texts)
+    embedded = len(embeddings.texts)
+
+    updated = asyncio.run(process_document_and_embed(
+        write_pdf(tmp_path / "v2.pdf", pages=3, edited=(2,)), "cours.pdf", doc_id=doc_id, update=True
+    ))
+
+    new_texts = embeddings.texts[embedded:]
+    assert new_texts and all("page2neuf" in text for text in new_texts)
+    assert first_texts.isdisjoint(new_texts)
+    assert updated["update"]["embedded"] == len(new_texts)
+    assert updated["update"]["unchanged"] > 0
+    assert updated["chunk_count"] < first["chunk_count"]
+    assert updated["update"]["removed"] == first["chunk_count"] - updated["chunk_count"]
+    assert store.count() == updated["chunk_count"]
+    stored = store.get_document_chunks(doc_id)
+    assert sorted(chunk["id"] for chunk in stored) == sorted(chunk_id(doc_id, i) for i in range(updated["chunk_count"]))
+    assert not any("page3mot" in chunk["text"] or "page2mot" in chunk["text"] for chunk in stored)
+    assert catalog.get(doc_id)["chunk_count"] == updated["chunk_count"]
@@ -0,0 +1,164 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from src.app import config
+from src.app.service import cached_embeddings as cached_embeddings_module
+from src.app.service.cached_embeddings import CachedEmbeddings
+from src.app.service.embedding_cache_service import EmbeddingCacheService
+from src.app.service.model_call_service import ModelCallService, ModelUnavailableError
+
+
+class CountingEmbeddings(Embeddings):
+    """Faux modèle d'embedding qui compte les textes envoyés au "réseau"."""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        self.calls.append([text])
+        return [float(len(text)), 2.0]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "EMBEDDING_CACHE_ENABLED", True)
+    service = EmbeddingCacheService()
+    service.initialize(tmp_path / "embeddings.sqlite3")
+    return service
+
+
+def test_reupload_skips_the_model(cache):
+    """Teste qu'un second passage sur les mêmes textes n'appelle plus le modèle."""
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, "fake-model", cache)
+
+    first = embeddings.embed_documents(["alpha", "beta"])
+    second = embeddings.embed_documents(["alpha", "beta"])
+
+    assert first == second
+    assert inner.calls == [["alpha", "beta"]]
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_only_missing_texts_are_embedded(cache):
+    """Teste que seuls les textes absents du cache sont envoyés au modèle."""
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, "fake-model", cache)
+
+    embeddings.embed_documents(["alpha"])
+    result = embeddings.embed_documents(["alpha", "gamma  delta"])
+
+    assert inner.calls[-1] == ["gamma  delta"]
+    assert result[1] == [12.0, 1.0]
+
+
+def test_normalized_text_and_task_are_part_of_the_key(cache):
+    """Teste que les espaces sont normalisés et que requêtes et documents sont séparés."""
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, "fake-model", cache)
+
+    embeddings.embed_query("What is  TCP?")
+    embeddings.embed_query(" What is TCP? ")
+    embeddings.embed_documents(["What is TCP?"])
+
+    assert len(inner.calls) == 2
+
+
+def test_model_is_part_of_the_key(cache):
+    """Teste qu'un changement de modèle d'embedding ne réutilise pas les anciens vecteurs."""
+    inner = CountingEmbeddings()
+    CachedEmbeddings(inner, "model-a", cache).embed_documents(["alpha"])
+    CachedEmbeddings(inner, "model-b", cache).embed_documents(["alpha"])
+
+    assert len(inner.calls) == 2
+
+
+def test_lru_eviction_bounds_the_cache(cache):
+    """Teste que le cache ne dépasse jamais max_entries."""
+    cache.max_entries = 3
+    embeddings = CachedEmbeddings(CountingEmbeddings(), "fake-model", cache)
+
+    embeddings.embed_documents(["a1", "a2", "a3", "a4", "a5"])
+
+    assert cache.stats()["entries"] == 3
+
+
+def test_cache_hits_bypass_the_resilience_layer(cache, monkeypatch):
+    """Teste qu'une question déjà en cache est servie même disjoncteur ouvert, sans consommer de jeton."""
+    service = ModelCallService()
+    monkeypatch.setattr(cached_embeddings_module, "model_call_service", service)
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, "fake-model", cache, operation="embedding")
+    asyncio.run(embeddings.aembed_query("What is TCP?"))
+    admissions = service.scheduler.queue("embedding").waits["interactive"].samples
+    for _ in range(service.breaker("embedding").failure_threshold):
+        service.breaker("embedding").record_failure()
+
+    assert asyncio.run(embeddings.aembed_query("What is TCP?")) == [12.0, 2.0]
+    assert asyncio.run(embeddings.aembed_queries(["What is TCP?"])) == [[12.0, 2.0]]
+    with pytest.raises(ModelUnavailableError):
+        asyncio.run(embeddings.aembed_query("What is UDP?"))
+    assert len(inner.calls) == 1
+    assert len(admissions) == 1
+
+
+class TaskTypeEmbeddings(CountingEmbeddings):
+    """Faux modèle d'embedding qui note le type de tâche demandé à chaque appel."""
+
+    def __init__(self):
+        super().__init__()
+        self.task_types = []
+
+    async def aembed_documents(self, texts, task_type=None):
+        self.task_types.append(task_type)
+        return self.embed_documents(texts)
+
+    async def aembed_query(self, text, task_type=None):
+        self.task_types.append(task_type)
+        return self.embed_query(text)
+
+
+def test_batched_queries_request_the_query_task_type(cache):
+    """Teste que le lot de questions et la question seule demandent explicitement le même type de tâche."""
+    inner = TaskTypeEmbeddings()
+    embeddings = CachedEmbeddings(inner, "fake-model", cache, query_task_type="RETRIEVAL_QUERY")
+
+    asyncio.run(embeddings.aembed_queries(["What is TCP?", "What is UDP?"]))
+    asyncio.run(embeddings.aembed_query("What is IP?"))
+
+    assert inner.calls == [["What is TCP?", "What is UDP?"], ["What is IP?"]]
+    assert inner.task_types == ["RETRIEVAL_QUERY", "RETRIEVAL_QUERY"]
+
+
+def test_queries_without_a_task_type_are_embedded_one_by_one(cache):
+    """Teste que, sans type de tâche explicite, le lot passe par embed_query plutôt que par embed_documents."""
+    inner = TaskTypeEmbeddings()
+    embeddings = CachedEmbeddings(inner, "fake-model", cache)
+
+    vectors = asyncio.run(embeddings.aembed_queries(["What is TCP?", "What is UDP?"]))
+
+    assert vectors == [[12.0, 2.0], [12.0, 2.0]]
+    assert inner.calls == [["What is TCP?"], ["What is UDP?"]]
+
+
+def test_google_embeddings_honour_the_explicit_query_task_type():
+    """Teste que le client Gemini envoie bien le type de tâche passé à aembed_documents."""
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+    from src.app.service.qcm_vision_service import QUERY_TASK_TYPE
+
+    async def prepare():
+        # The client binds its async transport to the running loop when built
+        client = GoogleGenerativeAIEmbeddings(model=config.LLM_EMBEDDING_MODEL, google_api_key="test")
+        return client._prepare_request(text="What is TCP?", task_type=QUERY_TASK_TYPE)
+
+    request = asyncio.run(prepare())
+
+    assert request.task_type.name == QUERY_TASK_TYPE
@@ -0,0 +1,128 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.app import config
+from src.app.service import ingestion_job_service as job_module
+from src.app.service import vector_store_service as vector_store_module
+from src.app.service.document_catalog_service import DocumentCatalogService
+from src.app.service.ingestion_job_service import COMPLETED, FAILED, IngestionJobService
+from src.app.service.vector_store_service import VectorStoreService
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Magasin Chroma et catalogue neufs, utilisés par le service de tâches."""
+    monkeypatch.setattr(config, "VECTOR_INDEX_BACKEND", "chroma")
+    monkeypatch.setattr(config, "LEXICAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(config, "MULTI_WORKER", False)
+    monkeypatch.setattr(config, "CHROMA_DB_PATH", tmp_path / "chroma")
+    catalog = DocumentCatalogService()
+    catalog.initialize(tmp_path / "catalog.sqlite3")
+    monkeypatch.setattr(vector_store_module, "document_catalog_service", catalog)
+    store = VectorStoreService()
+    store.initialize()
+    monkeypatch.setattr(job_module, "vector_store_service", store)
+    return catalog, store
+
+
+def upload(tmp_path, name="cours.pdf"):
+    path = tmp_path / name
+    path.write_bytes(b"%PDF-1.4")
+    return str(path)
+
+
+def commit_chunks(catalog, store, doc_id, start, count):
+    """Écrit des chunks comme le ferait un lot d'ingestion validé."""
+    catalog.begin(doc_id, "cours.pdf", file_hash="hash")
+    ids = [f"{doc_id}-{i}" for i in range(start, start + count)]
+    store.add_documents([f"Texte {i}" for i in ids], np.ones((count, 4)).tolist(),
+                        [{"doc_id": doc_id} for _ in ids], ids)
+
+
+async def run_job(service, job_id):
+    await service.start(worker_count=1)
+    try:
+        return await service.wait(job_id, timeout=5)
+    finally:
+        await service.stop()
+
+
+def test_submitted_jobs_complete_and_discard_their_upload(store, tmp_path, monkeypatch):
+    """Teste qu'une tâche soumise est exécutée, garde son résultat et supprime le fichier téléversé."""
+    async def ingest(file_path, filename, force, on_progress, doc_id, resume_from, rollback_on_error, update):
+        on_progress(doc_id, 3, 10)
+        return {"doc_id": doc_id, "chunk_count": 10, "duplicate": False}
+
+    monkeypatch.setattr(job_module, "process_document_and_embed", ingest)
+    service = IngestionJobService()
+    service.initialize(tmp_path / "jobs.sqlite3")
+    path = upload(tmp_path)
+
+    job = asyncio.run(run_job(service, service.submit(path, "cours.pdf")["id"]))
+
+    assert job["status"] == COMPLETED
+    assert job["result"]["chunk_count"] == job["chunks_done"] == 10
+    assert not (tmp_path / "cours.pdf").exists()
+
+
+def test_interrupted_jobs_resume_from_their_last_committed_chunk(store, tmp_path, monkeypatch):
+    """Teste qu'après un redémarrage la tâche reprend au dernier chunk validé, sous le même doc_id."""
+    calls = []
+    committed = asyncio.Event()
+
+    async def ingest(file_path, filename, force, on_progress, doc_id, resume_from, rollback_on_error, update):
+        calls.append((doc_id, resume_from, rollback_on_error))
+        if not resume_from:
+            on_progress(doc_id, 2, 64)
+            committed.set()
+            await asyncio.sleep(60)  # Interrupted by the shutdown
+        return {"doc_id": doc_id, "chunk_count": 100, "duplicate": False}
+
+    monkeypatch.setattr(job_module, "process_document_and_embed", ingest)
+    service = IngestionJobService()
+    service.initialize(tmp_path / "jobs.sqlite3")
+    job_id = service.submit(upload(tmp_path), "cours.pdf")["id"]
+
+    async def interrupted():
+        await service.start(worker_count=1)
+        await committed.wait()
+        await service.stop()
+
+    asyncio.run(interrupted())
+    restarted = IngestionJobService()
+    restarted.initialize(tmp_path / "jobs.sqlite3")
+    job = asyncio.run(run_job(restarted, job_id))
+
+    doc_id = calls[0][0]
+    assert calls == [(doc_id, 0, False), (doc_id, 64, False)]
+    assert job["status"] == COMPLETED and job["attempts"] == 2
+
+
+def test_failed_jobs_roll_back_new_documents_and_keep_updates_for_retry(store, tmp_path, monkeypatch):
+    """Teste qu'un échec supprime les chunks d'un nouveau document, mais garde le fichier d'une mise à jour."""
+    catalog, vector_store = store
+
+    async def ingest(file_path, filename, force, on_progress, doc_id, resume_from, rollback_on_error, update):
+        await asyncio.to_thread(commit_chunks, catalog, vector_store, doc_id, 0, 2)
+        on_progress(doc_id, 1, 2)
+        raise RuntimeError("embedding quota exhausted")
+
+    monkeypatch.setattr(job_module, "process_document_and_embed", ingest)
+    service = IngestionJobService()
+    service.initialize(tmp_path / "jobs.sqlite3")
+
+    job = asyncio.run(run_job(service, service.submit(upload(tmp_path), "cours.pdf")["id"]))
+
+    assert job["status"] == FAILED and "quota" in job["error"]
+    assert vector_store.count() == 0
+    assert catalog.get(job["doc_id"]) is None
+    assert not (tmp_path / "cours.pdf").exists()
+    assert service.retry(job["id"]) is None
+
+    update = asyncio.run(run_job(service, service.submit(upload(tmp_path, "v2.pdf"), "v2.pdf", doc_id="doc-1")["id"]))
+
+    assert update["status"] == FAILED
+    assert (tmp_path / "v2.pdf").exists()
+    assert service.retry(update["id"])["status"] == "queued"
@@ -0,0 +1,76 @@
+import pytest
+
+from src.app import config
+from src.app.service.lexical_index_service import LexicalIndexService, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LexicalIndexService()
+    index.initialize(tmp_path / "lexical.sqlite3")
+    index.add(
+        ["doc-1-0", "doc-1-1", "doc-2-0"],
+        [
+            "TCP garantit la livraison ordonnée des segments grâce aux numéros de séquence.",
+            "UDP est un protocole sans connexion, sans garantie de livraison.",
+            "Le protocole ARP associe une adresse IP à une adresse MAC.",
+        ],
+        ["doc-1", "doc-1", "doc-2"],
+    )
+    return index
+
+
+def test_tokenize_strips_accents_and_stopwords():
+    """Teste la normalisation des termes (accents, casse, mots vides)."""
+    assert tokenize("La livraison ORDONNÉE des segments") == ["livraison", "ordonnee", "segments"]
+
+
+def test_best_match_ranks_first_with_full_coverage(index):
+    """Teste que le chunk contenant tous les termes rares arrive en tête avec une couverture totale."""
+    [best, *_] = index.search("Quelle livraison est ordonnée grâce aux numéros de séquence ?")
+
+    assert best.chunk_id == "doc-1-0"
+    assert best.coverage == pytest.approx(1.0)
+    assert best.matched_terms == 5
+
+
+def test_search_is_restricted_to_selected_documents(index):
+    """Teste le filtre par document et la suppression d'un document."""
+    assert [m.chunk_id for m in index.search("protocole adresse", doc_ids=["doc-2"])] == ["doc-2-0"]
+
+    index.delete_document("doc-2")
+
+    assert index.search("adresse MAC") == []
+    assert index.count() == 2
+
+
+def test_partial_match_lowers_the_coverage(index):
+    """Teste qu'un chunk ne contenant qu'une partie des termes connus n'est pas jugé sûr."""
+    [best, *_] = index.search("TCP séquence adresse kerberos")
+
+    assert best.matched_terms == 2
+    assert best.coverage < 0.9
+
+
+def test_unknown_terms_keep_an_off_topic_question_off_the_fast_path(index):
+    """Teste que des termes absents du corpus comptent dans la couverture et bloquent le chemin rapide."""
+    [best, *_] = index.search("Livraison ordonnée des segments par numéros de photosynthèse chlorophyllienne ?")
+
+    assert best.chunk_id == "doc-1-0"
+    assert best.matched_terms >= config.LEXICAL_FAST_PATH_MIN_TERMS
+    assert best.coverage < config.LEXICAL_FAST_PATH_MIN_COVERAGE
+
+
+def test_already_indexed_chunks_are_ignored(index):
+    """Teste qu'une reprise d'ingestion ne duplique pas les chunks."""
+    index.add(["doc-1-0"], ["TCP"], ["doc-1"])
+
+    assert index.count() == 3
+
+
+def test_reciprocal_rank_fusion_favours_agreement():
+    """Teste que la fusion par rang réciproque privilégie les chunks présents dans les deux listes."""
+    fused = reciprocal_rank_fusion([["a", "b"], ["c", "b"]])
+
+    assert fused[0][0] == "b"
+    assert {chunk_id for chunk_id, _ in fused} == {"a", "b", "c"}
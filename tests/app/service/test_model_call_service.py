@@ -0,0 +1,208 @@
+import asyncio
+import time
+
+import pytest
+
+from src.app import config
+from src.app.service.model_call_service import (
+    BACKGROUND, INTERACTIVE, CircuitBreaker, ModelCallError, ModelCallService, ModelOverloadedError,
+    ModelTimeoutError, ModelUnavailableError, RequestBudget,
+)
+
+
+class UpstreamError(Exception):
+    """Erreur HTTP telle que la renvoient les clients Google (code et en-têtes de réponse)."""
+
+    def __init__(self, code: int, retry_after: float = None):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+        self.retry_after = retry_after
+
+
+class FakeUpstream:
+    """Serveur de modèle local : chaque appel suit le script (latence, erreur éventuelle)."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def request(self):
+        latency, error = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        await asyncio.sleep(latency)
+        if error:
+            raise error
+        return "ok"
+
+    async def stream(self):
+        latency, error = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        await asyncio.sleep(latency)
+        yield "first"
+        if error:
+            raise error
+        yield "second"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(config, "STAGE_TIMEOUTS", {"vision": 1.0})
+    monkeypatch.setattr(config, "MODEL_MAX_RETRIES", 2)
+    monkeypatch.setattr(config, "RETRY_BACKOFF_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(config, "RETRY_BACKOFF_MAX_SECONDS", 0.02)
+    monkeypatch.setattr(config, "HEDGING_ENABLED", False)
+    monkeypatch.setattr(config, "CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(config, "CIRCUIT_RESET_SECONDS", 60)
+    monkeypatch.setattr(config, "SCHEDULER_DEFAULT_RPM", 0)
+    monkeypatch.setattr(config, "SCHEDULER_MODEL_LIMITS", {})
+    return ModelCallService()
+
+
+def test_transient_errors_are_retried_after_the_requested_delay(service):
+    """Teste qu'un 429 est rejoué en respectant le Retry-After, mais pas une requête invalide."""
+    upstream = FakeUpstream([(0, UpstreamError(429, retry_after=0.1)), (0, None)])
+
+    start = time.monotonic()
+    assert asyncio.run(service.call("vision", upstream.request)) == "ok"
+    assert upstream.calls == 2
+    assert time.monotonic() - start >= 0.1
+
+    invalid = FakeUpstream([(0, UpstreamError(400))])
+    with pytest.raises(ModelCallError) as error:
+        asyncio.run(service.call("vision", invalid.request))
+    assert invalid.calls == 1
+    assert error.value.status_code == 502
+
+
+def test_deadline_comes_from_the_request_budget(service):
+    """Teste qu'une étape lente est interrompue à sa part du budget de la requête."""
+    upstream = FakeUpstream([(5, None)])
+    budget = RequestBudget(1.0, shares={"vision": 0.2, "embedding": 0.3, "answer": 0.5})
+
+    start = time.monotonic()
+    with pytest.raises(ModelTimeoutError):
+        asyncio.run(service.call("vision", upstream.request, budget))
+
+    assert 0.15 < time.monotonic() - start < 0.5
+    # What the vision stage did not use goes to the later stages
+    assert budget.stage_timeout("answer") == pytest.approx(budget.remaining(), abs=0.01)
+
+
+def test_slow_calls_are_hedged(service, monkeypatch):
+    """Teste qu'un appel plus lent que le p95 observé est doublé et que la copie rapide l'emporte."""
+    monkeypatch.setattr(config, "HEDGING_ENABLED", True)
+    monkeypatch.setattr(config, "HEDGING_MIN_SAMPLES", 5)
+    for _ in range(10):
+        service._tracker("vision").record(0.02)
+    upstream = FakeUpstream([(0.8, None), (0.01, None)])
+
+    start = time.monotonic()
+    assert asyncio.run(service.call("vision", upstream.request)) == "ok"
+
+    assert upstream.calls == 2
+    assert time.monotonic() - start < 0.3
+
+
+def test_circuit_opens_then_fails_fast_until_a_probe_succeeds(service):
+    """Teste que le disjoncteur renvoie 503 sans appeler le modèle, puis se referme après une sonde réussie."""
+    now = [0.0]
+    service.breakers["vision"] = CircuitBreaker("vision", failure_threshold=3, reset_seconds=30,
+                                                clock=lambda: now[0])
+    failing = FakeUpstream([(0, UpstreamError(503))])
+    for _ in range(3):
+        with pytest.raises(ModelCallError):
+            asyncio.run(service.call("vision", failing.request))
+    calls = failing.calls
+
+    with pytest.raises(ModelUnavailableError) as error:
+        asyncio.run(service.call("vision", failing.request))
+    assert failing.calls == calls
+    assert error.value.status_code == 503
+    assert error.value.retry_after == 30
+
+    now[0] = 31.0
+    assert asyncio.run(service.call("vision", FakeUpstream([(0, None)]).request)) == "ok"
+    assert service.breakers["vision"].state == "closed"
+
+
+def test_streams_are_only_retried_before_the_first_item(service):
+    """Teste qu'un flux est rejoué s'il échoue avant le premier jeton, jamais après."""
+    async def collect(upstream):
+        return [item async for item in service.stream("vision", upstream.stream)]
+
+    assert asyncio.run(collect(FakeUpstream([(0, None)]))) == ["first", "second"]
+
+    broken = FakeUpstream([(0, UpstreamError(503))])
+    with pytest.raises(ModelCallError):
+        asyncio.run(collect(broken))
+    assert broken.calls == 1
+
+
+def test_interactive_calls_are_served_before_queued_background_calls(service, monkeypatch):
+    """Teste qu'une résolution passe devant l'ingestion déjà en file quand le débit du modèle est épuisé."""
+    monkeypatch.setattr(config, "OPERATION_MODELS", {"vision": "gemini", "ingestion_embedding": "gemini"})
+    monkeypatch.setattr(config, "SCHEDULER_MODEL_LIMITS", {"gemini": {"requests_per_minute": 1200, "burst": 1}})
+    order = []
+
+    async def request(name, operation, priority):
+        await service.call(operation, FakeUpstream([(0, None)]).request, priority=priority)
+        order.append(name)
+
+    async def scenario():
+        await request("first", "vision", INTERACTIVE)  # Uses up the burst
+        background = [asyncio.create_task(request(f"batch-{i}", "ingestion_embedding", BACKGROUND))
+                      for i in range(3)]
+        await asyncio.sleep(0.01)
+        await asyncio.gather(request("solve", "vision", INTERACTIVE), *background)
+
+    asyncio.run(scenario())
+
+    assert order == ["first", "solve", "batch-0", "batch-1", "batch-2"]
+    stats = service.scheduler.stats()["gemini"]
+    assert stats[BACKGROUND]["wait_p95_seconds"] > stats[INTERACTIVE]["wait_p95_seconds"]
+
+
+def test_calls_are_shed_with_a_retry_after_when_the_queue_is_full(service, monkeypatch):
+    """Teste qu'au-delà de la file bornée, ou si le tour arriverait après l'échéance, l'appel reçoit un 503."""
+    monkeypatch.setattr(config, "OPERATION_MODELS", {"vision": "gemini"})
+    monkeypatch.setattr(config, "SCHEDULER_MODEL_LIMITS", {"gemini": {"requests_per_minute": 60, "burst": 1}})
+    monkeypatch.setattr(config, "SCHEDULER_MAX_QUEUED", {INTERACTIVE: 1, BACKGROUND: 1})
+    upstream = FakeUpstream([(0, None)])
+
+    async def scenario():
+        await service.call("vision", upstream.request)
+        queued = asyncio.create_task(service.call("vision", upstream.request))
+        await asyncio.sleep(0.01)
+        with pytest.raises(ModelOverloadedError) as full:
+            await service.call("vision", upstream.request)
+        queued.cancel()
+        return full.value
+
+    error = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert error.retry_after >= 1
+    assert upstream.calls == 1
+    # The next token is a second away, beyond the 0.2 s deadline of this request
+    with pytest.raises(ModelOverloadedError):
+        asyncio.run(service.call("vision", upstream.request, RequestBudget(0.2)))
+    assert service.scheduler.stats()["gemini"][INTERACTIVE]["rejected"] == 2
+    assert service.breakers["vision"].state == "closed"
+
+
+def test_background_calls_wait_instead_of_being_shed(service, monkeypatch):
+    """Teste qu'une ingestion au-delà de la file bornée attend son tour au lieu d'échouer, sans consommer son échéance."""
+    monkeypatch.setattr(config, "OPERATION_MODELS", {"ingestion_embedding": "gemini"})
+    monkeypatch.setattr(config, "SCHEDULER_MODEL_LIMITS", {"gemini": {"requests_per_minute": 600, "burst": 1}})
+    monkeypatch.setattr(config, "SCHEDULER_MAX_QUEUED", {INTERACTIVE: 1, BACKGROUND: 1})
+    monkeypatch.setattr(config, "STAGE_TIMEOUTS", {"ingestion_embedding": 0.15})
+    upstream = FakeUpstream([(0, None)])
+
+    async def scenario():
+        return await asyncio.gather(*(
+            service.call("ingestion_embedding", upstream.request, priority=BACKGROUND) for _ in range(4)
+        ))
+
+    assert asyncio.run(scenario()) == ["ok"] * 4
+    assert upstream.calls == 4
+    assert service.scheduler.stats()["gemini"][BACKGROUND]["rejected"] == 0
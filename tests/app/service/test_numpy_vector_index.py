@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from src.app import config
+from src.app.service.numpy_vector_index import NumpyVectorIndex
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_INDEX_COMPACTION_RATIO", 0.25)
+    index = NumpyVectorIndex(tmp_path / "index")
+    index.open()
+    yield index
+    index.close()
+
+
+def add_document(index, doc_id, vectors):
+    ids = [f"{doc_id}-{i}" for i in range(len(vectors))]
+    index.add(ids, vectors, [f"{doc_id} chunk {i}" for i in range(len(vectors))], [doc_id] * len(vectors))
+
+
+def brute_force(vectors, query, k):
+    distances = ((np.asarray(vectors) - np.asarray(query)) ** 2).sum(axis=1)
+    return list(np.argsort(distances)[:k])
+
+
+def test_search_matches_brute_force(index):
+    """Teste que le top-k correspond à une recherche exhaustive en distance L2."""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).tolist()
+    add_document(index, "doc-1", vectors)
+    query = rng.normal(size=16).tolist()
+
+    results = index.search(query, n_results=5)
+
+    assert [text for _, text, _ in results] == [f"doc-1 chunk {i}" for i in brute_force(vectors, query, 5)]
+    assert [d for _, _, d in results] == sorted(d for _, _, d in results)
+
+
+def test_search_is_restricted_to_selected_documents(index):
+    """Teste que le filtre sur les documents ne renvoie que leurs chunks."""
+    add_document(index, "doc-1", [[1.0, 0.0], [0.9, 0.1]])
+    add_document(index, "doc-2", [[0.0, 1.0], [0.1, 0.9]])
+
+    results = index.search([1.0, 0.0], n_results=5, doc_ids=["doc-2"])
+
+    assert {text for _, text, _ in results} == {"doc-2 chunk 0", "doc-2 chunk 1"}
+    assert index.search([1.0, 0.0], n_results=5, doc_ids=["unknown"]) == []
+
+
+def test_interleaved_documents_are_compacted_into_contiguous_ranges(index, tmp_path):
+    """Teste que des ajouts entrelacés redeviennent contigus après compaction."""
+    for batch in range(3):
+        for doc_id in ("doc-1", "doc-2"):
+            ids = [f"{doc_id}-{batch}-{i}" for i in range(4)]
+            index.add(ids, [[float(batch), float(i)] for i in range(4)], ids, [doc_id] * 4)
+    assert len(index.segments["doc-1"]) == 3
+
+    index.compact()
+
+    assert all(len(ranges) == 1 for ranges in index.segments.values())
+    assert len(index.search([0.0, 0.0], n_results=50, doc_ids=["doc-1"])) == 12
+
+
+def test_delete_reclaims_rows_and_survives_reopen(index):
+    """Teste que la suppression déclenche la compaction et que l'index persiste."""
+    add_document(index, "doc-1", [[1.0, 0.0]] * 10)
+    add_document(index, "doc-2", [[0.0, 1.0]] * 10)
+
+    assert index.delete_document("doc-1") == 10
+    assert index.size == 10
+    assert index.delete_document("doc-1") == 0
+
+    index.close()
+    reopened = NumpyVectorIndex(index.directory)
+    reopened.open()
+    results = reopened.search([0.0, 1.0], n_results=3)
+    reopened.close()
+
+    assert reopened.count() == 10
+    assert len(results) == 3
+    assert all(text.startswith("doc-2") for _, text, _ in results)
+
+
+def test_duplicate_chunk_ids_are_ignored(index):
+    """Teste qu'un chunk déjà indexé (reprise d'ingestion) n'est pas dupliqué."""
+    add_document(index, "doc-1", [[1.0, 0.0], [0.0, 1.0]])
+    add_document(index, "doc-1", [[1.0, 0.0], [0.0, 1.0]])
+
+    assert index.count() == 2
+
+
+def test_read_only_replica_follows_the_writer(index, tmp_path):
+    """Teste qu'un index ouvert en lecture seule voit les ajouts, suppressions et compactions de l'écrivain."""
+    add_document(index, "doc-1", [[1.0, 0.0], [0.9, 0.1]])
+    replica = NumpyVectorIndex(tmp_path / "index", read_only=True)
+    replica.open()
+    assert replica.search([1.0, 0.0], n_results=1)[0][1] == "doc-1 chunk 0"
+
+    add_document(index, "doc-2", [[0.0, 1.0]])
+    assert replica.search([0.0, 1.0], n_results=1)[0][1] == "doc-1 chunk 1"
+    replica.refresh()
+    assert replica.search([0.0, 1.0], n_results=1)[0][1] == "doc-2 chunk 0"
+
+    # Deleting most rows compacts the writer's matrix into a new generation
+    index.delete_document("doc-1")
+    assert index.generation == 1
+    # Searching a stale snapshot notices the new generation instead of returning moved rows
+    assert [text for _, text, _ in replica.search([1.0, 0.0], n_results=5)] == ["doc-2 chunk 0"]
+    assert replica.generation == 1
+    replica.close()
+
+
+def test_replaced_chunks_are_searched_with_their_new_vector(index):
+    """Teste qu'un chunk supprimé puis réécrit n'est plus trouvé qu'avec son nouveau vecteur."""
+    add_document(index, "doc-1", [[1.0, 0.0], [0.0, 1.0], [0.7, 0.7]])
+
+    assert index.delete_chunks(["doc-1-1"]) == 1
+    index.add(["doc-1-1"], [[-1.0, 0.0]], ["doc-1 chunk 1 v2"], ["doc-1"])
+
+    assert index.count() == 3
+    assert index.search([-1.0, 0.0], n_results=1)[0][1] == "doc-1 chunk 1 v2"
+    assert "doc-1 chunk 1" not in {text for _, text, _ in index.search([0.0, 1.0], n_results=3)}
+
+
+def test_quantized_search_reranks_with_exact_distances(tmp_path):
+    """Teste qu'un index quantifié (créé depuis un index existant) renvoie le top-k exact et ses distances exactes."""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(500, 32))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    plain = NumpyVectorIndex(tmp_path / "index", quantization="none")
+    plain.open()
+    add_document(plain, "doc-1", vectors[:400].tolist())
+    plain.close()
+
+    index = NumpyVectorIndex(tmp_path / "index", quantization="int8")
+    index.open()
+    add_document(index, "doc-2", vectors[400:].tolist())
+    index.delete_document("doc-1")
+    index.compact()
+    add_document(index, "doc-1", vectors[:400].tolist())
+    query = rng.normal(size=32)
+
+    results = index.search(query.tolist(), n_results=5)
+
+    expected = brute_force(vectors, query, 5)
+    assert [int(chunk_id.split("-")[-1]) + (400 if chunk_id.startswith("doc-2") else 0)
+            for chunk_id, _, _ in results] == expected
+    assert [d for _, _, d in results] == pytest.approx(((vectors[expected] - query) ** 2).sum(axis=1), rel=1e-5)
+    assert index.codes.dtype == np.int8
+    index.close()
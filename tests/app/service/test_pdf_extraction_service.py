@@ -0,0 +1,67 @@
+import logging
+
+import fitz
+import pytest
+
+from src.app import config
+from src.app.service.pdf_extraction_service import ExtractionStats, PdfExtractionService
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    """PDF de 9 pages dont chacune porte son numéro."""
+    doc = fitz.open()
+    for number in range(1, 10):
+        doc.new_page().insert_text((72, 72), f"Page {number} of the course")
+    path = tmp_path / "cours.pdf"
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(config, "EXTRACTION_WORKERS", 2)
+    monkeypatch.setattr(config, "EXTRACTION_PAGES_PER_SHARD", 2)
+    service = PdfExtractionService()
+    yield service
+    service.shutdown()
+
+
+def test_sharded_extraction_keeps_page_order(service, pdf):
+    """Teste que les pages extraites par tranches dans le pool de processus arrivent dans l'ordre du document."""
+    service.inline_max_pages = 0
+    stats = ExtractionStats()
+
+    pages = list(service.iter_pages(pdf, stats))
+
+    assert service.executor is not None
+    assert [page.split(" of")[0] for page in pages] == [f"Page {number}" for number in range(1, 10)]
+    assert [page_number for page_number, _ in stats.page_timings] == list(range(9))
+    assert stats.summary()["pages"] == 9
+
+
+def test_short_documents_are_extracted_inline(service, pdf):
+    """Teste qu'un document sous le seuil est extrait dans le thread appelant, sans démarrer le pool."""
+    service.inline_max_pages = 9
+
+    pages = list(service.iter_pages(pdf))
+
+    assert service.executor is None
+    assert pages[0].startswith("Page 1") and pages[-1].startswith("Page 9")
+
+
+def test_slow_pages_are_logged_and_summarized(monkeypatch, caplog):
+    """Teste que les pages lentes sont journalisées et classées en tête du résumé."""
+    monkeypatch.setattr(config, "EXTRACTION_SLOW_PAGE_SECONDS", 0.5)
+    stats = ExtractionStats()
+
+    with caplog.at_level(logging.INFO):
+        for page_number, seconds in enumerate([0.01, 1.25, 0.02, 0.75]):
+            stats.record(page_number, seconds)
+
+    slow = [record.getMessage() for record in caplog.records if "Slow page" in record.getMessage()]
+    assert slow == ["[EXTRACT] Slow page 2: 1.25s", "[EXTRACT] Slow page 4: 0.75s"]
+    summary = stats.summary(slowest=2)
+    assert summary["slowest_pages"] == [{"page": 2, "seconds": 1.25}, {"page": 4, "seconds": 0.75}]
+    assert summary["cpu_time"] == 2.03
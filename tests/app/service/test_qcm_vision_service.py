@@ -0,0 +1,367 @@
+import asyncio
+import base64
+import itertools
+import json
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from src.app import config
+from src.app.api.dependencies import get_qcm_vision_service
+from src.app.api.routes import api_router
+from src.app.service import qcm_vision_service as qcm_module
+from src.app.service.model_call_service import ModelCallError, ModelCallService
+from src.app.service.qcm_vision_service import ANSWER_ERROR_MESSAGE, QCMVisionAnalysisService
+
+QUESTION = "Which protocol guarantees ordered delivery?"
+OPTIONS = ["TCP", "UDP", "ICMP"]
+
+
+class FakeVision:
+    """Faux modèle de vision : renvoie le JSON scripté, d'un bloc ou morceau par morceau."""
+
+    def __init__(self, chunks, delay=0.0, error=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.error = error
+
+    async def ainvoke(self, messages):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(content="".join(self.chunks))
+
+    async def astream(self, messages):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(content=chunk)
+        if self.error:
+            raise self.error
+
+
+class ScreenshotVision:
+    """Faux modèle de vision multi-questions : la réponse dépend de la largeur de la capture envoyée."""
+
+    def __init__(self, responses):
+        self.responses = responses
+
+    async def ainvoke(self, messages):
+        data_url = messages[0].content[1]["image_url"]
+        with Image.open(BytesIO(base64.b64decode(data_url.split(",", 1)[1]))) as image:
+            response = self.responses[image.width]
+        if isinstance(response, Exception):
+            raise response
+        return SimpleNamespace(content=response)
+
+
+class FailingChatModel(GenericFakeChatModel):
+    """Faux modèle de réponse dont le flux s'interrompt après les premiers fragments."""
+
+    def _stream(self, *args, **kwargs):
+        yield from super()._stream(*args, **kwargs)
+        raise RuntimeError("connection dropped")
+
+
+class SelectiveChatModel(GenericFakeChatModel):
+    """Faux modèle de réponse qui échoue pour les questions contenant `fail_on`."""
+
+    fail_on: str = ""
+
+    def _generate(self, messages, *args, **kwargs):
+        if self.fail_on in messages[0].content:
+            raise RuntimeError(f"invalid request for {self.fail_on}")
+        return super()._generate(messages, *args, **kwargs)
+
+
+class FakeEmbeddings:
+    """Faux modèle d'embedding ; `delays` ralentit certaines questions, `cancelled` note les appels annulés."""
+
+    def __init__(self, delays=None):
+        self.calls = []
+        self.delays = delays or {}
+        self.cancelled = []
+
+    async def aembed_query(self, text, budget=None):
+        self.calls.append([text])
+        try:
+            await asyncio.sleep(self.delays.get(text, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        return [1.0, 0.0]
+
+    async def aembed_queries(self, texts, budget=None):
+        self.calls.append(list(texts))
+        return [[1.0, 0.0] for _ in texts]
+
+
+class FakeStore:
+    def __init__(self):
+        self.queries = []
+
+    def search(self, query_embedding, n_results, context_doc_ids=None):
+        self.queries.append(context_doc_ids)
+        return [{"id": "doc-1-0", "text": "TCP numbers its segments to deliver them in order.", "distance": 0.1}]
+
+
+def screenshot(width: int = 64) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (width, 48), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def vision_json(question=QUESTION, options=OPTIONS) -> str:
+    return json.dumps({"question": question, "options": options})
+
+
+def answer_model(text="1. TCP", fail=False) -> GenericFakeChatModel:
+    model_type = FailingChatModel if fail else GenericFakeChatModel
+    return model_type(messages=itertools.repeat(AIMessage(content=text)))
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """Service d'analyse dont les modèles, les embeddings et le magasin sont remplacés par des faux."""
+    monkeypatch.setattr(config, "LEXICAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(config, "SPECULATIVE_RETRIEVAL", False)
+    monkeypatch.setattr(config, "LOG_TIMINGS", False)
+    monkeypatch.setattr(config, "ANSWER_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "MODEL_MAX_RETRIES", 0)
+    monkeypatch.setattr(config, "HEDGING_ENABLED", False)
+    monkeypatch.setattr(config, "SCHEDULER_DEFAULT_RPM", 0)
+    monkeypatch.setattr(config, "SCHEDULER_MODEL_LIMITS", {})
+    # The clients are built but never called: any key lets the service start without the env var
+    monkeypatch.setattr(config, "GEMINI_API_KEY", "test")
+    monkeypatch.setattr(qcm_module, "model_call_service", ModelCallService())
+    monkeypatch.setattr(qcm_module, "vector_store_service", FakeStore())
+
+    async def build():
+        # The Gemini clients bind to the running event loop when they are created
+        return QCMVisionAnalysisService()
+
+    service = asyncio.run(build())
+    service.vision_llm = FakeVision([vision_json()])
+    service.llm = answer_model()
+    service.embeddings_model = FakeEmbeddings()
+    return service
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_stream_emits_each_stage_in_order(service):
+    """Teste l'ordre des événements : question, contexte, fragments de réponse puis résultat complet."""
+    service.llm = answer_model("The answer is 1. TCP")
+
+    events = asyncio.run(collect(service.stream_qcm_analysis(screenshot(), ["doc-1"])))
+
+    names = [event["event"] for event in events]
+    assert names[:2] == ["question", "context"] and names[-1] == "done"
+    assert set(names[2:-1]) == {"token"} and len(names[2:-1]) > 1
+    assert events[0]["data"] == {"extracted_question": QUESTION, "options": OPTIONS}
+    assert "in order" in events[1]["data"]["retrieved_context"]
+    done = events[-1]["data"]
+    assert done["answer"] == "".join(event["data"]["text"] for event in events[2:-1]) == "The answer is 1. TCP"
+    assert done["retrieved_context"] == events[1]["data"]["retrieved_context"]
+
+
+def test_mid_stream_failure_raises_without_a_final_result(service):
+    """Teste qu'un échec pendant la génération lève une erreur de modèle, sans événement final."""
+    service.llm = answer_model("The answer is 1. TCP", fail=True)
+    events = []
+
+    async def consume():
+        async for event in service.stream_qcm_analysis(screenshot(), ["doc-1"]):
+            events.append(event)
+
+    with pytest.raises(ModelCallError):
+        asyncio.run(consume())
+
+    assert [event["event"] for event in events][:3] == ["question", "context", "token"]
+    assert "done" not in [event["event"] for event in events]
+
+
+def post_stream(service) -> list[dict]:
+    app = FastAPI()
+    app.include_router(api_router)
+    app.dependency_overrides[get_qcm_vision_service] = lambda: service
+    response = TestClient(app).post("/solve-qcm/stream", data={"context_ids": '["doc-1"]'},
+                                    files={"file": ("qcm.png", screenshot(), "image/png")})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_stream_route_sends_ndjson_events(service):
+    """Teste que la route renvoie un objet JSON par ligne, terminé par le résultat complet."""
+    events = post_stream(service)
+
+    assert [event["event"] for event in events][:2] == ["question", "context"]
+    assert events[-1]["event"] == "done" and events[-1]["data"]["answer"] == "1. TCP"
+
+
+def test_stream_route_reports_a_mid_stream_failure(service):
+    """Teste qu'un échec après les premiers fragments termine le flux par un événement d'erreur."""
+    service.llm = answer_model("The answer is 1. TCP", fail=True)
+
+    events = post_stream(service)
+
+    names = [event["event"] for event in events]
+    assert names[:3] == ["question", "context", "token"] and "done" not in names
+    assert names[-1] == "error"
+    assert events[-1]["data"]["status"] == 502 and "connection dropped" in events[-1]["data"]["detail"]
+
+
+def batch_vision(*images) -> ScreenshotVision:
+    """Une capture par liste de questions, reconnue à sa largeur (64, 65, ...) ; une exception simule un échec."""
+    return ScreenshotVision({
+        64 + i: questions if isinstance(questions, Exception)
+        else json.dumps({"questions": [{"question": q, "options": OPTIONS} for q in questions]})
+        for i, questions in enumerate(images)
+    })
+
+
+def test_batch_answers_every_question_with_a_single_embedding_call(service):
+    """Teste qu'un lot répond à chaque question, dans l'ordre des captures, avec un seul appel d'embedding."""
+    service.vision_llm = batch_vision(
+        [QUESTION, "Which layer routes packets between networks?"],
+        ["Which protocol resolves IP addresses to MAC?", "Too short"],
+        RuntimeError("unreadable screenshot"),
+    )
+
+    result = asyncio.run(service.analyze_qcm_batch([screenshot(64), screenshot(65), screenshot(66)], ["doc-1"]))
+
+    assert [(r["image_index"], r["question_index"]) for r in result["results"]] == [(0, 0), (0, 1), (1, 0)]
+    assert result["results"][2]["extracted_question"] == "Which protocol resolves IP addresses to MAC?"
+    assert all(r["answer"] == "1. TCP" and "in order" in r["retrieved_context"] for r in result["results"])
+    assert result["errors"] == [{"image_index": 2, "detail": "vision: unreadable screenshot"}]
+    assert service.embeddings_model.calls == [[r["extracted_question"] for r in result["results"]]]
+
+
+def test_batch_reports_failed_answers_per_question(service, monkeypatch):
+    """Teste qu'un échec de génération n'affecte que sa question, signalée dans `errors`, et la limite de questions."""
+    monkeypatch.setattr(config, "BATCH_MAX_QUESTIONS", 3)
+    service.vision_llm = batch_vision(
+        [QUESTION, "Which layer routes packets between networks?"],
+        ["Which protocol resolves IP addresses to MAC?", "Which protocol sends echo requests?"],
+    )
+    service.llm = SelectiveChatModel(messages=itertools.repeat(AIMessage(content="1. TCP")), fail_on="routes packets")
+
+    result = asyncio.run(service.analyze_qcm_batch([screenshot(64), screenshot(65)], ["doc-1"]))
+
+    assert len(result["results"]) == 3
+    assert [r["answer"] for r in result["results"]] == ["1. TCP", ANSWER_ERROR_MESSAGE, "1. TCP"]
+    [error] = result["errors"]
+    assert (error["image_index"], error["question_index"]) == (0, 1) and "routes packets" in error["detail"]
+
+
+def test_batch_validation_keeps_only_well_formed_questions(service):
+    """Teste la validation d'une extraction multi-questions, y compris au format d'une seule question."""
+    valid = {"question": QUESTION, "options": [" TCP ", "UDP", ""]}
+
+    assert service._validate_qcm_batch({"questions": [valid, {"question": "Short", "options": OPTIONS}, "text"]}) \
+        == [{"question": QUESTION, "options": ["TCP", "UDP"]}]
+    assert service._validate_qcm_batch({"question": QUESTION, "options": OPTIONS}) == [
+        {"question": QUESTION, "options": OPTIONS}]
+    assert service._validate_qcm_batch({"questions": "not a list"}) == []
+    assert service._validate_qcm_batch(["not an object"]) == []
+
+
+def test_batch_route_limits_the_number_of_images(service, monkeypatch):
+    """Teste que la route refuse les lots trop grands et renvoie les réponses des autres."""
+    monkeypatch.setattr(config, "BATCH_MAX_IMAGES", 2)
+    service.vision_llm = batch_vision([QUESTION], ["Which protocol resolves IP addresses to MAC?"])
+    app = FastAPI()
+    app.include_router(api_router)
+    app.dependency_overrides[get_qcm_vision_service] = lambda: service
+    client = TestClient(app)
+
+    def post(count):
+        files = [("files", (f"qcm-{i}.png", screenshot(64 + i), "image/png")) for i in range(count)]
+        return client.post("/solve-qcm/batch", data={"context_ids": '["doc-1"]'}, files=files)
+
+    rejected = post(3)
+    accepted = post(2)
+
+    assert rejected.status_code == 400 and "At most 2 images" in rejected.json()["detail"]
+    assert accepted.status_code == 200
+    assert [r["image_index"] for r in accepted.json()["results"]] == [0, 1]
+    assert accepted.json()["errors"] == []
+
+
+def speculative_runs(result):
+    return REGISTRY.get_sample_value("flashanswer_speculative_retrieval_total", {"result": result}) or 0.0
+
+
+def streamed_vision(early_question, question=QUESTION, error=None) -> FakeVision:
+    """Vision dont le premier champ "question" diffusé est `early_question`, les options arrivant ensuite."""
+    return FakeVision(
+        ['{"draft": {"question": %s}, ' % json.dumps(early_question),
+         '"question": %s, ' % json.dumps(question),
+         '"options": %s}' % json.dumps(OPTIONS)],
+        delay=0.05, error=error,
+    )
+
+
+@pytest.fixture
+def speculative(service, monkeypatch):
+    monkeypatch.setattr(config, "SPECULATIVE_RETRIEVAL", True)
+    service.embeddings_model = FakeEmbeddings()
+    return service
+
+
+def test_speculative_retrieval_is_reused_when_the_question_matches(speculative):
+    """Teste que la recherche lancée pendant la vision est réutilisée si la question, sans espaces, est la même."""
+    speculative.vision_llm = streamed_vision(f"  {QUESTION} ")
+    speculative.embeddings_model.delays = {f"  {QUESTION} ": 0.03}
+    used = speculative_runs("used")
+
+    events = asyncio.run(collect(speculative.stream_qcm_analysis(screenshot(), ["doc-1"])))
+
+    assert speculative.embeddings_model.calls == [[f"  {QUESTION} "]]
+    assert speculative_runs("used") == used + 1
+    timings = events[-1]["data"]["timings"]
+    assert timings["retrieval_overlap_time"] > 0
+    assert "in order" in events[-1]["data"]["retrieved_context"]
+
+
+def test_speculative_retrieval_is_cancelled_when_the_question_changes(speculative):
+    """Teste qu'une recherche partie d'une autre question est annulée et relancée sur la question validée."""
+    early = "Which protocol is the fastest one?"
+    speculative.vision_llm = streamed_vision(early)
+    speculative.embeddings_model.delays = {early: 5.0}
+    cancelled = speculative_runs("cancelled")
+
+    async def scenario():
+        events = await collect(speculative.stream_qcm_analysis(screenshot(), ["doc-1"]))
+        await asyncio.sleep(0)
+        return events, list(speculative.embeddings_model.cancelled)
+
+    events, cancelled_calls = asyncio.run(scenario())
+
+    assert speculative.embeddings_model.calls == [[early], [QUESTION]]
+    assert cancelled_calls == [early]
+    assert speculative_runs("cancelled") == cancelled + 1
+    assert events[-1]["data"]["extracted_question"] == QUESTION
+
+
+def test_speculative_retrieval_is_cancelled_when_vision_fails(speculative):
+    """Teste qu'un échec de la vision après la question annule la recherche déjà lancée."""
+    speculative.vision_llm = streamed_vision(QUESTION, error=ValueError("stream interrupted"))
+    speculative.embeddings_model.delays = {QUESTION: 5.0}
+
+    async def scenario():
+        with pytest.raises(ModelCallError):
+            await collect(speculative.stream_qcm_analysis(screenshot(), ["doc-1"]))
+        await asyncio.sleep(0)
+        return list(speculative.embeddings_model.cancelled)
+
+    assert asyncio.run(scenario()) == [QUESTION]
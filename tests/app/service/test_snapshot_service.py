@@ -0,0 +1,78 @@
+import zipfile
+
+import numpy as np
+import pytest
+
+from src.app import config
+from src.app.service import snapshot_service as snapshot_module
+from src.app.service import vector_store_service as vector_store_module
+from src.app.service.document_catalog_service import DocumentCatalogService
+from src.app.service.snapshot_service import IncompatibleSnapshotError, SnapshotError, SnapshotService
+from src.app.service.vector_store_service import VectorStoreService
+
+
+def open_store(path, monkeypatch):
+    """Ouvre un magasin Chroma et un catalogue neufs, utilisés ensuite par le service d'instantanés."""
+    path.mkdir()
+    monkeypatch.setattr(config, "CHROMA_DB_PATH", path / "chroma")
+    catalog = DocumentCatalogService()
+    catalog.initialize(path / "catalog.sqlite3")
+    monkeypatch.setattr(vector_store_module, "document_catalog_service", catalog)
+    store = VectorStoreService()
+    store.initialize()
+    monkeypatch.setattr(snapshot_module, "document_catalog_service", catalog)
+    monkeypatch.setattr(snapshot_module, "vector_store_service", store)
+    return catalog, store
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_INDEX_BACKEND", "chroma")
+    monkeypatch.setattr(config, "LEXICAL_INDEX_ENABLED", False)
+    catalog, store = open_store(tmp_path / "source", monkeypatch)
+    rng = np.random.default_rng(0)
+    for doc_id, count in (("doc-a", 3), ("doc-b", 2)):
+        catalog.begin(doc_id, f"{doc_id}.pdf", file_hash=f"hash-{doc_id}", byte_size=100)
+        ids = [f"{doc_id}-{i}" for i in range(count)]
+        store.add_documents([f"Texte {chunk_id} — éléments" for chunk_id in ids], rng.normal(size=(count, 8)).tolist(),
+                            [{"doc_id": doc_id, "source": f"{doc_id}.pdf", "page": i + 1} for i in range(count)], ids)
+        catalog.complete(doc_id, count, 1, text_hash=f"text-{doc_id}")
+    return catalog, store
+
+
+def test_snapshot_round_trip_restores_chunks_and_catalog(source, tmp_path, monkeypatch):
+    """Teste qu'un document exporté est réimporté à l'identique (textes, embeddings, métadonnées, catalogue)."""
+    path = str(tmp_path / "kb.snapshot")
+    summary = SnapshotService().export(path, ["doc-a"])
+    expected = source[1].get_document_records("doc-a")
+    assert summary["documents"] == 1 and summary["chunk_count"] == 3
+
+    catalog, store = open_store(tmp_path / "target", monkeypatch)
+    result = SnapshotService().import_snapshot(path)
+
+    assert result["documents"] == 1 and result["chunk_count"] == 3
+    records = store.get_document_records("doc-a")
+    assert records["ids"] == expected["ids"]
+    assert records["documents"] == expected["documents"]
+    assert records["metadatas"] == expected["metadatas"]
+    np.testing.assert_allclose(records["embeddings"], expected["embeddings"])
+    assert catalog.get("doc-a")["status"] == "ready" and catalog.get("doc-a")["text_hash"] == "text-doc-a"
+    assert SnapshotService().import_snapshot(path)["skipped"] == ["doc-a"]
+
+
+def test_corrupted_or_incompatible_snapshots_are_rejected(source, tmp_path, monkeypatch):
+    """Teste le refus d'un instantané altéré ou produit avec un autre modèle d'embedding."""
+    path = tmp_path / "kb.snapshot"
+    SnapshotService().export(str(path))
+
+    tampered = tmp_path / "tampered.snapshot"
+    with zipfile.ZipFile(path) as original, zipfile.ZipFile(tampered, "w") as copy:
+        for item in original.infolist():
+            data = original.read(item)
+            copy.writestr(item, data.replace(b"doc-b-1", b"doc-b-9") if item.filename == "ids.bin" else data)
+    with pytest.raises(SnapshotError, match="checksum"):
+        SnapshotService().read_manifest(str(tampered))
+
+    monkeypatch.setattr(config, "LLM_EMBEDDING_MODEL", "models/another-embedding")
+    with pytest.raises(IncompatibleSnapshotError):
+        SnapshotService().read_manifest(str(path))
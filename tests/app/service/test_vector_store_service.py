@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from src.app import config
+from src.app.service import vector_store_service as vector_store_module
+from src.app.service.document_catalog_service import DocumentCatalogService
+from src.app.service.vector_store_service import VectorStoreService, partition_name
+
+DOCUMENTS = {"doc-a": 6, "doc-b": 4, "doc-c": 5}
+
+
+@pytest.fixture
+def store_factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_INDEX_BACKEND", "chroma")
+    monkeypatch.setattr(config, "LEXICAL_INDEX_ENABLED", False)
+    monkeypatch.setattr(config, "CHROMA_DB_PATH", tmp_path / "chroma")
+    catalog = DocumentCatalogService()
+    catalog.initialize(tmp_path / "catalog.sqlite3")
+    monkeypatch.setattr(vector_store_module, "document_catalog_service", catalog)
+
+    def open_store(partitioning):
+        """Ouvre le même magasin Chroma avec la disposition demandée."""
+        monkeypatch.setattr(config, "VECTOR_STORE_PARTITIONING", partitioning)
+        store = VectorStoreService()
+        store.initialize()
+        return store
+
+    return catalog, open_store
+
+
+def fill(store, catalog):
+    rng = np.random.default_rng(0)
+    vectors = {}
+    for doc_id, count in DOCUMENTS.items():
+        catalog.begin(doc_id, f"{doc_id}.pdf", file_hash=f"hash-{doc_id}", byte_size=100)
+        ids = [f"{doc_id}-{i}" for i in range(count)]
+        embeddings = rng.normal(size=(count, 8)).tolist()
+        store.add_documents([f"Texte {chunk_id}" for chunk_id in ids], embeddings,
+                            [{"doc_id": doc_id, "page": i + 1} for i in range(count)], ids)
+        catalog.complete(doc_id, count, 1, text_hash=f"text-{doc_id}")
+        vectors.update(zip(ids, embeddings))
+    return vectors
+
+
+def test_partitioned_queries_match_the_single_collection(store_factory):
+    """Teste que la recherche dans les partitions choisies, fusionnée, renvoie les mêmes voisins qu'un filtre $in."""
+    catalog, open_store = store_factory
+    single = open_store("none")
+    vectors = fill(single, catalog)
+    query = (np.array(vectors["doc-a-2"]) + 0.1).tolist()
+    expected = {
+        doc_ids: [match["id"] for match in single.search(query, 5, list(doc_ids) or None)]
+        for doc_ids in ((), ("doc-a",), ("doc-b", "doc-c"))
+    }
+
+    partitioned = open_store("document")  # Moves the chunks into one collection per document
+
+    assert partitioned.count() == sum(DOCUMENTS.values())
+    assert sorted(partitioned.partitions) == sorted(DOCUMENTS)
+    assert [collection.name for collection in partitioned.client.list_collections()
+            if collection.name == config.VECTOR_STORE_COLLECTION] == []
+    for doc_ids, ids in expected.items():
+        assert [match["id"] for match in partitioned.search(query, 5, list(doc_ids) or None)] == ids
+    assert partitioned.get_document_records("doc-b")["ids"] == [f"doc-b-{i}" for i in range(4)]
+
+
+def test_deleting_a_document_drops_its_partition(store_factory):
+    """Teste que la suppression d'un document supprime sa collection sans toucher aux autres."""
+    catalog, open_store = store_factory
+    store = open_store("document")
+    vectors = fill(store, catalog)
+
+    assert store.delete_document("doc-a")
+
+    names = {collection.name for collection in store.client.list_collections()}
+    assert partition_name("doc-a") not in names
+    assert {partition_name("doc-b"), partition_name("doc-c")} <= names
+    assert store.count() == DOCUMENTS["doc-b"] + DOCUMENTS["doc-c"]
+    assert store.search(vectors["doc-a-0"], 3, ["doc-a"]) == []
+    assert not store.delete_document("doc-a")
+
+
+class NoMetadataScan:
+    """Collection Chroma qui refuse les lectures filtrées sur les métadonnées."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, *args, where=None, **kwargs):
+        assert where is None, "delete_document must not scan chunk metadata"
+        return self.collection.get(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+def test_deleting_a_document_removes_chunks_past_its_recorded_count(store_factory):
+    """Teste que la suppression couvre, sans parcourir les métadonnées, les chunks d'une mise à jour inachevée."""
+    catalog, open_store = store_factory
+    store = open_store("none")
+    fill(store, catalog)
+    # An update that grew doc-a to 9 chunks was interrupted: the catalog still records 6
+    catalog.begin("doc-a", "doc-a-v2.pdf", file_hash="hash-doc-a-v2")
+    ids = [f"doc-a-{i}" for i in range(6, 9)]
+    store.add_documents(["Suite"] * 3, np.ones((3, 8)).tolist(), [{"doc_id": "doc-a"}] * 3, ids)
+    assert (catalog.get("doc-a")["chunk_count"], catalog.get("doc-a")["high_water"]) == (6, 9)
+    store.collection = NoMetadataScan(store.collection)
+
+    assert store.delete_document("doc-a")
+
+    assert store.collection.get(ids=[f"doc-a-{i}" for i in range(9)])["ids"] == []
+    assert store.count() == DOCUMENTS["doc-b"] + DOCUMENTS["doc-c"]
+    assert not store.delete_document("doc-a")
@@ -0,0 +1,57 @@
+import pytest
+
+from src.app import config
+from src.app.service.worker_coordination_service import WorkerCoordinationService
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "MULTI_WORKER", True)
+    started = []
+
+    def start():
+        service = WorkerCoordinationService()
+        service.initialize(lock_path=tmp_path / "writer.lock", db_path=tmp_path / "changes.sqlite3")
+        started.append(service)
+        return service
+
+    yield start
+    for service in started:
+        service.close()
+
+
+def test_a_single_process_becomes_the_writer(workers):
+    """Teste qu'un seul processus obtient le verrou d'écriture, repris par un autre quand il s'arrête."""
+    first, second = workers(), workers()
+    assert first.is_writer and not second.is_writer
+
+    first.close()
+    assert workers().is_writer
+
+
+def test_readers_receive_the_changes_published_by_the_writer(workers):
+    """Teste que le journal des changements transmet les documents modifiés, une seule fois chacun."""
+    writer, reader = workers(), workers()
+    writer.publish("doc-1")
+    writer.publish(None)
+    # Readers never write to the log
+    reader.publish("doc-2")
+
+    assert reader.poll() == ["doc-1", None]
+    assert reader.poll() == []
+    # A process started later only sees what happens after it
+    late = workers()
+    writer.publish("doc-3")
+    assert late.poll() == ["doc-3"]
+
+
+def test_single_worker_mode_needs_no_lock(tmp_path, monkeypatch):
+    """Teste que sans mode multi-processus, le processus écrit sans verrou ni journal."""
+    monkeypatch.setattr(config, "MULTI_WORKER", False)
+    service = WorkerCoordinationService()
+    service.initialize(lock_path=tmp_path / "writer.lock", db_path=tmp_path / "changes.sqlite3")
+
+    assert service.is_writer
+    assert not (tmp_path / "writer.lock").exists()
+    service.publish("doc-1")
+    assert service.poll() == []
@@ -0,0 +1,55 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.app.api.middleware import TraceAndMetricsMiddleware
+from src.app.logger.logger_configuration import TraceIdFilter, trace_id_var
+from src.app.metrics import observe_stage
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_observe_stage_records_latency_and_errors():
+    """Teste qu'une étape est chronométrée et comptée en erreur lorsqu'elle lève une exception."""
+    before_count = sample("flashanswer_stage_seconds_count", stage="test_stage")
+    before_errors = sample("flashanswer_errors_total", stage="test_stage")
+
+    with observe_stage("test_stage"):
+        pass
+    with pytest.raises(ValueError):
+        with observe_stage("test_stage"):
+            raise ValueError("boom")
+
+    assert sample("flashanswer_stage_seconds_count", stage="test_stage") == before_count + 2
+    assert sample("flashanswer_errors_total", stage="test_stage") == before_errors + 1
+
+
+def test_requests_get_a_trace_id_that_reaches_log_records():
+    """Teste que chaque requête reçoit un identifiant repris dans ses logs et renvoyé au client."""
+    app = FastAPI()
+    app.add_middleware(TraceAndMetricsMiddleware)
+    seen = []
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: str):
+        record = logging.LogRecord("test", logging.INFO, __file__, 0, "message", None, None)
+        TraceIdFilter().filter(record)
+        seen.append(record.trace_id)
+        return {"item_id": item_id}
+
+    client = TestClient(app)
+    generated = client.get("/items/1")
+    supplied = client.get("/items/2", headers={"X-Request-ID": "abc-123"})
+    rejected = client.get("/items/3", headers={"X-Request-ID": "bad id\nwith newline"})
+
+    assert generated.headers["x-request-id"] == seen[0] != "-"
+    assert supplied.headers["x-request-id"] == seen[1] == "abc-123"
+    assert rejected.headers["x-request-id"] == seen[2] != "bad id\nwith newline"
+    assert trace_id_var.get() == "-"
+    assert sample("flashanswer_http_request_seconds_count", method="GET", route="/items/{item_id}",
+                  status="200") >= 3
@@ -0,0 +1,59 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from src.app.api import dependencies
+
+HEAVY_MODULES = ["chromadb", "langchain", "langchain_core", "langchain_google_genai", "fitz", "numpy", "PIL"]
+
+
+def test_importing_the_app_does_not_load_heavy_dependencies():
+    """Teste que l'import de l'application ne charge ni Chroma, ni LangChain, ni PyMuPDF, ni NumPy."""
+    script = (
+        "import json, sys\n"
+        "import src.app.app\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n"
+    )
+    env = {**os.environ, "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "test"), "ANONYMIZED_TELEMETRY": "False"}
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=Path(__file__).resolve().parents[2], env=env, capture_output=True, text=True, check=True,
+    ).stdout
+
+    assert json.loads(output.strip().splitlines()[-1]) == []
+
+
+def test_first_service_request_does_not_block_the_event_loop(monkeypatch):
+    """Teste que l'import du service QCM laisse tourner la boucle et que des requêtes simultanées le construisent une fois."""
+    built = []
+
+    def slow_import(name):
+        time.sleep(0.2)
+        return SimpleNamespace(QCMVisionAnalysisService=lambda: built.append(object()) or built[-1])
+
+    monkeypatch.setattr(dependencies, "_qcm_vision_service", None)
+    monkeypatch.setattr(dependencies, "importlib", SimpleNamespace(import_module=slow_import))
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticking = asyncio.create_task(ticker())
+        services = await asyncio.gather(*(dependencies.get_qcm_vision_service() for _ in range(3)))
+        ticking.cancel()
+        return services, ticks
+
+    services, ticks = asyncio.run(scenario())
+
+    assert len(built) == 1 and all(service is built[0] for service in services)
+    assert ticks >= 5
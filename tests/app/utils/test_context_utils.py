@@ -0,0 +1,88 @@
+import pytest
+
+from src.app.utils import context_utils
+from src.app.utils.context_utils import ContextCandidate, assemble_context, chunk_position, merge_overlapping
+
+
+@pytest.fixture(autouse=True)
+def offline_tokenizer(monkeypatch):
+    """Utilise l'estimation de 4 caractères par token, sans télécharger d'encodage."""
+    monkeypatch.setattr(context_utils, "_encoding", None)
+    monkeypatch.setattr(context_utils, "_encoding_loaded", True)
+
+
+def candidate(chunk_id, text, rank, distance=None):
+    return ContextCandidate(chunk_id=chunk_id, text=text, relevance=1.0 / (60 + rank), distance=distance)
+
+
+def test_chunk_position_handles_uuid_doc_ids():
+    """Teste l'extraction du document et de la position depuis un identifiant de chunk."""
+    assert chunk_position("3f2b-41aa-9c1e-12") == ("3f2b-41aa-9c1e", 12)
+    assert chunk_position("orphan") is None
+
+
+def test_weak_chunks_are_dropped():
+    """Teste que les chunks sous le seuil de similarité sont écartés."""
+    candidates = [
+        candidate("doc-0", "TCP garantit l'ordre.", 1, distance=0.2),
+        candidate("doc-5", "Recette de la tarte aux pommes.", 2, distance=1.6),
+    ]
+
+    context = assemble_context(candidates, max_chunks=5, max_tokens=500, similarity_threshold=0.5)
+
+    assert context == ["TCP garantit l'ordre."]
+
+
+def test_consecutive_chunks_are_merged_without_repeating_the_overlap():
+    """Teste la fusion de chunks adjacents d'un même document sans dupliquer le chevauchement."""
+    first = "TCP utilise des numéros de séquence. Chaque segment est acquitté."
+    second = "Chaque segment est acquitté. Les segments perdus sont retransmis."
+    candidates = [candidate("doc-4", second, 1), candidate("doc-3", first, 2)]
+
+    context = assemble_context(candidates, max_chunks=5, max_tokens=500)
+
+    assert context == [
+        "TCP utilise des numéros de séquence. Chaque segment est acquitté. Les segments perdus sont retransmis."
+    ]
+    assert merge_overlapping("abc", "xyz", 10) == "abc\nxyz"
+
+
+def test_chunks_are_merged_in_document_order_and_blocks_keep_their_rank():
+    """Teste qu'un chunk sélectionné après ses deux voisins les relie en un seul bloc, classé par son meilleur chunk."""
+    parts = ["Le routage choisit un chemin.", "Chaque routeur lit sa table.", "La table associe un préfixe.",
+             "Le préfixe le plus long gagne."]
+    candidates = [
+        candidate("doc-5", f"{parts[2]} {parts[3]}", 1),
+        candidate("other-0", "UDP n'établit pas de connexion.", 2),
+        candidate("doc-3", f"{parts[0]} {parts[1]}", 3),
+        candidate("doc-4", f"{parts[1]} {parts[2]}", 4),
+    ]
+
+    context = assemble_context(candidates, max_chunks=5, max_tokens=500, mmr_lambda=1.0)
+
+    assert context == [" ".join(parts), "UDP n'établit pas de connexion."]
+
+
+def test_near_duplicates_give_way_to_diverse_chunks():
+    """Teste que la diversité (MMR) écarte un quasi-doublon au profit d'un autre passage."""
+    text = "TCP fiable ordonné connexion acquittement retransmission fenêtre"
+    candidates = [
+        candidate("a-0", text, 1),
+        candidate("b-0", text + " glissante", 2),
+        candidate("c-0", "UDP datagramme sans connexion ni garantie", 3),
+    ]
+
+    context = assemble_context(candidates, max_chunks=2, max_tokens=500, mmr_lambda=0.5)
+
+    assert context == [text, "UDP datagramme sans connexion ni garantie"]
+
+
+def test_blocks_are_packed_into_the_token_budget():
+    """Teste que le contexte respecte le budget de tokens sans couper le meilleur passage."""
+    candidates = [candidate(f"doc{i}-0", f"passage {i} " + "x" * 390, i) for i in range(5)]
+
+    context = assemble_context(candidates, max_chunks=5, max_tokens=270, mmr_lambda=1.0)
+
+    assert context[:2] == [candidates[0].text, candidates[1].text]
+    assert len(context) == 3 and context[2].endswith("[... truncated ...]")
+    assert sum(context_utils.count_tokens(block) for block in context) <= 270 + 10
@@ -0,0 +1,71 @@
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+
+from src.app import config
+from src.app.utils.image_utils import find_content_box, preprocess_image
+
+
+@pytest.fixture
+def mock_config(monkeypatch):
+    """Fixe les paramètres de prétraitement indépendamment de config.yaml."""
+    monkeypatch.setattr(config, "IMAGE_AUTOCROP", True)
+    monkeypatch.setattr(config, "IMAGE_MAX_DIMENSION", 1024)
+    monkeypatch.setattr(config, "IMAGE_MAX_PASSTHROUGH_BYTES", 1_000_000)
+    monkeypatch.setattr(config, "IMAGE_LOSSY_QUALITY", 85)
+    monkeypatch.setattr(config, "IMAGE_OUTPUT_FORMATS", ["PNG", "WEBP", "JPEG"])
+
+
+def make_image(size, content_box=None, border="white", fmt="PNG") -> bytes:
+    image = Image.new("RGB", size, border)
+    draw = ImageDraw.Draw(image)
+    box = content_box or (0, 0, size[0], size[1])
+    draw.rectangle(box, fill=(240, 240, 240))
+    for y in range(box[1] + 10, box[3] - 10, 30):
+        draw.rectangle((box[0] + 10, y, box[2] - 40, y + 12), fill="black")
+    buffer = BytesIO()
+    image.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def test_acceptable_image_is_passed_through(mock_config):
+    """Teste qu'une image déjà correcte n'est pas ré-encodée."""
+    data = make_image((800, 600))
+    result = preprocess_image(data)
+
+    assert result.reencoded is False
+    assert result.data is data
+    assert result.mime_type == "image/png"
+
+
+def test_large_capture_is_downscaled(mock_config):
+    """Teste qu'une capture 4K est réduite à la dimension maximale configurée."""
+    result = preprocess_image(make_image((3840, 2160)))
+
+    assert result.reencoded is True
+    assert max(result.size) == 1024
+    assert result.original_size == (3840, 2160)
+
+
+def test_borders_are_cropped(mock_config):
+    """Teste que les bordures d'écran uniformes sont supprimées."""
+    data = make_image((1000, 800), content_box=(200, 150, 700, 550), border="black")
+    result = preprocess_image(data)
+
+    assert result.reencoded is True
+    assert result.size[0] < 600 and result.size[1] < 500
+
+
+def test_smallest_encoding_is_chosen(mock_config):
+    """Teste que le format le plus compact est retenu parmi les candidats."""
+    data = make_image((3000, 2000))
+    result = preprocess_image(data)
+
+    assert len(result.data) < len(data)
+    assert result.mime_type in {"image/png", "image/webp", "image/jpeg"}
+
+
+def test_content_box_of_uniform_image_is_none():
+    """Teste qu'une image uniforme n'a pas de contenu à recadrer."""
+    assert find_content_box(Image.new("RGB", (100, 100), "white")) is None
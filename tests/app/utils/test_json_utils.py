@@ -0,0 +1,21 @@
+from src.app.utils.json_utils import complete_string_field
+
+RESPONSE = '```json\n{\n  "question": "Quel protocole garantit l\'ordre \\"des octets\\" ?",\n  "options": ["TCP", "UDP"]\n}\n```'
+
+
+def test_field_is_returned_once_its_value_is_closed():
+    """Teste que la question n'est renvoyée qu'une fois sa chaîne JSON terminée, échappements compris."""
+    values = [complete_string_field(RESPONSE[:end], "question") for end in range(len(RESPONSE) + 1)]
+    first = next(end for end, value in enumerate(values) if value is not None)
+
+    assert RESPONSE[first - 1] == '"' and RESPONSE[first - 2] != "\\"
+    assert values[first] == 'Quel protocole garantit l\'ordre "des octets" ?'
+    assert all(value == values[first] for value in values[first:])
+
+
+def test_missing_or_unfinished_fields_return_none():
+    """Teste qu'un champ absent, incomplet ou d'un autre type ne renvoie rien."""
+    assert complete_string_field('{"options": ["TCP"', "question") is None
+    assert complete_string_field('{"question": "Quel proto', "question") is None
+    assert complete_string_field('{"question": "fin\\', "question") is None
+    assert complete_string_field('{"question": 12}', "question") is None